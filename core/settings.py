@@ -20,6 +20,117 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Reconocimiento facial (modelo SFace de OpenCV, se descarga aparte a la carpeta modelos/).
+MODELO_RECONOCIMIENTO_ROSTROS = os.path.join(BASE_DIR, 'modelos', 'face_recognition_sface_2021dec.onnx')
+UMBRAL_SIMILITUD_ROSTROS = 0.363   # similitud coseno mínima para sugerir un familiar
+INDICE_ROSTROS_REFRESCO = 60       # segundos entre lecturas de los rostros que cambiaron otros procesos
+INDICE_ROSTROS_RECONSTRUCCION = 15 * 60   # cada cuánto se rearma entero (quita los borrados en otro proceso)
+
+# Detector de rostros. Si se cambia, las detecciones guardadas se recalculan.
+# lado_busqueda: las fotos más grandes se analizan primero reducidas a este lado (px) y cada
+# candidata se refina a resolución completa. mosaico > 0 parte esa versión en cuadrados de ese lado.
+DETECTOR_ROSTROS = {'nombre': 'haar', 'escala': 1.1, 'vecinos': 4, 'lado_busqueda': 1600, 'margen': 0.5, 'mosaico': 0}
+# nombre: 'haar', 'ssd' o 'yunet' (ver gestion_recuerdos/detectores.py). Compararlos con:
+#   python manage.py comparar_detectores <carpeta con fotos y etiquetas.json>
+MODELOS_DETECTOR = {
+    'ssd': [
+        os.path.join(BASE_DIR, 'modelos', 'deploy.prototxt'),
+        os.path.join(BASE_DIR, 'modelos', 'res10_300x300_ssd_iter_140000.caffemodel'),
+    ],
+    'yunet': os.path.join(BASE_DIR, 'modelos', 'face_detection_yunet_2023mar.onnx'),
+}
+DETECTOR_PROCESOS = 0   # procesos para analizar los mosaicos en paralelo (0 = en el mismo proceso)
+
+# Dos fotos cuyas huellas perceptuales difieren en estos bits o menos se tratan como copias.
+HUELLA_RADIO_DUPLICADOS = 6
+
+# Cada cuántos segundos se rearma el árbol genealógico en memoria (para ver lo que guardaron otros procesos).
+ARBOL_REFRESCO = 60
+
+# Dos familiares con un puntaje de parecido (nombre, fecha de nacimiento, rostros) igual o mayor
+# a este van a la cola de posibles duplicados para que alguien los revise.
+FAMILIARES_UMBRAL_DUPLICADO = 0.8
+
+# Agrupamiento de rostros sin identificar: una cara entra a un grupo si su similitud coseno con
+# el centro del grupo es al menos esta (más exigente que UMBRAL_SIMILITUD_ROSTROS, para no mezclar personas).
+AGRUPAR_ROSTROS_SIMILITUD = 0.5
+
+# Recortes temporales de cada análisis (media/temp_caras/<id>/): se borran pasado este tiempo.
+TEMP_CARAS_TTL = 6 * 3600                 # segundos
+TEMP_CARAS_INTERVALO_LIMPIEZA = 10 * 60   # cada cuánto revisa cada proceso
+
+# Cliente async de Drive: llamadas simultáneas por petición y reintentos ante 429/5xx.
+DRIVE_ASYNC_CONCURRENCIA = 8
+DRIVE_REINTENTOS = 5
+
+# Credenciales de Google compartidas por proceso (gestion_recuerdos/credenciales.py): el access token
+# se refresca CREDENCIALES_MARGEN_SEGUNDOS antes de vencer, una sola vez por cuenta, y se publica en la
+# caché CREDENCIALES_CACHE. Con la caché por defecto (memoria local) cada proceso lo refresca por su
+# cuenta; con una compartida en CACHES (Redis, Memcached) lo refresca uno y los demás lo toman de ahí.
+CREDENCIALES_MARGEN_SEGUNDOS = 300
+CREDENCIALES_CACHE = 'default'
+
+# Drive de mentira en memoria (gestion_recuerdos/drive_falso.py), para medir sin cuenta de Google:
+# DRIVE_FALSO=1 (árbol generado) o DRIVE_FALSO=arbol.json (árbol, latencia, 429, imágenes de ejemplo).
+# El comando prueba_carga lo activa solo.
+DRIVE_FALSO = os.environ.get('DRIVE_FALSO') or None
+
+# Caché en disco de las fotos originales descargadas de Drive (LRU por tamaño).
+CACHE_DRIVE_CARPETA = os.path.join(MEDIA_ROOT, 'cache_drive')
+CACHE_DRIVE_MAX_BYTES = 2 * 1024 ** 3   # 2 GB
+
+# Almacenamiento de los recortes permanentes y sus miniaturas (ver gestion_recuerdos/almacenamiento.py).
+# Por defecto el disco (MEDIA_ROOT). Con RECORTES_S3_BUCKET definido se usa un bucket S3 o compatible
+# (MinIO: RECORTES_S3_ENDPOINT=http://localhost:9000) que pueden compartir varios servidores.
+# Requiere: pip install django-storages boto3
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'recortes': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+}
+if os.environ.get('RECORTES_S3_BUCKET'):
+    STORAGES['recortes'] = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.environ['RECORTES_S3_BUCKET'],
+            'endpoint_url': os.environ.get('RECORTES_S3_ENDPOINT') or None,
+            'access_key': os.environ.get('RECORTES_S3_ACCESS_KEY'),
+            'secret_key': os.environ.get('RECORTES_S3_SECRET_KEY'),
+            'region_name': os.environ.get('RECORTES_S3_REGION') or None,
+            'file_overwrite': False,
+            # Los nombres son el sha256 del contenido: nunca cambian, el navegador puede guardarlos para siempre.
+            'object_parameters': {'CacheControl': 'max-age=31536000, immutable'},
+        },
+    }
+
+# Los workers web (no manage.py ni los comandos) cargan OpenCV, el detector, el modelo de reconocimiento
+# y el índice de rostros al arrancar, en vez de hacerlo en la primera petición. Medirlo con:
+#   python manage.py medir_arranque
+PRECALENTAR_WORKERS = True
+# Cuántos hilos atienden peticiones en cada worker (gunicorn --threads): se deja listo un detector y un
+# reconocedor para cada uno, porque no se pueden compartir entre hilos.
+PRECALENTAR_HILOS = int(os.environ.get('WEB_HILOS', 1))
+
+# Perfil de cProfile por petición (uno a la vez por proceso), guardado en PERFIL_CARPETA como .prof
+# (abrirlo con snakeviz o python -m pstats). Sólo se guardan las que tardan PERFIL_MINIMO_SEGUNDOS o más.
+PERFIL_PETICIONES = False
+PERFIL_CARPETA = os.path.join(BASE_DIR, 'perfiles')
+PERFIL_MINIMO_SEGUNDOS = 0.5
+
+# Quién puede leer /metricas/ (Prometheus) y /cache/estadisticas/: usuarios staff con sesión iniciada,
+# las peticiones con la cabecera "Authorization: Bearer <METRICAS_TOKEN>" y las que vienen de las IPs de METRICAS_IPS.
+# Ojo con METRICAS_IPS detrás de un proxy: todas las peticiones llegan desde la IP del proxy.
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN') or None
+METRICAS_IPS = []
+
+# Token para etiquetar rostros desde herramientas por /api/rostros/ (cabecera "Authorization: Bearer <token>").
+# Sin token, la API sólo acepta peticiones con la sesión iniciada (y el token CSRF).
+ROSTROS_API_TOKEN = os.environ.get('ROSTROS_API_TOKEN') or None
+
+# Galería: lado máximo de las miniaturas y cantidad de rostros por página
+MINIATURA_LADO = 160
+GALERIA_POR_PAGINA = 60
+
 
 
 
@@ -49,10 +160,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero: así mide también lo que tardan los demás middlewares (ver gestion_recuerdos/metricas.py).
+    'gestion_recuerdos.metricas.MedicionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    # Después de la sesión: guarda en ella el token de Google si se refrescó (gestion_recuerdos/credenciales.py).
+    'gestion_recuerdos.credenciales.CredencialesMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
+    # El CSRF de Django, salvo para /api/rostros/ con ROSTROS_API_TOKEN (gestion_recuerdos/acceso.py).
+    'gestion_recuerdos.acceso.CsrfTokenApiMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -23,13 +23,33 @@ from gestion_recuerdos.views import (
     login_google, 
     google_callback, 
     listar_fotos, 
-    analizar_rostros_drive, 
+    analizar_rostros_drive,
+    analizar_en_vivo,
+    eventos_analisis,
     detectar_rostro_prueba,
     configurar_entorno_drive,
     guardar_rostro,
+    api_guardar_rostros,
     home,
     galeria_familiar,
     eliminar_rostro,
+    progreso_trabajo,
+    sincronizar_drive,
+    estadisticas_cache,
+    metricas_prometheus,
+    ver_trabajo,
+    lista_arbol,
+    ver_arbol,
+    datos_arbol,
+    descargar_gedcom,
+    lista_duplicados,
+    resolver_duplicado,
+    buscar,
+    api_buscar_familiares,
+    grupos_rostros,
+    asignar_grupo_rostros,
+    linea_de_tiempo,
+    rostros_por_decada,
 )
 
 urlpatterns = [
@@ -37,13 +57,33 @@ urlpatterns = [
     path('login-google/', login_google, name='login_google'),
     path('google/callback/', google_callback, name='google_callback'),
     path('ver-fotos/', listar_fotos, name='ver_fotos'),
+    path('ver-fotos/sincronizar/', sincronizar_drive, name='sincronizar_drive'),
     path('organizar-drive/', configurar_entorno_drive, name='organizar_drive'),
     path('analizar/<str:file_id>/', analizar_rostros_drive, name='analizar_rostros'),
+    path('analizar/<str:file_id>/en-vivo/', analizar_en_vivo, name='analizar_en_vivo'),
+    path('analizar/<str:file_id>/eventos/<str:analisis_id>/', eventos_analisis, name='eventos_analisis'),
     path('probar-ia/', detectar_rostro_prueba, name='probar_ia'),
     path('guardar-rostro/', guardar_rostro, name='guardar_rostro'),
+    path('api/rostros/', api_guardar_rostros, name='api_guardar_rostros'),
     path('home', home, name='home'),
     path('galeria/', galeria_familiar, name='galeria'),
     path('eliminar-rostro/<int:rostro_id>/', eliminar_rostro, name='eliminar_rostro'),
+    path('trabajos/<int:trabajo_id>/', ver_trabajo, name='ver_trabajo'),
+    path('trabajos/<int:trabajo_id>/progreso/', progreso_trabajo, name='progreso_trabajo'),
+    path('cache/estadisticas/', estadisticas_cache, name='estadisticas_cache'),
+    path('metricas/', metricas_prometheus, name='metricas'),
+    path('arbol/', lista_arbol, name='lista_arbol'),
+    path('arbol/<int:familiar_id>/', ver_arbol, name='ver_arbol'),
+    path('arbol/<int:familiar_id>/datos/', datos_arbol, name='datos_arbol'),
+    path('arbol/gedcom/', descargar_gedcom, name='descargar_gedcom'),
+    path('arbol/duplicados/', lista_duplicados, name='lista_duplicados'),
+    path('arbol/duplicados/<int:duplicado_id>/', resolver_duplicado, name='resolver_duplicado'),
+    path('buscar/', buscar, name='buscar'),
+    path('api/familiares/buscar/', api_buscar_familiares, name='api_buscar_familiares'),
+    path('rostros/grupos/', grupos_rostros, name='grupos_rostros'),
+    path('rostros/grupos/<int:grupo_id>/asignar/', asignar_grupo_rostros, name='asignar_grupo_rostros'),
+    path('fotos/linea-de-tiempo/', linea_de_tiempo, name='linea_de_tiempo'),
+    path('arbol/<int:familiar_id>/decadas/', rostros_por_decada, name='rostros_por_decada'),
 ]
 
 if settings.DEBUG:
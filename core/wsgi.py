@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Este proceso atiende peticiones: la app precalienta OpenCV y los modelos (PRECALENTAR_WORKERS).
+os.environ.setdefault('GESTION_RECUERDOS_WEB', '1')
 
 application = get_wsgi_application()
@@ -0,0 +1,36 @@
+import hmac
+
+from django.conf import settings
+from django.middleware.csrf import CsrfViewMiddleware
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Quién puede escribir rostros (guardar_rostro y la API JSON /api/rostros/).
+# - Desde el navegador: con la sesión iniciada (credenciales de Google o usuario de Django)
+#   y el token CSRF en el formulario o en la cabecera X-CSRFToken, como cualquier POST.
+# - Desde herramientas: con la cabecera "Authorization: Bearer <ROSTROS_API_TOKEN>".
+#   Esas peticiones no usan cookies, así que no hay nada que un sitio ajeno pueda falsificar:
+#   CsrfTokenApiMiddleware las deja pasar sin el token CSRF. Las demás se controlan igual que antes.
+
+
+def token_api_valido(request):
+    """True si la petición trae "Authorization: Bearer <ROSTROS_API_TOKEN>" (comparado en tiempo constante)."""
+    token = getattr(settings, 'ROSTROS_API_TOKEN', None)
+    cabecera = request.headers.get('Authorization', '')
+    return bool(token) and cabecera.startswith('Bearer ') and hmac.compare_digest(cabecera[7:].encode(), token.encode())
+
+
+def sesion_iniciada(request):
+    """True si quien pide entró con Google (credenciales en la sesión) o es un usuario de Django activo."""
+    if request.session.get('credentials'):
+        return True
+    usuario = getattr(request, 'user', None)
+    return usuario is not None and usuario.is_authenticated and usuario.is_active
+
+
+class CsrfTokenApiMiddleware(CsrfViewMiddleware):
+    """El CsrfViewMiddleware de Django, salvo para las peticiones autenticadas con ROSTROS_API_TOKEN."""
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if token_api_valido(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
@@ -1,8 +1,15 @@
 from django.contrib import admin
 from .models import Familiar
-from .models import Familiar, RostroDetectado
+from .models import Familiar, RostroDetectado, TrabajoLote, FotoTrabajo, DriveArchivo, EstadoSincronizacion, Relacion, PosibleDuplicado, GrupoRostros
 
 # Register your models here.
 
 admin.site.register(Familiar)
 admin.site.register(RostroDetectado)
+admin.site.register(TrabajoLote)
+admin.site.register(FotoTrabajo)
+admin.site.register(DriveArchivo)
+admin.site.register(EstadoSincronizacion)
+admin.site.register(Relacion)
+admin.site.register(PosibleDuplicado)
+admin.site.register(GrupoRostros)
@@ -0,0 +1,201 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .indice_rostros import indice_si_cargado, obtener_indice
+from .models import GrupoRostros, RostroDetectado
+from .reconocimiento import bytes_a_embedding, embedding_a_bytes
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Agrupa los rostros sin familiar en "probablemente la misma persona" para etiquetarlos
+# de a grupos en vez de uno por uno (ver vista grupos_rostros).
+# 1. Cada cara nueva entra al grupo cuyo centro (promedio de embeddings) es el más parecido,
+#    si supera AGRUPAR_ROSTROS_SIMILITUD; si no, abre un grupo nuevo. Las caras se comparan
+#    de a LOTE contra todos los centros con UNA multiplicación de matrices.
+# 2. Después se unen los grupos cuyos centros quedaron parecidos entre sí.
+# Como los grupos guardan la suma de sus embeddings, las caras que lleguen mañana se agregan
+# a los grupos existentes sin volver a agrupar todo (incremental).
+
+LOTE = 1024
+DIMENSION = 128
+
+
+def _centros(sumas):
+    normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+    return sumas / np.maximum(normas, 1e-12)
+
+
+def asignar_a_grupos(embeddings, sumas, similitud):
+    """
+    embeddings: N x D normalizados. sumas: K x D (suma de cada grupo existente, puede ser K = 0).
+    Devuelve (grupo de cada cara como índice de fila, sumas con los grupos nuevos agregados al final).
+    """
+    sumas = np.array(sumas, dtype=np.float32).reshape(-1, embeddings.shape[1])
+    grupos = np.empty(len(embeddings), dtype=np.int64)
+    for inicio in range(0, len(embeddings), LOTE):
+        bloque = embeddings[inicio:inicio + LOTE]
+        entran = np.zeros(len(bloque), dtype=bool)
+        if len(sumas):
+            parecidos = bloque @ _centros(sumas).T
+            mejor = parecidos.argmax(axis=1)
+            entran = parecidos[np.arange(len(bloque)), mejor] >= similitud
+            grupos[inicio:inicio + len(bloque)][entran] = mejor[entran]
+            np.add.at(sumas, mejor[entran], bloque[entran])
+
+        # Las que no entraron a ningún grupo se comparan entre ellas (son pocas: a lo sumo LOTE).
+        nuevas_sumas = np.zeros((int((~entran).sum()), embeddings.shape[1]), dtype=np.float32)
+        nuevos_centros = np.zeros_like(nuevas_sumas)
+        abiertos = 0
+        for fila in np.flatnonzero(~entran):
+            vector = bloque[fila]
+            elegido = None
+            if abiertos:
+                parecidos = nuevos_centros[:abiertos] @ vector
+                candidato = int(parecidos.argmax())
+                if parecidos[candidato] >= similitud:
+                    elegido = candidato
+            if elegido is None:
+                elegido = abiertos
+                abiertos += 1
+            nuevas_sumas[elegido] += vector
+            nuevos_centros[elegido] = nuevas_sumas[elegido] / max(np.linalg.norm(nuevas_sumas[elegido]), 1e-12)
+            grupos[inicio + fila] = len(sumas) + elegido
+        sumas = np.vstack([sumas, nuevas_sumas[:abiertos]])
+    return grupos, sumas
+
+
+def unir_grupos_cercanos(sumas, similitud):
+    """
+    Grupos cuyos centros se parecen al menos 'similitud' pasan a ser uno (unión-búsqueda).
+    La matriz de similitudes se calcula por bloques de filas para no ocupar K x K de memoria.
+    Devuelve, para cada grupo, el índice del grupo con el que queda (su representante).
+    """
+    padre = np.arange(len(sumas))
+
+    def raiz(i):
+        while padre[i] != i:
+            padre[i] = padre[padre[i]]
+            i = padre[i]
+        return i
+
+    centros = _centros(sumas)
+    for inicio in range(0, len(centros), LOTE):
+        parecidos = centros[inicio:inicio + LOTE] @ centros.T
+        filas, columnas = np.nonzero(parecidos >= similitud)
+        for fila, columna in zip((filas + inicio).tolist(), columnas.tolist()):
+            if columna <= fila:
+                continue
+            a, b = raiz(fila), raiz(columna)
+            if a != b:
+                padre[max(a, b)] = min(a, b)
+    return np.array([raiz(i) for i in range(len(sumas))], dtype=np.int64)
+
+
+#---------------------------------------------------------------------------------
+def _leer_embeddings(filas):
+    ids, vectores = [], []
+    for rostro_id, datos in filas:
+        vector = bytes_a_embedding(datos)
+        if vector is not None and len(vector) == DIMENSION:
+            ids.append(rostro_id)
+            vectores.append(vector)
+    return ids, np.array(vectores, dtype=np.float32).reshape(-1, DIMENSION)
+
+
+def agrupar_rostros(desde_cero=False, similitud=None):
+    """
+    Línea por línea:
+    1. Trae los grupos existentes (su suma y tamaño) y las caras sin familiar ni grupo.
+    2. Reparte las caras nuevas entre los grupos (o abre grupos) y une los grupos que quedaron cerca.
+    3. Guarda todo en una transacción: grupos nuevos con bulk_create, caras con bulk_update,
+       y a cada grupo tocado le pide al índice de rostros identificados una sugerencia de familiar.
+    Devuelve un dict con los contadores.
+    """
+    if similitud is None:
+        similitud = getattr(settings, 'AGRUPAR_ROSTROS_SIMILITUD', 0.5)
+    if desde_cero:
+        GrupoRostros.objects.all().delete()     # las caras quedan con grupo = NULL (SET_NULL)
+
+    existentes = list(GrupoRostros.objects.values_list('id', 'suma', 'tamano'))
+    sumas = np.array([np.frombuffer(suma, dtype=np.float32) for _, suma, _ in existentes], dtype=np.float32)
+    tamanos = [tamano for _, _, tamano in existentes]
+    caras, embeddings = _leer_embeddings(
+        RostroDetectado.objects.filter(familiar__isnull=True, grupo__isnull=True, embedding__isnull=False)
+        .values_list('id', 'embedding').iterator(chunk_size=2000)
+    )
+    if not caras:
+        return {'caras': 0, 'grupos_nuevos': 0, 'grupos_unidos': 0, 'grupos': len(existentes)}
+
+    grupos, sumas = asignar_a_grupos(embeddings, sumas, similitud)
+    tamanos += [0] * (len(sumas) - len(tamanos))
+    for grupo in grupos.tolist():
+        tamanos[grupo] += 1
+    representante = unir_grupos_cercanos(sumas, similitud)
+
+    # Suma y tamaño finales de cada representante.
+    finales = {}
+    for fila, destino in enumerate(representante.tolist()):
+        suma, tamano = finales.get(destino, (np.zeros(DIMENSION, dtype=np.float32), 0))
+        finales[destino] = (suma + sumas[fila], tamano + tamanos[fila])
+
+    indice = obtener_indice()
+    with transaction.atomic():
+        # Filas 0..len(existentes)-1 ya tienen id; las demás son grupos nuevos.
+        ids = {fila: existentes[fila][0] for fila in range(len(existentes))}
+        nuevos = [fila for fila in finales if fila >= len(existentes)]
+        creados = GrupoRostros.objects.bulk_create([GrupoRostros(suma=b'', tamano=0) for _ in nuevos])
+        ids.update({fila: grupo.id for fila, grupo in zip(nuevos, creados)})
+
+        # Grupos existentes que se unieron a otro: sus caras se mudan y el grupo se borra.
+        absorbidos = [fila for fila in range(len(existentes)) if representante[fila] != fila]
+        for fila in absorbidos:
+            RostroDetectado.objects.filter(grupo_id=ids[fila]).update(grupo_id=ids[int(representante[fila])])
+        GrupoRostros.objects.filter(id__in=[ids[fila] for fila in absorbidos]).delete()
+
+        RostroDetectado.objects.bulk_update(
+            [RostroDetectado(id=cara, grupo_id=ids[int(representante[grupo])]) for cara, grupo in zip(caras, grupos.tolist())],
+            ['grupo'], batch_size=1000,
+        )
+        # Sólo los grupos que cambiaron: los que recibieron caras o absorbieron a otro.
+        tocados = {int(representante[grupo]) for grupo in set(grupos.tolist())}
+        tocados.update(int(representante[fila]) for fila in absorbidos)
+        actualizados = []
+        for fila in tocados:
+            suma, tamano = finales[fila]
+            centro = suma / max(np.linalg.norm(suma), 1e-12)
+            sugerencias = indice.sugerir(centro.astype(np.float32), k=5)
+            actualizados.append(GrupoRostros(
+                id=ids[fila], suma=embedding_a_bytes(suma.astype(np.float32)), tamano=tamano,
+                sugerido_id=sugerencias[0][0] if sugerencias else None,
+            ))
+        GrupoRostros.objects.bulk_update(actualizados, ['suma', 'tamano', 'sugerido'], batch_size=500)
+
+    return {
+        'caras': len(caras), 'grupos_nuevos': len(nuevos),
+        'grupos_unidos': len(absorbidos), 'grupos': len(finales),
+    }
+
+
+def asignar_grupo(grupo, familiar, excluir=()):
+    """
+    Todas las caras sin familiar del grupo pasan a 'familiar' con UN update, salvo las de 'excluir',
+    que salen del grupo (se volverán a agrupar). Devuelve cuántas caras se asignaron.
+    """
+    with transaction.atomic():
+        grupo = GrupoRostros.objects.select_for_update().get(id=grupo.id)
+        pendientes = RostroDetectado.objects.filter(grupo=grupo, familiar__isnull=True).exclude(id__in=list(excluir))
+        asignar = list(pendientes.values_list('id', flat=True))
+        pendientes.update(familiar=familiar, grupo=None, fecha_modificacion=timezone.now())
+        RostroDetectado.objects.filter(grupo=grupo).update(grupo=None)
+        grupo.delete()
+
+        def al_confirmar():
+            # update() no dispara señales: el índice de rostros identificados se pone al día a mano.
+            indice = indice_si_cargado()
+            if indice is not None:
+                for rostro in RostroDetectado.objects.filter(id__in=asignar).only('id', 'familiar_id', 'embedding'):
+                    indice.actualizar(rostro)
+
+        transaction.on_commit(al_confirmar)
+    return len(asignar)
@@ -0,0 +1,106 @@
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Dónde se guardan los recortes permanentes y sus miniaturas: el almacenamiento 'recortes'
+# de settings.STORAGES (el disco en MEDIA_ROOT, o un bucket S3 / MinIO que comparten todos
+# los servidores). Nada acá usa os.path: todo pasa por la API de Storage de Django.
+# - Cada archivo se nombra por el sha256 de su contenido (carpeta/ab/abcdef....jpg): el mismo
+#   recorte guardado dos veces (la misma foto en dos lotes) ocupa un solo archivo.
+# - Como varios rostros pueden apuntar al mismo archivo, al borrar un rostro su archivo sólo
+#   se borra si ya ningún otro lo usa (las referencias se cuentan en la tabla de rostros).
+# - Contar y borrar no es atómico: mientras se borra, otro proceso puede ver el archivo, no subirlo
+#   y guardar una fila que lo usa. Por eso quien borra vuelve a contar después de borrar y lo repone
+#   si ya está en uso, y quien guarda filas revisa al confirmar que sus archivos sigan ahí
+#   (asegurar_al_confirmar). Entre los dos, el archivo de una fila guardada nunca queda borrado.
+
+CARPETA_PERMANENTE = 'rostros_permanentes'
+
+
+def almacen_recortes():
+    """El Storage de los recortes (también es el 'storage' de los ImageField de RostroDetectado)."""
+    return storages['recortes']
+
+
+def nombre_por_contenido(datos, carpeta, extension):
+    resumen = hashlib.sha256(datos).hexdigest()
+    return f"{carpeta}/{resumen[:2]}/{resumen}{extension}"
+
+
+def guardar_contenido(datos, carpeta, extension):
+    """
+    Guarda los bytes con su nombre por contenido y devuelve ese nombre (relativo al almacenamiento).
+    Si ya existe un archivo con ese nombre tiene exactamente el mismo contenido: no se vuelve a subir.
+    """
+    nombre = nombre_por_contenido(datos, carpeta, extension)
+    _subir_si_falta(almacen_recortes(), nombre, datos)
+    return nombre
+
+
+def _subir_si_falta(almacen, nombre, datos):
+    if not almacen.exists(nombre):
+        guardado = almacen.save(nombre, ContentFile(datos))
+        if guardado != nombre:
+            # Otro proceso subió el mismo contenido justo ahora y el Storage le cambió el nombre a la copia.
+            almacen.delete(guardado)
+
+
+def leer_contenido(nombre):
+    with almacen_recortes().open(nombre, 'rb') as archivo:
+        return archivo.read()
+
+
+def _en_uso(nombres):
+    from .models import RostroDetectado
+
+    en_uso = set()
+    for campo in ('foto_recorte', 'miniatura'):
+        en_uso.update(RostroDetectado.objects.filter(**{f"{campo}__in": nombres}).values_list(campo, flat=True))
+    return en_uso
+
+
+def liberar_archivos(nombres):
+    """
+    Borra del almacenamiento los archivos que ya no usa ningún rostro (recorte o miniatura).
+    Se hace al confirmar la transacción en curso, cuando las filas borradas ya no cuentan.
+    Línea por línea:
+    1. Cuenta quién usa cada archivo; los que nadie usa se leen (para poder reponerlos) y se borran.
+    2. Vuelve a contar: si otro proceso guardó una fila que los usa mientras tanto, se suben de nuevo.
+    """
+    nombres = {nombre for nombre in nombres if nombre}
+    if not nombres:
+        return
+
+    def borrar():
+        almacen = almacen_recortes()
+        borrados = {}
+        for nombre in nombres - _en_uso(nombres):
+            try:
+                borrados[nombre] = leer_contenido(nombre)
+            except FileNotFoundError:
+                continue
+            almacen.delete(nombre)
+        if not borrados:
+            return
+        for nombre in _en_uso(set(borrados)):
+            _subir_si_falta(almacen, nombre, borrados[nombre])
+
+    transaction.on_commit(borrar)
+
+
+def asegurar_al_confirmar(archivos):
+    """
+    archivos: [(nombre, funcion que lo vuelve a subir), ...] de las filas que guarda la transacción en curso.
+    Al confirmarla, vuelve a subir los que ya no estén: un liberar_archivos de otro proceso pudo borrarlos
+    entre que se vio que existían y que se guardó la fila (y ese proceso ya no la vio al volver a contar).
+    """
+    def revisar():
+        almacen = almacen_recortes()
+        for nombre, subir in archivos:
+            if nombre and not almacen.exists(nombre):
+                subir()
+
+    transaction.on_commit(revisar)
@@ -0,0 +1,314 @@
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .detectores import DETECTORES, a_color, a_gris, crear_detector
+from .metricas import etapa, metricas
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Este módulo reúne la lógica de detección de rostros que antes vivía
+# dentro de analizar_rostros_drive, para que la vista y el análisis por lotes
+# (comando analizar_lote) usen exactamente el mismo código.
+# Las fotos grandes (escaneos de 6000x4000) no se recorren enteras: primero se buscan
+# caras en una versión reducida y después sólo se mira a resolución completa
+# la zona de cada candidata. El detector en sí (Haar, SSD, YuNet) está en detectores.py.
+
+PARAMETROS_COMUNES = {'lado_busqueda': 1600, 'margen': 0.5, 'mosaico': 0}
+
+
+def decodificar_imagen(datos):
+    """Convierte los bytes descargados en una imagen BGR de OpenCV (o None si no es imagen)."""
+    img_array = np.frombuffer(datos, np.uint8)
+    return cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+
+
+def configuracion_detector():
+    """
+    Nombre y parámetros del detector (settings.DETECTOR_ROSTROS).
+    Se guardan junto a cada detección: si cambian, las detecciones viejas dejan de valer.
+    """
+    config = dict(getattr(settings, 'DETECTOR_ROSTROS', {}))
+    nombre = config.pop('nombre', 'haar')
+    if nombre not in DETECTORES:
+        raise ValueError(f"Detector desconocido: {nombre} (opciones: {', '.join(DETECTORES)})")
+    parametros = dict(PARAMETROS_COMUNES, **DETECTORES[nombre].por_defecto)
+    parametros.update(config)
+    return nombre, parametros
+
+
+def modelo_detector(nombre):
+    """Ruta (o rutas) de los archivos del modelo según settings.MODELOS_DETECTOR."""
+    return getattr(settings, 'MODELOS_DETECTOR', {}).get(nombre)
+
+
+_local = threading.local()
+_listos = {}                      # clave -> detectores armados al arrancar que todavía no tomó ningún hilo
+_lock_listos = threading.Lock()
+
+
+def _clave_detector(nombre, parametros, modelo):
+    return (nombre, json.dumps(parametros, sort_keys=True), json.dumps(modelo))
+
+
+def _detector_cacheado(nombre, parametros, modelo):
+    """
+    Cada detector se carga una sola vez por hilo y se reutiliza en todas las peticiones
+    (ni detectMultiScale ni las redes de cv2.dnn son seguras con dos hilos a la vez).
+    La primera vez, el hilo se queda con uno de los que armó precalentar_detectores, si queda alguno.
+    """
+    if not hasattr(_local, 'detectores'):
+        _local.detectores = {}
+    clave = _clave_detector(nombre, parametros, modelo)
+    if clave not in _local.detectores:
+        with _lock_listos:
+            listos = _listos.get(clave)
+            detector = listos.pop() if listos else None
+        _local.detectores[clave] = detector or crear_detector(nombre, parametros, modelo)
+    return _local.detectores[clave]
+
+
+def precalentar_detectores(cantidad):
+    """
+    Arma 'cantidad' detectores configurados para los hilos que van a atender peticiones: cada hilo
+    toma uno (pasa a ser sólo suyo) en su primera petición en vez de armarlo ahí. Se llama al arrancar
+    el worker, desde un hilo que no atiende peticiones: por eso no sirve guardarlos en su _local.
+    """
+    nombre, parametros = configuracion_detector()
+    modelo = modelo_detector(nombre)
+    detectores = [crear_detector(nombre, parametros, modelo) for _ in range(cantidad)]
+    with _lock_listos:
+        _listos.setdefault(_clave_detector(nombre, parametros, modelo), []).extend(detectores)
+
+
+def obtener_detector(nombre=None, parametros=None):
+    """El detector configurado en settings (o el pedido, por ejemplo desde el benchmark)."""
+    if nombre is None:
+        nombre, parametros = configuracion_detector()
+    elif parametros is None:
+        parametros = dict(PARAMETROS_COMUNES, **DETECTORES[nombre].por_defecto)
+    return _detector_cacheado(nombre, parametros, modelo_detector(nombre))
+
+
+def detectar_rostros(img, detector=None):
+    """
+    Devuelve la lista de cajas (x, y, w, h) de los rostros encontrados en img.
+    Si no se pasa un detector se usa el configurado (uno por hilo).
+    """
+    detector = detector or obtener_detector()
+    imagen = a_color(img) if detector.color else a_gris(img)
+    reducida, escala = _reducir(imagen, detector.parametros['lado_busqueda'])
+    return _detectar_piramide(reducida, escala, lambda: imagen, detector)
+
+
+def detectar_en_archivo(leer, detector=None):
+    """
+    Como detectar_rostros, pero decodifica la foto lo menos posible.
+    leer(flags) debe devolver la imagen decodificada con esos flags de cv2.imread.
+    Línea por línea:
+    1. Decodifica a 1/8 (con JPEG es casi gratis) sólo para conocer el tamaño.
+    2. Decodifica al nivel IMREAD_REDUCED_* más cercano a 'lado_busqueda' y busca ahí.
+    3. Sólo si hubo candidatas decodifica la foto completa en color y refina cada una.
+    Devuelve (cajas en coordenadas de la foto original, foto completa o None si no hubo caras).
+    Las lecturas se miden como etapa 'decodificacion'; 'deteccion' es el total (las incluye).
+    """
+    with etapa('deteccion'):
+        cajas, completa = _detectar_en_archivo(_medir_lecturas(leer), detector)
+    metricas.sumar('gr_rostros_detectados_total', len(cajas))
+    return cajas, completa
+
+
+def _medir_lecturas(leer):
+    def leer_medido(flags):
+        with etapa('decodificacion'):
+            return leer(flags)
+    return leer_medido
+
+
+def _detectar_en_archivo(leer, detector):
+    detector = detector or obtener_detector()
+    lado_busqueda = detector.parametros['lado_busqueda']
+
+    chica = leer(cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if chica is None:
+        raise ValueError("El archivo no se pudo decodificar como imagen")
+    factor = _factor_reduccion(max(chica.shape[:2]) * 8, lado_busqueda)
+    if factor == 8 and not detector.color:
+        imagen = chica
+    else:
+        imagen = leer(_FLAGS_REDUCIDOS[detector.color][factor])
+    reducida, escala = _reducir(imagen, lado_busqueda)
+    del chica, imagen
+
+    completa = {}
+
+    def imagen_completa():
+        completa['color'] = leer(cv2.IMREAD_COLOR)
+        return completa['color'] if detector.color else a_gris(completa['color'])
+
+    cajas = _detectar_piramide(reducida, escala * factor, imagen_completa, detector)
+    if not cajas:
+        return [], None
+    if 'color' not in completa:
+        completa['color'] = leer(cv2.IMREAD_COLOR)
+    return cajas, completa['color']
+
+
+#---------------------------------------------------------------------------------
+_FLAGS_REDUCIDOS = {
+    False: {
+        1: cv2.IMREAD_GRAYSCALE,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    },
+    True: {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    },
+}
+
+
+def _factor_reduccion(lado_mayor, lado_busqueda):
+    """El mayor factor de IMREAD_REDUCED_* que deja al menos lado_busqueda píxeles de lado."""
+    for factor in (8, 4, 2):
+        if lado_mayor / factor >= lado_busqueda:
+            return factor
+    return 1
+
+
+def _reducir(img, lado_busqueda):
+    """Achica la imagen hasta lado_busqueda. Devuelve (reducida, cuántas veces más grande es la original)."""
+    lado_mayor = max(img.shape[:2])
+    if lado_mayor <= lado_busqueda:
+        return img, 1.0
+    escala = lado_mayor / lado_busqueda
+    alto, ancho = img.shape[:2]
+    tamano = (max(1, round(ancho / escala)), max(1, round(alto / escala)))
+    return cv2.resize(img, tamano, interpolation=cv2.INTER_AREA), escala
+
+
+def _detectar_piramide(reducida, escala, obtener_completa, detector):
+    """
+    Busca en la versión reducida y, si la foto original era más grande, pasa las cajas a
+    coordenadas originales. Si el detector lo aprovecha (Haar), refina cada candidata a
+    resolución completa. obtener_completa() se llama sólo si hace falta (y una sola vez).
+    """
+    parametros = detector.parametros
+    if parametros['mosaico'] and max(reducida.shape[:2]) > parametros['mosaico']:
+        candidatas = _detectar_en_mosaicos(reducida, detector)
+    else:
+        candidatas = detector.buscar(reducida)
+    if escala == 1.0 or not candidatas:
+        return candidatas
+
+    originales = [(round(x * escala), round(y * escala), round(w * escala), round(h * escala)) for x, y, w, h in candidatas]
+    if not detector.refina:
+        return originales
+    completa = obtener_completa()
+    return _sin_solapes([_refinar(detector, completa, caja) or caja for caja in originales])
+
+
+def _refinar(detector, completa, caja):
+    """Vuelve a detectar sólo en la zona de la candidata, a resolución completa y con tamaños acotados."""
+    x, y, w, h = caja
+    margen = int(max(w, h) * detector.parametros['margen'])
+    alto, ancho = completa.shape[:2]
+    x0, y0 = max(0, x - margen), max(0, y - margen)
+    x1, y1 = min(ancho, x + w + margen), min(alto, y + h + margen)
+    zona = completa[y0:y1, x0:x1]
+    encontradas = detector.buscar(
+        zona, tamano_min=(int(w * 0.6), int(h * 0.6)), tamano_max=(int(w * 1.6) + 1, int(h * 1.6) + 1),
+    )
+    if not encontradas:
+        return None
+    # Si aparece más de una, la más cercana al centro de la candidata.
+    cx, cy = x + w / 2 - x0, y + h / 2 - y0
+    fx, fy, fw, fh = min(encontradas, key=lambda c: (c[0] + c[2] / 2 - cx) ** 2 + (c[1] + c[3] / 2 - cy) ** 2)
+    return (fx + x0, fy + y0, fw, fh)
+
+
+def _sin_solapes(cajas, umbral=0.3):
+    """Quita cajas repetidas (dos candidatas que refinaron a la misma cara). Se queda con la más grande."""
+    elegidas = []
+    for caja in sorted(cajas, key=lambda c: c[2] * c[3], reverse=True):
+        if all(solape(caja, otra) < umbral for otra in elegidas):
+            elegidas.append(caja)
+    return elegidas
+
+
+def solape(a, b):
+    """Intersección sobre unión de dos cajas (x, y, w, h): 0 si no se tocan, 1 si son iguales."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ancho = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    alto = max(0, min(ay + ah, by + bh) - max(ay, by))
+    interseccion = ancho * alto
+    return interseccion / float(aw * ah + bw * bh - interseccion)
+
+
+#---------------------------------------------------------------------------------
+# Mosaicos: para fotos enormes con 'lado_busqueda' alto, la versión reducida se parte en
+# cuadrados que se solapan y cada uno se analiza en un proceso aparte (DETECTOR_PROCESOS).
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def _pool_procesos():
+    global _pool
+    procesos = getattr(settings, 'DETECTOR_PROCESOS', 0)
+    if procesos <= 0:
+        return None
+    with _lock_pool:
+        if _pool is None:
+            # 'spawn': el servidor tiene hilos, y hacer fork de un proceso con hilos no es seguro.
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _mosaicos(alto, ancho, lado, solape):
+    paso = max(1, lado - solape)
+    for y in range(0, max(1, alto - solape), paso):
+        for x in range(0, max(1, ancho - solape), paso):
+            yield x, y
+
+
+def _detectar_en_mosaico(mosaico, x0, y0, receta):
+    """Corre en otro proceso: arma (una vez por proceso) el detector con la receta, sin leer settings."""
+    caras = _detector_cacheado(*receta).buscar(mosaico)
+    return [(x + x0, y + y0, w, h) for x, y, w, h in caras]
+
+
+def _detectar_en_mosaicos(reducida, detector):
+    lado = detector.parametros['mosaico']
+    solape = lado // 4   # una cara cortada por un borde aparece entera en el mosaico vecino
+    alto, ancho = reducida.shape[:2]
+    pool = _pool_procesos()
+    receta = (detector.nombre, detector.parametros, detector.modelo)
+    trabajos = [
+        (np.ascontiguousarray(reducida[y:y + lado, x:x + lado]), x, y)
+        for x, y in _mosaicos(alto, ancho, lado, solape)
+    ]
+    if pool is None:
+        resultados = [[(cx + x, cy + y, w, h) for cx, cy, w, h in detector.buscar(m)] for m, x, y in trabajos]
+    else:
+        resultados = pool.map(_detectar_en_mosaico, *zip(*trabajos), [receta] * len(trabajos))
+    return _sin_solapes([caja for cajas in resultados for caja in cajas])
+
+
+def recortar(img, caja):
+    x, y, w, h = caja
+    return img[y:y+h, x:x+w]
+
+
+def recortar_jpeg(img, caja):
+    """Recorta la caja de la imagen y la devuelve codificada como JPEG (bytes)."""
+    ok, buffer = cv2.imencode('.jpg', recortar(img, caja))
+    return buffer.tobytes() if ok else None
@@ -1,5 +1,78 @@
-from django.apps import AppConfig
+import logging
+import os
+import sys
+import threading
+import time
+
+from django.apps import AppConfig, apps
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class GestionRecuerdosConfig(AppConfig):
     name = 'gestion_recuerdos'
+
+    def ready(self):
+        # Conecta las señales que mantienen al día el índice de rostros.
+        from . import signals  # noqa: F401
+
+        # Sólo los procesos que atienden peticiones cargan OpenCV y los modelos al arrancar;
+        # manage.py migrate, shell, los comandos, etc. siguen arrancando livianos.
+        if getattr(settings, 'PRECALENTAR_WORKERS', False) and es_worker_web():
+            self.precalentar()
+
+    def precalentar(self):
+        """
+        Línea por línea:
+        1. Importa ya los módulos pesados que views.py deja para la primera petición (OpenCV, numpy, Google).
+        2. Arma un detector y un reconocedor por cada hilo que va a atender peticiones (PRECALENTAR_HILOS).
+           Son objetos de un solo hilo: ready() no corre en esos hilos, así que quedan en una reserva y
+           cada hilo toma el suyo en su primera petición (ver analisis._detector_cacheado).
+        3. En un hilo aparte, cuando Django terminó de arrancar, arma el índice de rostros y el árbol
+           (consultan la BD, que no se debe usar dentro de ready()).
+        Si algo falla (falta un modelo, la BD no está migrada) se avisa en el log y el worker arranca igual.
+        """
+        inicio = time.perf_counter()
+        try:
+            from . import views  # noqa: F401  (registra sus módulos perezosos)
+            from .analisis import precalentar_detectores
+            from .carga_perezosa import cargar_todos
+            from .reconocimiento import precalentar_reconocedores, reconocimiento_disponible
+
+            cargar_todos()
+            hilos = max(1, getattr(settings, 'PRECALENTAR_HILOS', 1))
+            precalentar_detectores(hilos)
+            if reconocimiento_disponible():
+                precalentar_reconocedores(hilos)
+        except Exception:
+            logger.exception("No se pudo precalentar el worker")
+            return
+        logger.info("Worker precalentado en %.2f s", time.perf_counter() - inicio)
+        threading.Thread(target=_precalentar_datos, name='precalentar-datos', daemon=True).start()
+
+
+def es_worker_web():
+    """
+    True en los procesos que sirven la web: gunicorn/uwsgi/daphne/uvicorn importan core/wsgi.py o
+    core/asgi.py, que marcan GESTION_RECUERDOS_WEB antes de arrancar Django. Con runserver, el
+    proceso que atiende es el hijo del autoreload (RUN_MAIN) o el único si se usa --noreload.
+    """
+    if os.environ.get('GESTION_RECUERDOS_WEB') == '1':
+        return True
+    if len(sys.argv) > 1 and sys.argv[1] == 'runserver':
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+    return False
+
+
+def _precalentar_datos():
+    while not apps.ready:
+        time.sleep(0.05)
+    try:
+        from .arbol import obtener_arbol
+        from .indice_rostros import obtener_indice
+
+        obtener_indice()
+        obtener_arbol()
+    except Exception:
+        logger.exception("No se pudo precargar el índice de rostros")
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+# --- IMPORTACIONES EXPLICADAS ---
+# El árbol genealógico en memoria: para cada familiar, sus padres, hijos y parejas.
+# Se arma con UNA consulta a la tabla Relacion y después todas las preguntas
+# (ancestros, descendientes, ancestros comunes, camino entre dos personas) se responden
+# recorriendo diccionarios, sin tocar la base de datos: milisegundos con 10.000+ personas.
+# Las señales lo mantienen al día en este proceso; lo que guarden otros procesos
+# se ve al reconstruirlo cada ARBOL_REFRESCO segundos.
+
+
+class ArbolFamiliar:
+    def __init__(self):
+        self.padres = {}     # hijo -> {padres}
+        self.hijos = {}      # padre -> {hijos}
+        self.parejas = {}    # persona -> {parejas}
+        self._lock = threading.RLock()   # las señales pueden agregar aristas mientras otro hilo recorre
+        self._ultima_carga = time.monotonic()
+
+    def cargar(self, relaciones):
+        """relaciones: iterable de (origen_id, destino_id, tipo)."""
+        with self._lock:
+            for origen, destino, tipo in relaciones:
+                self._agregar(origen, destino, tipo)
+            self._ultima_carga = time.monotonic()
+
+    def _agregar(self, origen, destino, tipo):
+        if tipo == 'PROGENITOR':
+            self.padres.setdefault(destino, set()).add(origen)
+            self.hijos.setdefault(origen, set()).add(destino)
+        else:
+            self.parejas.setdefault(origen, set()).add(destino)
+            self.parejas.setdefault(destino, set()).add(origen)
+
+    def agregar(self, origen, destino, tipo):
+        with self._lock:
+            self._agregar(origen, destino, tipo)
+
+    def quitar(self, origen, destino, tipo):
+        with self._lock:
+            if tipo == 'PROGENITOR':
+                self.padres.get(destino, set()).discard(origen)
+                self.hijos.get(origen, set()).discard(destino)
+            else:
+                self.parejas.get(origen, set()).discard(destino)
+                self.parejas.get(destino, set()).discard(origen)
+
+    #-----------------------------------------------------------------------------
+    def _recorrer(self, inicio, vecinos, max_generaciones):
+        """Recorrido en anchura: {id: generación} (1 = padres/hijos, 2 = abuelos/nietos...)."""
+        encontrados = {}
+        nivel = [inicio]
+        generacion = 0
+        with self._lock:
+            while nivel and (max_generaciones is None or generacion < max_generaciones):
+                generacion += 1
+                siguiente = []
+                for persona in nivel:
+                    for otro in vecinos.get(persona, ()):
+                        if otro not in encontrados and otro != inicio:
+                            encontrados[otro] = generacion
+                            siguiente.append(otro)
+                nivel = siguiente
+        return encontrados
+
+    def ancestros(self, familiar_id, max_generaciones=None):
+        return self._recorrer(familiar_id, self.padres, max_generaciones)
+
+    def descendientes(self, familiar_id, max_generaciones=None):
+        return self._recorrer(familiar_id, self.hijos, max_generaciones)
+
+    def ancestros_comunes(self, a, b):
+        """
+        Los ancestros comunes más cercanos (los que no son ancestros de otro ancestro común),
+        como lista de (id, generaciones desde a, generaciones desde b), del más cercano al más lejano.
+        Si uno es ancestro del otro, él mismo es el ancestro común.
+        """
+        desde_a = {**self.ancestros(a), a: 0}
+        desde_b = {**self.ancestros(b), b: 0}
+        comunes = set(desde_a) & set(desde_b)
+        # Se descartan los que están "por encima" de otro común (bisabuelos si ya están los abuelos)
+        mas_arriba = set()
+        for comun in comunes:
+            mas_arriba.update(self.ancestros(comun))
+        cercanos = comunes - mas_arriba
+        return sorted(((c, desde_a[c], desde_b[c]) for c in cercanos), key=lambda t: (t[1] + t[2], t[0]))
+
+    def camino(self, a, b):
+        """
+        El camino más corto de a hasta b siguiendo relaciones, como lista de (id, paso) donde paso
+        es 'padre', 'hijo' o 'pareja' (cómo se llega a ese id desde el anterior). None si no hay.
+        """
+        if a == b:
+            return [(a, None)]
+        anterior = {a: None}
+        cola = deque([a])
+        with self._lock:
+            while cola:
+                persona = cola.popleft()
+                for paso, vecinos in (('padre', self.padres), ('hijo', self.hijos), ('pareja', self.parejas)):
+                    for otro in vecinos.get(persona, ()):
+                        if otro in anterior:
+                            continue
+                        anterior[otro] = (persona, paso)
+                        if otro == b:
+                            return self._armar_camino(anterior, a, b)
+                        cola.append(otro)
+        return None
+
+    @staticmethod
+    def _armar_camino(anterior, a, b):
+        camino = []
+        actual = b
+        while actual != a:
+            previo, paso = anterior[actual]
+            camino.append((actual, paso))
+            actual = previo
+        camino.append((a, None))
+        camino.reverse()
+        return camino
+
+
+NOMBRES_DIRECTOS = {
+    (1, 0): "padre/madre", (0, 1): "hijo/a",
+    (2, 0): "abuelo/a", (0, 2): "nieto/a",
+    (3, 0): "bisabuelo/a", (0, 3): "bisnieto/a",
+    (1, 1): "hermano/a", (2, 1): "tío/a", (1, 2): "sobrino/a",
+    (2, 2): "primo/a hermano/a",
+}
+
+
+def nombre_parentesco(sube, baja):
+    """
+    Qué es b de a, sabiendo que desde a se sube 'sube' generaciones hasta el ancestro común
+    y desde ahí se baja 'baja' generaciones hasta b.
+    """
+    if (sube, baja) == (0, 0):
+        return "la misma persona"
+    if (sube, baja) in NOMBRES_DIRECTOS:
+        return NOMBRES_DIRECTOS[(sube, baja)]
+    if baja == 0:
+        return f"ancestro ({sube} generaciones)"
+    if sube == 0:
+        return f"descendiente ({baja} generaciones)"
+    if sube == baja:
+        return f"primo/a en grado {sube - 1}"
+    return f"pariente ({sube} arriba, {baja} abajo)"
+
+
+#---------------------------------------------------------------------------------
+_arbol = None
+_lock_arbol = threading.Lock()
+
+
+def obtener_arbol():
+    """El árbol de este proceso; se arma la primera vez y se rearma cada ARBOL_REFRESCO segundos."""
+    global _arbol
+    from .models import Relacion
+
+    with _lock_arbol:
+        if _arbol is None or time.monotonic() - _arbol._ultima_carga > getattr(settings, 'ARBOL_REFRESCO', 60):
+            arbol = ArbolFamiliar()
+            arbol.cargar(Relacion.objects.values_list('origen_id', 'destino_id', 'tipo').iterator(chunk_size=5000))
+            _arbol = arbol
+    return _arbol
+
+
+def arbol_si_cargado():
+    """El árbol sólo si ya fue construido; las señales no lo fuerzan a cargarse."""
+    return _arbol
+
+
+def olvidar_arbol():
+    """Tras cargas masivas (bulk_create no dispara señales): el próximo obtener_arbol() lo rearma."""
+    global _arbol
+    with _lock_arbol:
+        _arbol = None
@@ -0,0 +1,152 @@
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+
+from .models import Familiar
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Búsqueda de texto completo sobre los familiares (nombre, apellido y biografía).
+# - SQLite: una tabla virtual FTS5 (familiar_busqueda) con el tokenizador unicode61 y
+#   remove_diacritics, así "jose" encuentra "José" y "munoz" encuentra "Muñoz". Guarda los
+#   prefijos de 2 y 3 letras para que el autocompletado ("ju", "gon") sea instantáneo.
+#   Las señales de Familiar la mantienen al día; las cargas masivas llaman a reconstruir_indice().
+# - PostgreSQL: índices GIN sobre to_tsvector(unaccent(...)) creados por la misma migración;
+#   como son índices de expresiones, se actualizan solos.
+# - Otro motor: se cae a filtros icontains (lento con muchos familiares, pero funciona).
+
+TABLA = 'familiar_busqueda'
+PESOS_BM25 = (10.0, 5.0, 1.0)   # nombre, apellido, biografía
+_TEXTO_PG = "coalesce(nombre, '') || ' ' || coalesce(apellido, '') || ' ' || coalesce(biografia, '')"
+_NOMBRE_PG = "coalesce(nombre, '') || ' ' || coalesce(apellido, '')"
+_MARCA_INICIO, _MARCA_FIN = '\x01', '\x02'
+
+
+def terminos(texto):
+    """Las palabras de la búsqueda, en minúsculas y sin tildes (sólo letras y números: nada que rompa la consulta)."""
+    texto = unicodedata.normalize('NFD', (texto or '').lower())
+    texto = ''.join(c for c in texto if unicodedata.category(c) != 'Mn')
+    return re.findall(r'\w+', texto)[:8]
+
+
+def _consulta_fts(palabras, columnas=None):
+    """['jose', 'gon'] -> '"jose"* AND "gon"*' (cada palabra como prefijo), opcionalmente limitada a columnas."""
+    expresion = ' AND '.join(f'"{palabra}"*' for palabra in palabras)
+    return f"{{{' '.join(columnas)}}} : ({expresion})" if columnas else expresion
+
+
+def _consulta_pg(palabras):
+    return ' & '.join(f"{palabra}:*" for palabra in palabras)
+
+
+#---------------------------------------------------------------------------------
+def sugerir_nombres(texto, limite=10):
+    """
+    Autocompletado: [(id, 'Nombre Apellido'), ...] cuyo nombre o apellido empieza con cada palabra.
+    Sólo mira nombre y apellido (no la biografía) y trae únicamente 'limite' filas.
+    """
+    palabras = terminos(texto)
+    if not palabras or max(len(palabra) for palabra in palabras) < 2:
+        return []   # una sola letra coincide con medio árbol
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Sin bm25: puntuar todas las coincidencias de un prefijo corto ("ma") cuesta decenas de ms.
+            # FTS5 sólo da los ids que coinciden (sin puntuar) y se ordena por nombre en la tabla de
+            # familiares: son los primeros de TODAS las coincidencias, no de unas cuantas al azar.
+            cursor.execute(
+                f"SELECT id, nombre, apellido FROM {Familiar._meta.db_table} "
+                f"WHERE id IN (SELECT rowid FROM {TABLA} WHERE {TABLA} MATCH %s) "
+                f"ORDER BY nombre, apellido LIMIT %s",
+                [_consulta_fts(palabras, ['nombre', 'apellido']), limite],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT id, nombre, apellido FROM {Familiar._meta.db_table} "
+                f"WHERE to_tsvector('simple', gr_unaccent({_NOMBRE_PG})) @@ to_tsquery('simple', %s) "
+                f"ORDER BY nombre, apellido LIMIT %s",
+                [_consulta_pg(palabras), limite],
+            )
+        else:
+            return [(f.id, str(f).strip()) for f in _filtro_simple(palabras, ['nombre', 'apellido'])[:limite]]
+        return [(fila[0], f"{fila[1]} {fila[2] or ''}".strip()) for fila in cursor.fetchall()]
+
+
+def buscar_familiares(texto, limite=50):
+    """
+    Búsqueda completa (también en la biografía), de más a menos relevante.
+    Devuelve [(id, 'Nombre Apellido', fragmento), ...]; el fragmento de la biografía trae las
+    coincidencias marcadas con \\x01 ... \\x02 (ver fragmento_html).
+    """
+    palabras = terminos(texto)
+    if not palabras:
+        return []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"SELECT rowid, nombre, apellido, snippet({TABLA}, 2, %s, %s, '…', 12) FROM {TABLA} "
+                f"WHERE {TABLA} MATCH %s ORDER BY bm25({TABLA}, {', '.join(map(str, PESOS_BM25))}) LIMIT %s",
+                [_MARCA_INICIO, _MARCA_FIN, _consulta_fts(palabras), limite],
+            )
+        elif connection.vendor == 'postgresql':
+            vector = f"to_tsvector('simple', gr_unaccent({_TEXTO_PG}))"
+            cursor.execute(
+                f"SELECT id, nombre, apellido, ts_headline('simple', coalesce(biografia, ''), q, "
+                f"'StartSel={_MARCA_INICIO}, StopSel={_MARCA_FIN}, MaxWords=12, MinWords=5') "
+                f"FROM {Familiar._meta.db_table}, to_tsquery('simple', %s) AS q "
+                f"WHERE {vector} @@ q ORDER BY ts_rank({vector}, q) DESC LIMIT %s",
+                [_consulta_pg(palabras), limite],
+            )
+        else:
+            campos = ['nombre', 'apellido', 'biografia']
+            return [(f.id, str(f).strip(), f.biografia[:120]) for f in _filtro_simple(palabras, campos)[:limite]]
+        return [(fila[0], f"{fila[1]} {fila[2] or ''}".strip(), fila[3] or '') for fila in cursor.fetchall()]
+
+
+def _filtro_simple(palabras, campos):
+    consulta = Familiar.objects.all()
+    for palabra in palabras:
+        condicion = Q()
+        for campo in campos:
+            condicion |= Q(**{f"{campo}__icontains": palabra})
+        consulta = consulta.filter(condicion)
+    return consulta.order_by('nombre', 'apellido')
+
+
+def fragmento_html(fragmento):
+    """El fragmento de la biografía escapado para HTML, con las coincidencias en <mark>."""
+    return escape(fragmento).replace(_MARCA_INICIO, '<mark>').replace(_MARCA_FIN, '</mark>')
+
+
+#---------------------------------------------------------------------------------
+# Mantenimiento del índice (sólo SQLite: en PostgreSQL los índices de expresiones se actualizan solos).
+
+def indexar_familiar(familiar):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA} WHERE rowid = %s", [familiar.id])
+        cursor.execute(
+            f"INSERT INTO {TABLA} (rowid, nombre, apellido, biografia) VALUES (%s, %s, %s, %s)",
+            [familiar.id, familiar.nombre, familiar.apellido or '', familiar.biografia or ''],
+        )
+
+
+def quitar_familiar(familiar_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA} WHERE rowid = %s", [familiar_id])
+
+
+def reconstruir_indice():
+    """Vuelve a llenar el índice desde la tabla de familiares (tras bulk_create, que no dispara señales)."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA}")
+        cursor.execute(
+            f"INSERT INTO {TABLA} (rowid, nombre, apellido, biografia) "
+            f"SELECT id, nombre, coalesce(apellido, ''), coalesce(biografia, '') FROM {Familiar._meta.db_table}"
+        )
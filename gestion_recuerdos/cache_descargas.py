@@ -0,0 +1,193 @@
+import mmap
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from django.conf import settings
+from googleapiclient.http import MediaIoBaseDownload
+
+from .metricas import etapa, metricas
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Caché en disco de las fotos originales de Drive.
+# - La clave es "id de Drive + md5": si la foto cambia en Drive, cambia el md5 y se vuelve a bajar.
+# - Tiene un tamaño máximo: cuando se pasa, se borran las fotos usadas hace más tiempo (LRU).
+# - Al leer se usa mmap: cv2.imdecode lee directo del archivo sin copiarlo a un BytesIO.
+
+_SEGURO = re.compile(r'[^A-Za-z0-9_-]')
+
+
+class CacheDescargas:
+    def __init__(self, carpeta, max_bytes):
+        self.carpeta = carpeta
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._total = None          # bytes ocupados (se calcula una vez y se va sumando)
+        self._lock = threading.Lock()
+
+    def ruta(self, file_id, md5):
+        return os.path.join(self.carpeta, f"{_SEGURO.sub('', file_id)}_{_SEGURO.sub('', md5)}")
+
+    #-----------------------------------------------------------------------------
+    def cargar_imagen(self, service, file_id, md5=None, flags=cv2.IMREAD_COLOR):
+        """
+        Devuelve la foto ya decodificada, descargándola sólo si no está en caché.
+        Si no se conoce el md5 se busca en DriveArchivo y, si no está, se le pide a Drive.
+        """
+        with self.abrir(service, file_id, md5) as archivo:
+            return leer_imagen_abierta(archivo, flags)
+
+    @contextmanager
+    def abrir(self, service, file_id, md5=None):
+        """
+        Deja la foto abierta para decodificarla varias veces (por ejemplo, primero reducida
+        y después completa) sin que el desalojo del LRU la borre a mitad de camino.
+        """
+        md5 = md5 or buscar_md5(service, file_id)
+        if md5:
+            try:
+                archivo = open(self.obtener(service, file_id, md5), 'rb')
+            except FileNotFoundError:
+                # Otro hilo la desalojó justo entre obtener y abrir: se vuelve a bajar.
+                archivo = open(self.obtener(service, file_id, md5), 'rb')
+            with archivo:
+                yield archivo
+            return
+
+        # Sin md5 no hay forma segura de saber si cambió: se descarga y no se guarda.
+        with self._lock:
+            self.fallos += 1
+        ruta = self._descargar(service, file_id, os.path.join(self.carpeta, f"sin_md5_{uuid.uuid4().hex}"))
+        try:
+            with open(ruta, 'rb') as archivo:
+                yield archivo
+        finally:
+            os.remove(ruta)
+
+    def obtener(self, service, file_id, md5):
+        """Devuelve la ruta local de la foto (id + md5), descargándola si hace falta."""
+        ruta = self.ruta(file_id, md5)
+        if os.path.exists(ruta):
+            os.utime(ruta)   # "usada recién": la última en salir del LRU
+            with self._lock:
+                self.aciertos += 1
+            return ruta
+
+        with self._lock:
+            self.fallos += 1
+        self._descargar(service, file_id, ruta)
+        self._quitar_versiones_viejas(file_id, ruta)
+        self._registrar(os.path.getsize(ruta))
+        return ruta
+
+    def _descargar(self, service, file_id, ruta):
+        """Descarga directo a disco con un nombre temporal y lo renombra al terminar (atómico)."""
+        os.makedirs(self.carpeta, exist_ok=True)
+        temporal = f"{ruta}.descargando-{uuid.uuid4().hex}"
+        try:
+            with etapa('descarga'), open(temporal, 'wb') as fh:
+                downloader = MediaIoBaseDownload(fh, service.files().get_media(fileId=file_id))
+                done = False
+                while not done: _, done = downloader.next_chunk()
+            metricas.sumar('gr_drive_bytes_descargados_total', os.path.getsize(temporal))
+            os.replace(temporal, ruta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return ruta
+
+    def _quitar_versiones_viejas(self, file_id, ruta_actual):
+        prefijo = f"{_SEGURO.sub('', file_id)}_"
+        for entrada in os.scandir(self.carpeta):
+            if entrada.name.startswith(prefijo) and entrada.path != ruta_actual and '.descargando-' not in entrada.name:
+                tamano = entrada.stat().st_size
+                os.remove(entrada.path)
+                self._registrar(-tamano)
+
+    #-----------------------------------------------------------------------------
+    def _registrar(self, bytes_agregados):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(e.stat().st_size for e in os.scandir(self.carpeta) if e.is_file())
+            else:
+                self._total += bytes_agregados
+            excedido = self._total > self.max_bytes
+        if excedido:
+            self.desalojar()
+
+    def desalojar(self):
+        """Borra las fotos menos usadas hasta dejar la caché en el 90% del máximo."""
+        with self._lock:
+            entradas = sorted(
+                (e for e in os.scandir(self.carpeta) if e.is_file() and '.descargando-' not in e.name),
+                key=lambda e: e.stat().st_mtime,
+            )
+            total = sum(e.stat().st_size for e in entradas)
+            objetivo = int(self.max_bytes * 0.9)
+            for entrada in entradas:
+                if total <= objetivo:
+                    break
+                try:
+                    tamano = entrada.stat().st_size
+                    os.remove(entrada.path)
+                    total -= tamano
+                except FileNotFoundError:
+                    pass
+                except PermissionError:
+                    pass   # en Windows no se puede borrar una foto que otro hilo tiene abierta
+            self._total = total
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else 0,
+                'bytes_ocupados': self._total,
+                'bytes_maximos': self.max_bytes,
+            }
+
+
+#---------------------------------------------------------------------------------
+def buscar_md5(service, file_id):
+    """Primero en la tabla local (sin red); si la foto no está sincronizada, se pregunta a Drive."""
+    from .models import DriveArchivo
+    md5 = DriveArchivo.objects.filter(drive_id=file_id).values_list('md5', flat=True).first()
+    if md5:
+        return md5
+    with etapa('drive_api'):
+        return service.files().get(fileId=file_id, fields='md5Checksum').execute().get('md5Checksum')
+
+
+def leer_imagen(ruta, flags=cv2.IMREAD_COLOR):
+    """Decodifica la imagen leyendo el archivo con mmap (sin copiarlo a memoria de Python)."""
+    with open(ruta, 'rb') as archivo:
+        return leer_imagen_abierta(archivo, flags)
+
+
+def leer_imagen_abierta(archivo, flags=cv2.IMREAD_COLOR):
+    if os.fstat(archivo.fileno()).st_size == 0:
+        return None
+    with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        buffer = np.frombuffer(mapa, np.uint8)
+        img = cv2.imdecode(buffer, flags)
+        del buffer   # hay que soltar la vista antes de cerrar el mmap
+    return img
+
+
+_cache = None
+_lock_cache = threading.Lock()
+
+
+def obtener_cache():
+    global _cache
+    with _lock_cache:
+        if _cache is None:
+            _cache = CacheDescargas(settings.CACHE_DRIVE_CARPETA, settings.CACHE_DRIVE_MAX_BYTES)
+    return _cache
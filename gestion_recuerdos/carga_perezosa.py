@@ -0,0 +1,45 @@
+import importlib
+import threading
+
+# --- IMPORTACIONES EXPLICADAS ---
+# core/urls.py importa todas las vistas, y Django carga core/urls.py en cada manage.py
+# (los chequeos del sistema revisan las URLs), en cada migración y al arrancar cada worker.
+# Si views.py importara arriba OpenCV, numpy y los clientes de Google, todos esos procesos
+# pagarían segundos y decenas de MB aunque sólo vayan a mostrar la galería o el admin.
+# modulo_perezoso('gestion_recuerdos.drive') devuelve un objeto que importa el módulo real
+# la primera vez que se le pide algo (drive.crear_servicio(...)) y de ahí en más lo reutiliza.
+
+_registrados = []
+_lock = threading.Lock()
+
+
+class ModuloPerezoso:
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+
+    def cargar(self):
+        if self._modulo is None:
+            with _lock:
+                if self._modulo is None:
+                    self._modulo = importlib.import_module(self._nombre)
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self.cargar(), atributo)
+
+    def __repr__(self):
+        estado = 'cargado' if self._modulo is not None else 'sin cargar'
+        return f"<módulo perezoso {self._nombre} ({estado})>"
+
+
+def modulo_perezoso(nombre):
+    modulo = ModuloPerezoso(nombre)
+    _registrados.append(modulo)
+    return modulo
+
+
+def cargar_todos():
+    """Importa ya todos los módulos perezosos (precalentamiento de los workers web)."""
+    for modulo in _registrados:
+        modulo.cargar()
@@ -0,0 +1,244 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metricas import etapa, metricas
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Credenciales de Google compartidas por todo el proceso, una por cuenta.
+# - Todos los hilos y todos los clientes de Drive (drive.crear_servicio, drive_async.ClienteDriveAsync)
+#   usan el MISMO objeto: cuando uno refresca el access token, los demás ya ven el nuevo.
+# - El token se refresca ANTES de vencer (CREDENCIALES_MARGEN_SEGUNDOS) y de a uno por cuenta: si diez
+#   peticiones lo necesitan a la vez, una lo pide a Google y las otras nueve esperan y lo reutilizan.
+# - El token nuevo se publica en la caché de Django (CREDENCIALES_CACHE): con una caché compartida
+#   (Redis, Memcached, BD) los demás procesos lo toman de ahí en vez de pedir otro.
+# - CredencialesMiddleware lo guarda en la sesión del usuario para las peticiones siguientes.
+# google.oauth2 se importa recién al primer uso: el middleware carga este módulo al arrancar.
+
+MAX_CUENTAS = 256
+ESPERA_OTRO_PROCESO = 10   # segundos que se espera a que otro proceso termine de refrescar
+
+_lock = threading.Lock()
+_vivas = OrderedDict()   # clave de credencial -> credenciales compartidas
+_turnos = {}             # clave de credencial -> threading.Lock (un refresco a la vez por cuenta)
+
+
+def clave_credencial(creds_data):
+    """Identifica a la cuenta sin usar el secreto en claro como clave de diccionario."""
+    base = f"{creds_data.get('client_id')}:{creds_data.get('refresh_token') or creds_data.get('token')}"
+    return hashlib.sha256(base.encode()).hexdigest()
+
+
+def ahora():
+    """Hora UTC sin zona horaria, que es como google-auth guarda el vencimiento (Credentials.expiry)."""
+    return datetime.now(dt_timezone.utc).replace(tzinfo=None)
+
+
+def a_texto(expiry):
+    """Vencimiento -> texto ISO con zona, para guardarlo en la sesión (JSON)."""
+    return expiry.replace(tzinfo=dt_timezone.utc).isoformat() if expiry else None
+
+
+def desde_texto(texto):
+    """Texto ISO de la sesión -> vencimiento en UTC sin zona (None si no hay)."""
+    if not texto:
+        return None
+    fecha = datetime.fromisoformat(texto)
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+def vence_pronto(expiry):
+    """True si al token le quedan menos de CREDENCIALES_MARGEN_SEGUNDOS. Sin vencimiento conocido, False."""
+    if expiry is None:
+        return False
+    return (expiry - ahora()).total_seconds() < settings.CREDENCIALES_MARGEN_SEGUNDOS
+
+
+def _cache():
+    return caches[settings.CREDENCIALES_CACHE]
+
+
+def _clave_cache(clave):
+    return f'gr:credencial:{clave}'
+
+
+#-----------------------------------------------------------------------------
+@functools.cache
+def _clase_compartida():
+    """La subclase se arma al primer uso para no importar google.oauth2 al arrancar."""
+    from google.oauth2.credentials import Credentials
+
+    class CredencialesCompartidas(Credentials):
+        """googleapiclient llama a refresh() ante un 401 o cuando el token venció: pasa por refrescar()."""
+        clave = None
+
+        def refresh(self, request):
+            refrescar(self, self.token, request)
+
+        def pedir_token(self, request):
+            super().refresh(request)
+
+    return CredencialesCompartidas
+
+
+def registrar(creds_data):
+    """
+    Devuelve las credenciales vivas de esta cuenta, sin refrescarlas.
+    La primera vez las arma con lo que hay en la sesión; después, siempre el mismo objeto.
+    """
+    clave = clave_credencial(creds_data)
+    with _lock:
+        creds = _vivas.get(clave)
+        if creds is None:
+            creds = _clase_compartida()(
+                token=creds_data.get('token'),
+                refresh_token=creds_data.get('refresh_token'),
+                token_uri=creds_data.get('token_uri'),
+                client_id=creds_data.get('client_id'),
+                client_secret=creds_data.get('client_secret'),
+                scopes=creds_data.get('scopes'),
+                expiry=desde_texto(creds_data.get('expiry')),
+            )
+            creds.clave = clave
+            _vivas[clave] = creds
+            if len(_vivas) > MAX_CUENTAS:
+                _vivas.popitem(last=False)
+        else:
+            _vivas.move_to_end(clave)
+    return creds
+
+
+def obtener(creds_data):
+    """
+    Línea por línea:
+    1. Busca (o arma) las credenciales vivas de la cuenta.
+    2. Si al token le queda poco, antes de pedir uno nuevo mira si la sesión trae uno más reciente
+       (lo refrescó otro proceso).
+    3. Si sigue por vencer, lo refresca ahora (de a uno, ver refrescar) en vez de esperar al 401.
+    """
+    creds = registrar(creds_data)
+    if vence_pronto(creds.expiry):
+        expiry = desde_texto(creds_data.get('expiry'))
+        if expiry and expiry > creds.expiry:
+            _aplicar(creds, creds_data.get('token'), expiry)
+        if vence_pronto(creds.expiry):
+            refrescar(creds, creds.token)
+    return creds
+
+
+def vigente(clave):
+    """Token y vencimiento que conoce este proceso para la cuenta (None si no la usó)."""
+    with _lock:
+        creds = _vivas.get(clave)
+    if creds is None or not creds.token:
+        return None
+    return {'token': creds.token, 'expiry': a_texto(creds.expiry)}
+
+
+#-----------------------------------------------------------------------------
+def _aplicar(creds, token, expiry):
+    # Primero el vencimiento: quien lea en el medio ve el token viejo (todavía válido) con la fecha nueva,
+    # nunca el token nuevo con la fecha vieja (eso lo haría refrescar de nuevo).
+    creds.expiry = expiry
+    creds.token = token
+
+
+def adoptar_publicado(creds, token_visto):
+    """Si otro proceso ya publicó un token distinto y vigente, lo usa. Devuelve True si lo adoptó."""
+    publicado = _cache().get(_clave_cache(creds.clave))
+    if not publicado or publicado['token'] == token_visto:
+        return False
+    expiry = desde_texto(publicado['expiry'])
+    if vence_pronto(expiry):
+        return False
+    _aplicar(creds, publicado['token'], expiry)
+    return True
+
+
+def tomar_turno(clave):
+    """Marca en la caché que este proceso está refrescando la cuenta. False si ya lo hace otro."""
+    return _cache().add(f'{_clave_cache(clave)}:refrescando', os.getpid(), timeout=ESPERA_OTRO_PROCESO)
+
+
+def soltar_turno(clave):
+    _cache().delete(f'{_clave_cache(clave)}:refrescando')
+
+
+def publicar(creds, token, expiry):
+    """Deja el token nuevo a la vista de todos: las credenciales vivas de este proceso y la caché de Django."""
+    with _lock:
+        vivas = _vivas.get(creds.clave)
+    if creds.token != token:
+        _aplicar(creds, token, expiry)
+    if vivas is not None and vivas is not creds:
+        _aplicar(vivas, token, expiry)
+    restante = int((expiry - ahora()).total_seconds()) if expiry else 3600
+    if restante > 0:
+        _cache().set(_clave_cache(creds.clave), {'token': token, 'expiry': a_texto(expiry)}, timeout=restante)
+
+
+def refrescar(creds, token_visto, request=None):
+    """
+    Pide un access token nuevo, una sola vez aunque lo pidan varios hilos o procesos a la vez.
+    Línea por línea:
+    1. Un candado por cuenta: el primer hilo refresca, los demás esperan.
+    2. Al entrar, si el token ya no es el que vio quien llamó, otro hilo lo refrescó: no hay nada que hacer.
+    3. Si otro proceso ya publicó uno nuevo en la caché, se usa ese.
+    4. Si otro proceso está refrescando ahora mismo, se lo espera hasta ESPERA_OTRO_PROCESO segundos.
+    5. Si no, se pide a Google y se publica.
+    """
+    with _lock:
+        turno = _turnos.setdefault(creds.clave, threading.Lock())
+    with turno:
+        if creds.token != token_visto or adoptar_publicado(creds, token_visto):
+            return
+        tengo_turno = tomar_turno(creds.clave)
+        if not tengo_turno:
+            limite = time.monotonic() + ESPERA_OTRO_PROCESO
+            while time.monotonic() < limite:
+                time.sleep(0.1)
+                if adoptar_publicado(creds, token_visto):
+                    return
+        try:
+            if request is None:
+                from google.auth.transport.requests import Request
+                request = Request()
+            with etapa('drive_token'):
+                creds.pedir_token(request)
+            metricas.sumar('gr_credenciales_refrescos_total')
+            publicar(creds, creds.token, creds.expiry)
+        finally:
+            if tengo_turno:
+                soltar_turno(creds.clave)
+
+
+#-----------------------------------------------------------------------------
+class CredencialesMiddleware:
+    """
+    Guarda en la sesión el access token que se refrescó durante la petición, así la siguiente
+    (en este proceso o en otro) arranca con el token vigente en vez de pagar otro refresco.
+    Sólo mira las sesiones que la vista leyó: no agrega consultas a las demás páginas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        sesion = getattr(request, 'session', None)
+        if sesion is not None and sesion.accessed:
+            creds_data = sesion.get('credentials')
+            if creds_data:
+                actual = vigente(clave_credencial(creds_data))
+                if actual and actual['token'] != creds_data.get('token'):
+                    sesion['credentials'] = {**creds_data, **actual}
+        return response
@@ -0,0 +1,63 @@
+import os
+
+from django.conf import settings
+
+from .analisis import configuracion_detector, detectar_en_archivo, recortar_jpeg
+from .cache_descargas import buscar_md5, leer_imagen_abierta, obtener_cache
+from .metricas import metricas
+from .models import DeteccionGuardada
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Guarda el resultado de detectar rostros en cada foto (cajas + recortes en disco).
+# Si se vuelve a abrir la misma foto, con el mismo md5 y el mismo detector,
+# no se descarga, no se decodifica y no se vuelve a detectar nada.
+
+
+def buscar_deteccion(file_id, md5):
+    """Devuelve la detección guardada si sigue siendo válida, o None."""
+    nombre, parametros = configuracion_detector()
+    deteccion = DeteccionGuardada.objects.filter(
+        drive_file_id=file_id, md5=md5, detector=nombre,
+    ).first()
+    if deteccion is None or deteccion.parametros != parametros:
+        return None
+    # Si alguien borró los recortes del disco, no sirve.
+    for ruta in deteccion.rutas_recortes():
+        if not os.path.exists(os.path.join(settings.MEDIA_ROOT, ruta)):
+            return None
+    return deteccion
+
+
+def guardar_deteccion(file_id, md5, cajas, recortes_jpeg):
+    """Guarda (o reemplaza) la detección de una foto junto con los JPEG de sus recortes."""
+    nombre, parametros = configuracion_detector()
+    deteccion, _ = DeteccionGuardada.objects.update_or_create(
+        drive_file_id=file_id,
+        defaults={'md5': md5 or '', 'detector': nombre, 'parametros': parametros, 'cajas': [list(c) for c in cajas]},
+    )
+    carpeta = os.path.join(settings.MEDIA_ROOT, 'detecciones', str(deteccion.id))
+    os.makedirs(carpeta, exist_ok=True)
+    for ruta, jpeg in zip(deteccion.rutas_recortes(), recortes_jpeg):
+        with open(os.path.join(settings.MEDIA_ROOT, ruta), 'wb') as archivo:
+            archivo.write(jpeg or b'')
+    return deteccion
+
+
+def analizar_con_cache(service, file_id):
+    """
+    Línea por línea:
+    1. Averigua el md5 de la foto (tabla local o metadatos de Drive, sin bajar la foto).
+    2. Si ya hay una detección válida para ese md5 y ese detector, la devuelve tal cual.
+    3. Si no, baja (o lee de la caché) la foto, detecta por niveles, guarda los recortes y el resultado.
+    """
+    md5 = buscar_md5(service, file_id)
+    if md5:
+        deteccion = buscar_deteccion(file_id, md5)
+        if deteccion is not None:
+            metricas.sumar('gr_detecciones_reutilizadas_total')
+            return deteccion
+
+    # Se busca primero en una versión reducida; la foto completa sólo se decodifica si hay caras.
+    with obtener_cache().abrir(service, file_id, md5) as archivo:
+        cajas, img = detectar_en_archivo(lambda flags: leer_imagen_abierta(archivo, flags))
+    return guardar_deteccion(file_id, md5, cajas, [recortar_jpeg(img, caja) for caja in cajas])
@@ -0,0 +1,129 @@
+import os
+
+import cv2
+import numpy as np
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Detectores de rostros intercambiables. Todos corren en CPU y se eligen en
+# settings.DETECTOR_ROSTROS['nombre']:
+#   'haar'  -> cascada de Haar de OpenCV (rápida, sin archivos extra, falla con caras de perfil)
+#   'ssd'   -> red SSD ResNet-10 de OpenCV DNN (modelos/deploy.prototxt + .caffemodel)
+#   'yunet' -> YuNet (cv2.FaceDetectorYN, modelos/face_detection_yunet_2023mar.onnx)
+# Para agregar otro: una subclase de DetectorRostros registrada en DETECTORES.
+# Los detectores no leen settings: reciben parámetros y rutas de modelo ya resueltos, así
+# pueden armarse también dentro de los procesos que analizan mosaicos.
+
+
+class DetectorRostros:
+    nombre = ''
+    color = False            # True si necesita la imagen BGR (si no, se le pasa en gris)
+    por_defecto = {}         # parámetros propios del detector
+    refina = False           # True si vale la pena volver a detectar la zona a resolución completa
+
+    def __init__(self, parametros, modelo=None):
+        self.parametros = parametros
+        self.modelo = modelo
+
+    def buscar(self, img, tamano_min=None, tamano_max=None):
+        """Devuelve las cajas (x, y, w, h) encontradas en img."""
+        raise NotImplementedError
+
+
+class DetectorHaar(DetectorRostros):
+    nombre = 'haar'
+    por_defecto = {'escala': 1.1, 'vecinos': 4, 'cascada': 'haarcascade_frontalface_default.xml'}
+    refina = True
+
+    def __init__(self, parametros, modelo=None):
+        super().__init__(parametros, modelo)
+        self.clasificador = cv2.CascadeClassifier(modelo or cv2.data.haarcascades + parametros['cascada'])
+        if self.clasificador.empty():
+            raise ValueError(f"No se pudo leer la cascada {parametros['cascada']}")
+
+    def buscar(self, img, tamano_min=None, tamano_max=None):
+        extra = {}
+        if tamano_min:
+            extra['minSize'] = tamano_min
+        if tamano_max:
+            extra['maxSize'] = tamano_max
+        caras = self.clasificador.detectMultiScale(img, self.parametros['escala'], self.parametros['vecinos'], **extra)
+        return [tuple(int(v) for v in cara) for cara in caras]
+
+
+class DetectorSSD(DetectorRostros):
+    nombre = 'ssd'
+    color = True
+    por_defecto = {'confianza': 0.5, 'entrada': 300}
+
+    def __init__(self, parametros, modelo=None):
+        super().__init__(parametros, modelo)
+        prototxt, pesos = modelo
+        self.red = cv2.dnn.readNetFromCaffe(prototxt, pesos)
+
+    def buscar(self, img, tamano_min=None, tamano_max=None):
+        alto, ancho = img.shape[:2]
+        lado = self.parametros['entrada']
+        blob = cv2.dnn.blobFromImage(cv2.resize(img, (lado, lado)), 1.0, (lado, lado), (104.0, 177.0, 123.0))
+        self.red.setInput(blob)
+        salida = self.red.forward()[0, 0]
+        cajas = []
+        for _, _, confianza, x0, y0, x1, y1 in salida:
+            if confianza < self.parametros['confianza']:
+                continue
+            x0, x1 = int(max(0.0, x0) * ancho), int(min(1.0, x1) * ancho)
+            y0, y1 = int(max(0.0, y0) * alto), int(min(1.0, y1) * alto)
+            if x1 > x0 and y1 > y0:
+                cajas.append((x0, y0, x1 - x0, y1 - y0))
+        return cajas
+
+
+class DetectorYuNet(DetectorRostros):
+    nombre = 'yunet'
+    color = True
+    por_defecto = {'confianza': 0.8, 'nms': 0.3}
+
+    def __init__(self, parametros, modelo=None):
+        super().__init__(parametros, modelo)
+        self.red = cv2.FaceDetectorYN.create(modelo, "", (320, 320), parametros['confianza'], parametros['nms'])
+
+    def buscar(self, img, tamano_min=None, tamano_max=None):
+        alto, ancho = img.shape[:2]
+        self.red.setInputSize((ancho, alto))
+        _, caras = self.red.detect(img)
+        if caras is None:
+            return []
+        cajas = []
+        for cara in caras:
+            x, y, w, h = (int(round(v)) for v in cara[:4])
+            x, y = max(0, x), max(0, y)
+            w, h = min(w, ancho - x), min(h, alto - y)
+            if w > 0 and h > 0:
+                cajas.append((x, y, w, h))
+        return cajas
+
+
+DETECTORES = {clase.nombre: clase for clase in (DetectorHaar, DetectorSSD, DetectorYuNet)}
+
+
+def modelo_disponible(modelo):
+    """True si existen todos los archivos del modelo (o si el detector no necesita ninguno)."""
+    if modelo is None:
+        return True
+    rutas = modelo if isinstance(modelo, (list, tuple)) else [modelo]
+    return all(os.path.exists(ruta) for ruta in rutas)
+
+
+def crear_detector(nombre, parametros, modelo=None):
+    if nombre not in DETECTORES:
+        raise ValueError(f"Detector desconocido: {nombre} (opciones: {', '.join(DETECTORES)})")
+    if not modelo_disponible(modelo):
+        raise ValueError(f"Faltan los archivos del modelo del detector '{nombre}': {modelo}")
+    return DETECTORES[nombre](parametros, modelo)
+
+
+def a_gris(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def a_color(img):
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if img.ndim == 2 else np.ascontiguousarray(img)
@@ -0,0 +1,122 @@
+import json
+import threading
+from collections import OrderedDict
+
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+from googleapiclient.discovery import build
+
+from . import credenciales
+from .credenciales import clave_credencial
+from .metricas import etapa
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Funciones de apoyo para hablar con Google Drive que comparten las vistas
+# y los comandos de manage.py (que no tienen request.session).
+
+CARPETA_RAIZ = 'Genealogia'
+MIME_CARPETA = 'application/vnd.google-apps.folder'
+
+
+MAX_SERVICIOS_POR_HILO = 32
+
+_local = threading.local()
+
+
+def crear_servicio(creds_data):
+    """
+    Devuelve el cliente de Drive v3 para estas credenciales.
+    build() es caro (arma el cliente desde el documento de discovery y abre conexiones nuevas),
+    así que se guarda uno por cuenta y por hilo (el cliente no es seguro entre hilos).
+    Todos los de una misma cuenta comparten las credenciales (credenciales.py): el token se
+    refresca antes de vencer y una sola vez, no una por hilo.
+    """
+    from . import drive_falso
+    falso = drive_falso.obtener() is not None
+    creds = None if falso else credenciales.obtener(creds_data)
+
+    servicios = getattr(_local, 'servicios', None)
+    if servicios is None:
+        servicios = _local.servicios = OrderedDict()
+
+    clave = clave_credencial(creds_data)
+    service = servicios.get(clave)
+    if service is None:
+        with etapa('drive_servicio'):
+            if falso:
+                # settings.DRIVE_FALSO: las llamadas las atiende el Drive en memoria (pruebas de carga).
+                service = build('drive', 'v3', http=drive_falso.HttpFalso(), cache_discovery=False, static_discovery=True)
+            else:
+                service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        servicios[clave] = service
+        if len(servicios) > MAX_SERVICIOS_POR_HILO:
+            servicios.popitem(last=False)
+    else:
+        servicios.move_to_end(clave)
+    return service
+
+
+def buscar_credenciales_guardadas(ruta=None):
+    """
+    Para los comandos de consola:
+    1. Si se indica un archivo JSON, lo lee (mismo formato que request.session['credentials']).
+    2. Si no, busca la sesión activa más reciente en la que alguien inició sesión con Google.
+    """
+    if ruta:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    sesiones = Session.objects.filter(expire_date__gt=timezone.now()).order_by('-expire_date')
+    for sesion in sesiones:
+        datos = sesion.get_decoded()
+        if datos.get('credentials'):
+            return datos['credentials']
+    return None
+
+
+def buscar_carpeta_raiz(service):
+    """Devuelve el id de la carpeta 'Genealogia' o None si todavía no existe."""
+    query_f = f"name = '{CARPETA_RAIZ}' and mimeType = '{MIME_CARPETA}' and trashed = false"
+    with etapa('drive_api'):
+        folders = service.files().list(q=query_f, fields="files(id)").execute().get('files', [])
+    return folders[0].get('id') if folders else None
+
+
+def listar_paginado(service, q, campos="id, name, mimeType"):
+    """
+    Recorre TODAS las páginas de files().list siguiendo nextPageToken
+    (sin esto Drive corta la respuesta en 100 archivos).
+    """
+    page_token = None
+    while True:
+        with etapa('drive_api'):
+            respuesta = service.files().list(
+                q=q,
+                fields=f"nextPageToken, files({campos})",
+                pageSize=1000,
+                pageToken=page_token,
+            ).execute()
+        yield from respuesta.get('files', [])
+        page_token = respuesta.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def obtener_fotos_recursivo(service, folder_id):
+    """
+    Función de apoyo: Busca fotos y entra en subcarpetas.
+    """
+    fotos_encontradas = []
+
+    # Buscamos tanto carpetas como imágenes dentro del ID actual
+    query = f"'{folder_id}' in parents and trashed = false"
+    results = listar_paginado(service, query)
+
+    for item in results:
+        if item['mimeType'] == MIME_CARPETA:
+            # Si es carpeta, entramos en ella (Recursividad)
+            fotos_encontradas.extend(obtener_fotos_recursivo(service, item['id']))
+        elif 'image/' in item['mimeType']:
+            # Si es foto, la agregamos a la lista
+            fotos_encontradas.append(item)
+
+    return fotos_encontradas
@@ -0,0 +1,228 @@
+import asyncio
+import random
+import weakref
+from datetime import datetime, timedelta, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+from django.conf import settings
+
+from . import credenciales, drive_falso
+from .credenciales import clave_credencial
+from .drive import CARPETA_RAIZ, MIME_CARPETA
+from .metricas import metricas
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Cliente asíncrono de Drive para las vistas async (core/asgi.py).
+# - Usa UNA sesión HTTP (httpx.AsyncClient) por credencial y por event loop: las conexiones
+#   TLS se reutilizan entre peticiones en vez de abrirse de nuevo cada vez.
+# - Un semáforo limita cuántas llamadas a Drive hay en vuelo a la vez (DRIVE_ASYNC_CONCURRENCIA).
+# - Los errores 429/5xx (y 403 por límite de cuota) se reintentan con espera exponencial.
+# - El access token es el de las credenciales compartidas del proceso (credenciales.py): se refresca
+#   antes de vencer y una sola vez aunque lo necesiten varias tareas, clientes o hilos a la vez.
+
+API = 'https://www.googleapis.com/drive/v3'
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+MOTIVOS_CUOTA = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+# event loop -> {clave de credencial: httpx.AsyncClient}. Si el loop desaparece, se va su entrada.
+_sesiones_http = weakref.WeakKeyDictionary()
+# event loop -> {clave de credencial: asyncio.Lock} para refrescar el token de a una tarea.
+_locks_token = weakref.WeakKeyDictionary()
+
+
+def _sesion_http(clave):
+    """Sesión HTTP compartida para esta credencial dentro del event loop actual."""
+    sesiones = _sesiones_http.setdefault(asyncio.get_running_loop(), {})
+    sesion = sesiones.get(clave)
+    if sesion is None or sesion.is_closed:
+        concurrencia = settings.DRIVE_ASYNC_CONCURRENCIA
+        sesion = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia),
+            transport=drive_falso.transporte_async() if drive_falso.obtener() is not None else None,
+        )
+        sesiones[clave] = sesion
+    return sesion
+
+
+def _lock_token(clave):
+    locks = _locks_token.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault(clave, asyncio.Lock())
+
+
+def _segundos_retry_after(valor):
+    """
+    Retry-After puede traer segundos ("120") o una fecha HTTP ("Wed, 21 Oct 2015 07:28:00 GMT").
+    Devuelve los segundos a esperar (como mucho 5 minutos) o 0 si no vino o no se entiende.
+    """
+    if not valor:
+        return 0
+    try:
+        segundos = float(valor)
+    except ValueError:
+        try:
+            fecha = parsedate_to_datetime(valor)
+        except (TypeError, ValueError):
+            return 0
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=dt_timezone.utc)
+        segundos = (fecha - datetime.now(dt_timezone.utc)).total_seconds()
+    return min(max(segundos, 0), 300)
+
+
+class ErrorDrive(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(f"Drive respondió {estado}: {mensaje}")
+        self.estado = estado
+
+
+class ClienteDriveAsync:
+    def __init__(self, creds_data, concurrencia=None):
+        self.creds_data = dict(creds_data)
+        self.clave = clave_credencial(creds_data)
+        self.semaforo = asyncio.Semaphore(concurrencia or settings.DRIVE_ASYNC_CONCURRENCIA)
+        self.credenciales = credenciales.registrar(creds_data)
+
+    #-----------------------------------------------------------------------------
+    async def _refrescar_token(self, token_viejo):
+        """
+        Pide un access token nuevo con el refresh token, una sola vez aunque lo pidan varias tareas
+        (mismo candado para todos los clientes de la cuenta en este event loop). Igual que
+        credenciales.refrescar: si otro hilo o proceso ya lo refrescó, se usa el suyo.
+        """
+        creds = self.credenciales
+        async with _lock_token(self.clave):
+            if creds.token != token_viejo or credenciales.adoptar_publicado(creds, token_viejo):
+                return
+            tengo_turno = credenciales.tomar_turno(self.clave)
+            if not tengo_turno:
+                for _ in range(credenciales.ESPERA_OTRO_PROCESO * 10):
+                    await asyncio.sleep(0.1)
+                    if credenciales.adoptar_publicado(creds, token_viejo):
+                        return
+            try:
+                respuesta = await _sesion_http(self.clave).post(self.creds_data['token_uri'], data={
+                    'grant_type': 'refresh_token',
+                    'refresh_token': self.creds_data['refresh_token'],
+                    'client_id': self.creds_data['client_id'],
+                    'client_secret': self.creds_data['client_secret'],
+                })
+                respuesta.raise_for_status()
+                datos = respuesta.json()
+                metricas.sumar('gr_credenciales_refrescos_total')
+                expiry = credenciales.ahora() + timedelta(seconds=datos.get('expires_in', 3600))
+                credenciales.publicar(creds, datos['access_token'], expiry)
+            finally:
+                if tengo_turno:
+                    credenciales.soltar_turno(self.clave)
+
+    @staticmethod
+    def _es_reintentable(respuesta):
+        if respuesta.status_code in ESTADOS_REINTENTABLES:
+            return True
+        if respuesta.status_code == 403:
+            try:
+                errores = respuesta.json()['error']['errors']
+            except (ValueError, KeyError, TypeError):
+                return False
+            return any(e.get('reason') in MOTIVOS_CUOTA for e in errores)
+        return False
+
+    async def _pedir(self, metodo, url, **kwargs):
+        """Hace la llamada respetando el límite de concurrencia y reintentando con backoff."""
+        reintentos = settings.DRIVE_REINTENTOS
+        refrescado = False
+        cabeceras = kwargs.pop('headers', {})
+        for intento in range(reintentos + 1):
+            token = self.credenciales.token
+            if credenciales.vence_pronto(self.credenciales.expiry) and self.creds_data.get('refresh_token'):
+                await self._refrescar_token(token)
+                token = self.credenciales.token
+            async with self.semaforo:
+                respuesta = await _sesion_http(self.clave).request(
+                    metodo, url, headers={**cabeceras, 'Authorization': f'Bearer {token}'}, **kwargs,
+                )
+            if respuesta.status_code == 401 and not refrescado and self.creds_data.get('refresh_token'):
+                await self._refrescar_token(token)
+                refrescado = True
+                continue
+            if self._es_reintentable(respuesta) and intento < reintentos:
+                espera = _segundos_retry_after(respuesta.headers.get('Retry-After')) or min(32, 2 ** intento) + random.random()
+                await asyncio.sleep(espera)
+                continue
+            if respuesta.is_error:
+                raise ErrorDrive(respuesta.status_code, respuesta.text[:300])
+            return respuesta
+        raise ErrorDrive(respuesta.status_code, "demasiados reintentos")
+
+    #-----------------------------------------------------------------------------
+    async def listar(self, q, campos="id, name, mimeType"):
+        """Todas las páginas de files.list para la consulta q."""
+        archivos, page_token = [], None
+        while True:
+            params = {'q': q, 'fields': f"nextPageToken, files({campos})", 'pageSize': 1000}
+            if page_token:
+                params['pageToken'] = page_token
+            datos = (await self._pedir('GET', f"{API}/files", params=params)).json()
+            archivos.extend(datos.get('files', []))
+            page_token = datos.get('nextPageToken')
+            if not page_token:
+                return archivos
+
+    async def buscar_carpeta_raiz(self):
+        q = f"name = '{CARPETA_RAIZ}' and mimeType = '{MIME_CARPETA}' and trashed = false"
+        carpetas = await self.listar(q, "id")
+        return carpetas[0]['id'] if carpetas else None
+
+    async def listar_recursivo(self, folder_id, campos="id, name, mimeType"):
+        """Como obtener_fotos_recursivo, pero cada nivel de subcarpetas se pide en paralelo."""
+        campos_completos = campos if 'mimeType' in campos else f"{campos}, mimeType"
+        items = await self.listar(f"'{folder_id}' in parents and trashed = false", campos_completos)
+        subcarpetas = [i['id'] for i in items if i['mimeType'] == MIME_CARPETA]
+        fotos = [i for i in items if 'image/' in i['mimeType']]
+        for resultado in await asyncio.gather(*(self.listar_recursivo(c, campos) for c in subcarpetas)):
+            fotos.extend(resultado)
+        return fotos
+
+    async def descargar(self, file_id):
+        respuesta = await self._pedir('GET', f"{API}/files/{file_id}", params={'alt': 'media'})
+        return respuesta.content
+
+    async def descargar_rango(self, file_id, desde, hasta):
+        """Sólo los bytes [desde, hasta) del archivo (cabecera HTTP Range); b'' si el archivo es más corto."""
+        try:
+            respuesta = await self._pedir(
+                'GET', f"{API}/files/{file_id}", params={'alt': 'media'},
+                headers={'Range': f"bytes={desde}-{hasta - 1}"},
+            )
+        except ErrorDrive as e:
+            if e.estado == 416:    # el rango empieza después del final del archivo
+                return b''
+            raise
+        return respuesta.content[:hasta - desde]
+
+    async def obtener(self, file_id, campos):
+        return (await self._pedir('GET', f"{API}/files/{file_id}", params={'fields': campos})).json()
+
+    async def descargar_miniatura(self, file_id):
+        """La miniatura que genera Drive (unos 220 px, pocos KB), o None si no tiene."""
+        datos = (await self._pedir('GET', f"{API}/files/{file_id}", params={'fields': 'thumbnailLink'})).json()
+        enlace = datos.get('thumbnailLink')
+        if not enlace:
+            return None
+        return (await self._pedir('GET', enlace)).content
+
+    async def mover(self, file_id, agregar, quitar):
+        params = {'addParents': agregar, 'removeParents': ",".join(quitar), 'fields': 'id, parents'}
+        return (await self._pedir('PATCH', f"{API}/files/{file_id}", params=params, json={})).json()
+
+    async def token_inicial_cambios(self):
+        datos = (await self._pedir('GET', f"{API}/changes/startPageToken")).json()
+        return datos['startPageToken']
+
+    async def listar_cambios(self, page_token, campos):
+        datos = (await self._pedir('GET', f"{API}/changes", params={
+            'pageToken': page_token, 'pageSize': 1000, 'spaces': 'drive', 'fields': campos,
+        })).json()
+        return datos
@@ -0,0 +1,420 @@
+import asyncio
+import email
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+
+from .drive import CARPETA_RAIZ, MIME_CARPETA
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Un Google Drive de mentira, en memoria, para medir y probar las vistas sin cuenta de Google
+# ni red (lo usa el comando prueba_carga; también sirve con runserver: DRIVE_FALSO=1).
+# - Arma un árbol de carpetas y fotos configurable (generado o descrito en un JSON) con fotos
+#   sintéticas o copiadas de una carpeta de imágenes de ejemplo.
+# - Atiende la parte de la API que usa la app: files.list (con los "q" que arma la app),
+#   files.get (metadatos y alt=media con Range), files.create, files.update, las peticiones
+#   batch, changes.getStartPageToken / changes.list y las miniaturas.
+# - Simula latencia, ancho de banda y errores 429 (rateLimitExceeded) al azar.
+# Se engancha en los dos clientes de la app: el de googleapiclient (drive.crear_servicio le pasa
+# http=HttpFalso()) y el de httpx (drive_async usa transporte_async()).
+
+RAIZ = 'root'
+URL_MINIATURAS = 'https://drive-falso.invalid/miniatura/'
+CREDENCIALES = {
+    'token': 'token-falso',
+    'refresh_token': 'refresh-falso',
+    'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'cliente-falso',
+    'client_secret': 'secreto-falso',
+    'scopes': ['https://www.googleapis.com/auth/drive'],
+}
+RAZONES = {200: 'OK', 206: 'Partial Content', 400: 'Bad Request', 404: 'Not Found', 416: 'Range Not Satisfiable', 429: 'Too Many Requests'}
+
+
+def arbol_de_prueba(carpetas=10, fotos_por_carpeta=20, sueltas=30):
+    """
+    Árbol por defecto: 'Genealogia' con 'carpetas' eventos de 'fotos_por_carpeta' fotos cada uno,
+    más 'sueltas' fotos en la raíz de "Mi unidad" (las que mueve organizar_drive).
+    Formato: cada carpeta es un dict; un número es "esa cantidad de fotos", una lista son nombres
+    de fotos, y la clave '_fotos' son las fotos que van directamente en esa carpeta.
+    """
+    return {
+        CARPETA_RAIZ: {f"Evento {i + 1:03d}": fotos_por_carpeta for i in range(carpetas)},
+        '_fotos': sueltas,
+    }
+
+
+class _Consulta:
+    """Evalúa los "q" de files.list que arma la app (cláusulas unidas por 'and', alternativas por 'or')."""
+
+    CLAUSULAS = [
+        (re.compile(r"^'([^']*)' in parents$"), lambda valor, archivo: valor in archivo.get('parents', [])),
+        (re.compile(r"^name = '([^']*)'$"), lambda valor, archivo: archivo['name'] == valor),
+        (re.compile(r"^mimeType = '([^']*)'$"), lambda valor, archivo: archivo['mimeType'] == valor),
+        (re.compile(r"^mimeType contains '([^']*)'$"), lambda valor, archivo: valor in archivo['mimeType']),
+        (re.compile(r"^trashed = (true|false)$"), lambda valor, archivo: archivo.get('trashed', False) == (valor == 'true')),
+    ]
+
+    def __init__(self, q):
+        self.condiciones = []
+        for parte in re.split(r"\s+and\s+", (q or '').strip()):
+            parte = parte.strip()
+            if parte.startswith('(') and parte.endswith(')'):
+                parte = parte[1:-1]
+            if parte:
+                self.condiciones.append([self._clausula(alternativa.strip()) for alternativa in re.split(r"\s+or\s+", parte)])
+
+    def _clausula(self, texto):
+        for patron, evaluar in self.CLAUSULAS:
+            coincide = patron.match(texto)
+            if coincide:
+                return lambda archivo, valor=coincide.group(1), evaluar=evaluar: evaluar(valor, archivo)
+        raise ValueError(f"Consulta no soportada por el Drive falso: {texto}")
+
+    def __call__(self, archivo):
+        return all(any(cumple(archivo) for cumple in alternativas) for alternativas in self.condiciones)
+
+
+class DriveFalso:
+    def __init__(self, arbol=None, latencia_ms=0, variacion_ms=0, tasa_429=0.0, mbps=0,
+                 imagenes=None, lado_foto=1600, semilla=0, config=None):
+        self.latencia = latencia_ms / 1000
+        self.variacion = variacion_ms / 1000
+        self.tasa_429 = tasa_429
+        self.bytes_por_segundo = mbps * 125_000 if mbps else 0
+        self.config = config
+        self.lado_foto = lado_foto
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+
+        self.archivos = {}        # id -> metadatos, tal como los devuelve la API
+        self._contenido = {}      # id de foto -> índice de la imagen base
+        self.cambios = []         # ids modificados, en orden (el page token N es "desde el cambio N")
+        self.llamadas = Counter()
+        self.errores_429 = 0
+        self.bytes_servidos = 0
+
+        self._bases, self._miniaturas, self._generadas = self._cargar_imagenes(imagenes, lado_foto)
+        self._crear(arbol if arbol is not None else arbol_de_prueba(), RAIZ)
+
+    @classmethod
+    def desde_config(cls, config):
+        """settings.DRIVE_FALSO: '1' (árbol por defecto), la ruta de un JSON o un dict con los argumentos."""
+        opciones = config
+        if isinstance(config, str):
+            if config.lower() in ('1', 'true', 'si', 'sí'):
+                opciones = {}
+            else:
+                with open(config, encoding='utf-8') as archivo:
+                    opciones = json.load(archivo)
+        return cls(**opciones, config=config)
+
+    #-----------------------------------------------------------------------------
+    @staticmethod
+    def _cargar_imagenes(carpeta, lado):
+        """Fotos base (bytes) y sus miniaturas: de la carpeta de ejemplos o generadas con Pillow."""
+        from PIL import Image, ImageDraw
+
+        bases = []
+        if carpeta:
+            for nombre in sorted(os.listdir(carpeta)):
+                if nombre.lower().endswith(('.jpg', '.jpeg', '.png')):
+                    with open(os.path.join(carpeta, nombre), 'rb') as archivo:
+                        bases.append(archivo.read())
+        generadas = not bases
+        if generadas:
+            for n in range(6):
+                azar = random.Random(n)
+                alto = lado * 3 // 4
+                img = Image.new('RGB', (lado, alto), tuple(azar.randrange(80, 220) for _ in range(3)))
+                dibujo = ImageDraw.Draw(img)
+                for _ in range(12):
+                    x, y, radio = azar.randrange(lado), azar.randrange(alto), azar.randrange(lado // 40, lado // 8)
+                    dibujo.ellipse((x - radio, y - radio, x + radio, y + radio), fill=tuple(azar.randrange(256) for _ in range(3)))
+                # Con algo de ruido el JPEG pesa como una foto de verdad (cientos de KB), no como un dibujo plano.
+                ruido = Image.effect_noise((lado, alto), 40)
+                img = Image.blend(img, Image.merge('RGB', [ruido] * 3), 0.2)
+                salida = io.BytesIO()
+                img.save(salida, 'JPEG', quality=88)
+                bases.append(salida.getvalue())
+
+        miniaturas = []
+        for datos in bases:
+            img = Image.open(io.BytesIO(datos)).convert('RGB')
+            img.thumbnail((220, 220))
+            salida = io.BytesIO()
+            img.save(salida, 'JPEG', quality=80)
+            miniaturas.append(salida.getvalue())
+        return bases, miniaturas, generadas
+
+    def _nuevo_id(self):
+        return f"falso-{len(self.archivos) + 1:06d}"
+
+    def _crear(self, nodo, padre):
+        if isinstance(nodo, int):
+            nodo = [f"foto_{len(self.archivos) + i + 1:06d}.jpg" for i in range(nodo)]
+        if isinstance(nodo, list):
+            for nombre in nodo:
+                self._agregar_foto(nombre, padre)
+            return
+        for nombre, hijo in nodo.items():
+            if nombre == '_fotos':
+                self._crear(hijo, padre)
+            else:
+                self._crear(hijo, self._agregar({'name': nombre, 'mimeType': MIME_CARPETA, 'parents': [padre]}))
+
+    def _agregar(self, datos):
+        archivo = {
+            'id': self._nuevo_id(), 'trashed': False,
+            'modifiedTime': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()), **datos,
+        }
+        self.archivos[archivo['id']] = archivo
+        self.cambios.append(archivo['id'])
+        return archivo['id']
+
+    def _agregar_foto(self, nombre, padre):
+        n = len(self._contenido)
+        base = n % len(self._bases)
+        datos = {'name': nombre, 'mimeType': 'image/jpeg', 'parents': [padre]}
+        if self._generadas:
+            # Las fotos sintéticas no traen EXIF: Drive "las leyó" y devuelve una fecha repartida en 80 años.
+            datos['imageMediaMetadata'] = {
+                'time': f"{1940 + n % 80}:{n % 12 + 1:02d}:15 12:00:00", 'rotation': 0,
+                'width': self.lado_foto, 'height': self.lado_foto * 3 // 4,
+            }
+        archivo_id = self._agregar(datos)
+        self._contenido[archivo_id] = base
+        contenido = self.contenido(archivo_id)
+        self.archivos[archivo_id].update({
+            'md5Checksum': hashlib.md5(contenido).hexdigest(), 'size': str(len(contenido)),
+            'thumbnailLink': f"{URL_MINIATURAS}{archivo_id}",
+        })
+
+    def contenido(self, archivo_id):
+        # Cada foto es una de las imágenes base con su id agregado después del final del JPEG
+        # (los decodificadores lo ignoran): md5 distinto por foto sin guardar una copia de cada una.
+        return self._bases[self._contenido[archivo_id]] + archivo_id.encode()
+
+    def fotos(self):
+        return [archivo_id for archivo_id in self._contenido if not self.archivos[archivo_id].get('trashed')]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'llamadas': dict(self.llamadas), 'total_llamadas': sum(self.llamadas.values()),
+                'errores_429': self.errores_429, 'bytes_servidos': self.bytes_servidos,
+            }
+
+    #-----------------------------------------------------------------------------
+    def demora(self, bytes_enviados=0):
+        """Segundos que "tarda la red" en contestar: latencia, variación al azar y ancho de banda."""
+        with self._lock:
+            variacion = self._azar.uniform(0, self.variacion) if self.variacion else 0
+        transferencia = bytes_enviados / self.bytes_por_segundo if self.bytes_por_segundo else 0
+        return self.latencia + variacion + transferencia
+
+    def atender(self, metodo, url, cabeceras, cuerpo):
+        """Versión bloqueante (googleapiclient): responde y espera la demora simulada."""
+        estado, cabeceras_respuesta, contenido = self.responder(metodo, url, cabeceras, cuerpo)
+        time.sleep(self.demora(len(contenido)))
+        return estado, cabeceras_respuesta, contenido
+
+    def responder(self, metodo, url, cabeceras, cuerpo):
+        """Atiende una petición HTTP a la API y devuelve (estado, cabeceras, bytes)."""
+        cabeceras = {clave.lower(): valor for clave, valor in (cabeceras or {}).items()}
+        if isinstance(cuerpo, str):
+            cuerpo = cuerpo.encode()
+        partes = urlsplit(url)
+        if partes.path == '/batch/drive/v3':
+            with self._lock:
+                self.llamadas['batch'] += 1
+            return self._batch(cabeceras, cuerpo or b'')
+
+        with self._lock:
+            if self.tasa_429 and self._azar.random() < self.tasa_429:
+                self.errores_429 += 1
+                return self._error(429, 'Rate Limit Exceeded', 'rateLimitExceeded')
+        parametros = {clave: valores[0] for clave, valores in parse_qs(partes.query, keep_blank_values=True).items()}
+        ruta = partes.path.removeprefix('/drive/v3')
+        try:
+            return self._rutear(metodo.upper(), ruta, parametros, cabeceras, cuerpo, url)
+        except ValueError as e:
+            return self._error(400, str(e), 'invalid')
+
+    def _rutear(self, metodo, ruta, parametros, cabeceras, cuerpo, url):
+        if url.startswith(URL_MINIATURAS):
+            return self._contar('miniatura', self._miniatura(url[len(URL_MINIATURAS):]))
+        if ruta == '/files' and metodo == 'GET':
+            return self._contar('files.list', self._listar(parametros))
+        if ruta == '/files' and metodo == 'POST':
+            return self._contar('files.create', self._crear_archivo(cuerpo))
+        if ruta.startswith('/files/'):
+            archivo_id = ruta[len('/files/'):]
+            if metodo == 'GET' and parametros.get('alt') == 'media':
+                return self._contar('files.get_media', self._descargar(archivo_id, cabeceras.get('range')))
+            if metodo == 'GET':
+                return self._contar('files.get', self._obtener(archivo_id))
+            if metodo == 'PATCH':
+                return self._contar('files.update', self._actualizar(archivo_id, parametros))
+        if ruta == '/changes/startPageToken':
+            return self._contar('changes.getStartPageToken', self._json({'startPageToken': str(len(self.cambios) + 1)}))
+        if ruta == '/changes':
+            return self._contar('changes.list', self._listar_cambios(parametros))
+        return self._error(404, f"{metodo} {ruta} no existe en el Drive falso", 'notFound')
+
+    def _contar(self, operacion, respuesta):
+        with self._lock:
+            self.llamadas[operacion] += 1
+            self.bytes_servidos += len(respuesta[2])
+        return respuesta
+
+    @staticmethod
+    def _json(datos, estado=200):
+        return estado, {'content-type': 'application/json; charset=UTF-8'}, json.dumps(datos).encode()
+
+    def _error(self, estado, mensaje, motivo):
+        return self._json({'error': {'code': estado, 'message': mensaje, 'errors': [{'reason': motivo, 'message': mensaje}]}}, estado)
+
+    #-----------------------------------------------------------------------------
+    def _listar(self, parametros):
+        consulta = _Consulta(parametros.get('q'))
+        tamano = min(int(parametros.get('pageSize') or 100), 1000)
+        desde = int(parametros.get('pageToken') or 0)
+        with self._lock:
+            encontrados = [dict(archivo) for archivo in self.archivos.values() if consulta(archivo)]
+        respuesta = {'files': encontrados[desde:desde + tamano]}
+        if desde + tamano < len(encontrados):
+            respuesta['nextPageToken'] = str(desde + tamano)
+        return self._json(respuesta)
+
+    def _obtener(self, archivo_id):
+        with self._lock:
+            archivo = self.archivos.get(archivo_id)
+            archivo = dict(archivo) if archivo else None
+        return self._json(archivo) if archivo else self._error(404, f"File not found: {archivo_id}", 'notFound')
+
+    def _crear_archivo(self, cuerpo):
+        datos = json.loads(cuerpo or b'{}')
+        with self._lock:
+            archivo_id = self._agregar({
+                'name': datos.get('name', 'Sin nombre'), 'mimeType': datos.get('mimeType', 'application/octet-stream'),
+                'parents': datos.get('parents') or [RAIZ],
+            })
+            return self._json(dict(self.archivos[archivo_id]))
+
+    def _actualizar(self, archivo_id, parametros):
+        with self._lock:
+            archivo = self.archivos.get(archivo_id)
+            if archivo is None:
+                return self._error(404, f"File not found: {archivo_id}", 'notFound')
+            quitar = set(filter(None, parametros.get('removeParents', '').split(',')))
+            agregar = [padre for padre in parametros.get('addParents', '').split(',') if padre]
+            archivo['parents'] = [padre for padre in archivo['parents'] if padre not in quitar] + agregar
+            self.cambios.append(archivo_id)
+            return self._json({'id': archivo_id, 'parents': list(archivo['parents'])})
+
+    def _descargar(self, archivo_id, rango):
+        if archivo_id not in self._contenido:
+            return self._error(404, f"File not found: {archivo_id}", 'notFound')
+        contenido = self.contenido(archivo_id)
+        total = len(contenido)
+        if not rango:
+            return 200, {'content-type': 'image/jpeg', 'content-length': str(total)}, contenido
+        coincide = re.match(r'bytes=(\d+)-(\d*)', rango)
+        desde = int(coincide.group(1))
+        hasta = min(int(coincide.group(2)) if coincide.group(2) else total - 1, total - 1)
+        if desde >= total:
+            return 416, {'content-range': f"bytes */{total}"}, b''
+        parte = contenido[desde:hasta + 1]
+        return 206, {
+            'content-type': 'image/jpeg', 'content-length': str(len(parte)),
+            'content-range': f"bytes {desde}-{hasta}/{total}",
+        }, parte
+
+    def _miniatura(self, archivo_id):
+        if archivo_id not in self._contenido:
+            return self._error(404, f"File not found: {archivo_id}", 'notFound')
+        return 200, {'content-type': 'image/jpeg'}, self._miniaturas[self._contenido[archivo_id]]
+
+    def _listar_cambios(self, parametros):
+        desde = int(parametros.get('pageToken') or 1) - 1
+        tamano = min(int(parametros.get('pageSize') or 100), 1000)
+        with self._lock:
+            tramo = self.cambios[desde:desde + tamano]
+            cambios = [{'fileId': archivo_id, 'removed': False, 'file': dict(self.archivos[archivo_id])} for archivo_id in tramo]
+            respuesta = {'changes': cambios}
+            if desde + tamano >= len(self.cambios):
+                respuesta['newStartPageToken'] = str(len(self.cambios) + 1)
+            else:
+                respuesta['nextPageToken'] = str(desde + tamano + 1)
+        return self._json(respuesta)
+
+    def _batch(self, cabeceras, cuerpo):
+        """Petición batch (multipart/mixed): cada parte se atiende por separado, con su propio 429 posible."""
+        mensaje = email.message_from_bytes(f"Content-Type: {cabeceras.get('content-type', '')}\r\n\r\n".encode() + cuerpo)
+        limite = f"batch_falso_{uuid.uuid4().hex}"
+        salida = []
+        for parte in mensaje.get_payload():
+            texto = parte.get_payload(decode=False).replace('\r\n', '\n')
+            linea, _, resto = texto.partition('\n')
+            metodo, ruta, _ = linea.split(' ', 2)
+            _, _, cuerpo_parte = resto.partition('\n\n')
+            estado, _, contenido = self.responder(metodo, f"https://www.googleapis.com{ruta}", {}, cuerpo_parte.encode())
+            salida.append(
+                f"--{limite}\r\nContent-Type: application/http\r\nContent-ID: <response-{parte['Content-ID'][1:]}\r\n\r\n"
+                f"HTTP/1.1 {estado} {RAZONES.get(estado, '')}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{contenido.decode()}\r\n"
+            )
+        contenido = (''.join(salida) + f"--{limite}--").encode()
+        return 200, {'content-type': f"multipart/mixed; boundary={limite}"}, contenido
+
+
+#---------------------------------------------------------------------------------
+_instancia = None
+_lock = threading.Lock()
+
+
+def obtener():
+    """El Drive falso activo según settings.DRIVE_FALSO, o None si se usa el Drive de verdad."""
+    global _instancia
+    config = getattr(settings, 'DRIVE_FALSO', None)
+    if not config:
+        return None
+    with _lock:
+        if _instancia is None or _instancia.config is not config:
+            _instancia = DriveFalso.desde_config(config)
+        return _instancia
+
+
+class HttpFalso:
+    """Reemplaza a httplib2.Http en build(..., http=HttpFalso()): cada petición la atiende el Drive falso activo."""
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        import httplib2
+
+        estado, cabeceras, contenido = obtener().atender(method, uri, headers, body)
+        return httplib2.Response({'status': estado, **cabeceras}), contenido
+
+
+def transporte_async():
+    """Transporte de httpx para drive_async: las peticiones van al Drive falso, con la demora en await."""
+    import httpx
+
+    async def manejar(peticion):
+        falso = obtener()
+        cuerpo = await peticion.aread()
+        estado, cabeceras, contenido = falso.responder(peticion.method, str(peticion.url), dict(peticion.headers), cuerpo)
+        await asyncio.sleep(falso.demora(len(contenido)))
+        return httpx.Response(estado, headers=cabeceras, content=contenido)
+
+    return httpx.MockTransport(manejar)
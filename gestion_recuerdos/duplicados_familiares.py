@@ -0,0 +1,292 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+from itertools import combinations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .arbol import obtener_arbol, olvidar_arbol
+from .indice_rostros import indice_si_cargado, obtener_indice
+from .models import Familiar, PosibleDuplicado, Relacion, RostroDetectado
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Encuentra familiares cargados dos veces ("José Gonzalez" y "Jose González", o la misma
+# persona importada de dos GEDCOM) sin comparar a todos contra todos:
+# 1. Cada persona recibe unas pocas "claves de bloque" (código fonético del apellido y del
+#    nombre, año de nacimiento). Sólo se comparan las personas que comparten alguna clave.
+# 2. Cada par candidato se puntúa con el parecido de los nombres, de las fechas y, si los dos
+#    tienen rostros guardados, de sus embeddings.
+# 3. Los pares con puntaje alto quedan en PosibleDuplicado para que una persona decida;
+#    fusionar mueve rostros y relaciones en una sola transacción.
+
+MAX_BLOQUE = 300      # un bloque más grande (un apellido muy común sin más datos) se salta
+PESOS = {'nombre': 0.5, 'fecha': 0.25, 'rostro': 0.25}
+
+
+def _normalizar(texto):
+    """Minúsculas, sin tildes ni signos; la ñ se conserva como 'ny'."""
+    texto = (texto or '').lower().replace('ñ', 'ny')
+    texto = unicodedata.normalize('NFD', texto)
+    texto = ''.join(c for c in texto if unicodedata.category(c) != 'Mn')
+    return re.sub(r'[^a-z ]', '', texto).strip()
+
+
+_REGLAS_FONETICAS = [
+    (r'ch', 'X'),               # la "ch" es un sonido propio (se marca en mayúscula para no tocarla)
+    (r'ph', 'f'),
+    (r'll', 'y'),
+    (r'qu', 'k'),
+    (r'g(?=[ei])', 'j'),        # gente / jente
+    (r'gu(?=[ei])', 'g'),       # guerra / gerra
+    (r'c(?=[ei])', 's'),        # cecilia / sesilia
+    (r'c', 'k'),
+    (r'z', 's'),
+    (r'[vw]', 'b'),
+    (r'h', ''),                 # muda
+    (r'x', 'ks'),
+    (r'y(?![aeiou])', 'i'),     # rey / rei
+    (r'n(?=[bp])', 'm'),
+]
+_REGLAS_FONETICAS = [(re.compile(patron), reemplazo) for patron, reemplazo in _REGLAS_FONETICAS]
+
+
+@lru_cache(maxsize=50_000)
+def clave_fonetica(texto, largo=6):
+    """
+    Código fonético pensado para el español: 'Gonzalez', 'González' y 'Gonsales' dan lo mismo.
+    Se queda con la primera letra (ya convertida) y las consonantes que siguen, sin repetidas.
+    """
+    texto = _normalizar(texto).replace(' ', '')
+    for patron, reemplazo in _REGLAS_FONETICAS:
+        texto = patron.sub(reemplazo, texto)
+    if not texto:
+        return ''
+    codigo = texto[0] + re.sub(r'[aeiou]', '', texto[1:])
+    codigo = re.sub(r'(.)\1+', r'\1', codigo)
+    return codigo[:largo].upper()
+
+
+#---------------------------------------------------------------------------------
+class Ficha:
+    """Lo que se compara de un familiar, normalizado una sola vez (no en cada par)."""
+    __slots__ = ('id', 'nombre', 'apellido', 'fecha', 'fon_nombre', 'fon_apellido')
+
+    def __init__(self, familiar_id, nombre, apellido, fecha):
+        self.id = familiar_id
+        self.nombre = _normalizar(nombre)
+        self.apellido = _normalizar(apellido)
+        self.fecha = fecha
+        self.fon_nombre = clave_fonetica(self.nombre.split(' ')[0] if self.nombre else '')
+        self.fon_apellido = clave_fonetica(self.apellido.split(' ')[0] if self.apellido else '')
+
+    def claves_de_bloque(self):
+        """Las claves que comparten dos registros de la misma persona aunque uno tenga un error."""
+        claves = [('n', self.fon_apellido, self.fon_nombre)]
+        if self.fecha:
+            claves.append(('a', self.fon_apellido, self.fecha.year))
+            claves.append(('p', self.fon_nombre, self.fecha.year))
+        return claves
+
+
+def _parecido_textos(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return _ratio(a, b) if a < b else _ratio(b, a)
+
+
+@lru_cache(maxsize=200_000)
+def _ratio(a, b):
+    # Los nombres se repiten muchísimo (Juan, María, González...): cada par se calcula una sola vez.
+    comparador = SequenceMatcher(None, a, b)
+    if comparador.real_quick_ratio() < 0.5 or comparador.quick_ratio() < 0.5:
+        return 0.0      # cotas baratas: textos tan distintos no son variantes de escritura
+    return comparador.ratio()
+
+
+def parecido_nombres(a, b):
+    """
+    0..1 entre dos fichas. Nombre y apellido se comparan por separado: que se parezca
+    sólo el apellido (hermanos, primos) no alcanza. Si a alguno le falta el apellido,
+    se comparan los nombres completos (por si el apellido quedó escrito dentro del nombre).
+    """
+    if not a.apellido or not b.apellido:
+        return _parecido_textos(f"{a.nombre} {a.apellido}".strip(), f"{b.nombre} {b.apellido}".strip())
+    nombre = max(_parecido_textos(a.nombre, b.nombre), 0.9 if a.fon_nombre == b.fon_nombre else 0.0)
+    apellido = max(_parecido_textos(a.apellido, b.apellido), 0.9 if a.fon_apellido == b.fon_apellido else 0.0)
+    return min(nombre, apellido) * 0.5 + (nombre + apellido) * 0.25
+
+
+def parecido_fechas(a, b):
+    """0..1, o None si falta alguna de las dos (no suma ni resta)."""
+    if not a or not b:
+        return None
+    if a == b:
+        return 1.0
+    if a.year == b.year:
+        return 0.6      # mismo año: probablemente un error en el día o el mes
+    if abs(a.year - b.year) <= 2:
+        return 0.4
+    return 0.0
+
+
+def parecido_rostros(a, b, umbral=None):
+    """0..1 a partir de la similitud coseno de los rostros promedio; None si alguno no tiene rostros."""
+    if a is None or b is None:
+        return None
+    if umbral is None:
+        umbral = getattr(settings, 'UMBRAL_SIMILITUD_ROSTROS', 0.363)
+    return min(1.0, max(0.0, float(a @ b) / umbral))
+
+
+def puntuar(a, b, centroides):
+    """a, b: fichas. Devuelve (puntaje, detalle)."""
+    detalle = {
+        'nombre': parecido_nombres(a, b),
+        'fecha': parecido_fechas(a.fecha, b.fecha),
+        'rostro': parecido_rostros(centroides.get(a.id), centroides.get(b.id)),
+    }
+    presentes = {parte: valor for parte, valor in detalle.items() if valor is not None}
+    peso_total = sum(PESOS[parte] for parte in presentes)
+    puntaje = sum(PESOS[parte] * valor for parte, valor in presentes.items()) / peso_total
+    return round(puntaje, 4), {parte: round(valor, 4) for parte, valor in presentes.items()}
+
+
+def buscar_duplicados(umbral=None):
+    """
+    Línea por línea:
+    1. Lee id, nombre, apellido y fecha de todos los familiares (una consulta) y los reparte en bloques.
+    2. Compara sólo los pares dentro de cada bloque, salteando los que ya son padre/hijo/pareja.
+    3. Guarda (o actualiza el puntaje de) los pares que superan el umbral. Los DESCARTADO siguen descartados.
+    Devuelve un dict con los contadores.
+    """
+    if umbral is None:
+        umbral = getattr(settings, 'FAMILIARES_UMBRAL_DUPLICADO', 0.8)
+    personas, bloques = {}, {}
+    for familiar_id, nombre, apellido, fecha in Familiar.objects.values_list(
+        'id', 'nombre', 'apellido', 'fecha_nacimiento',
+    ).iterator(chunk_size=5000):
+        personas[familiar_id] = ficha = Ficha(familiar_id, nombre, apellido, fecha)
+        for clave in ficha.claves_de_bloque():
+            bloques.setdefault(clave, []).append(familiar_id)
+
+    candidatos, saltados = set(), 0
+    for miembros in bloques.values():
+        if len(miembros) > MAX_BLOQUE:
+            saltados += 1
+            continue
+        candidatos.update(combinations(sorted(miembros), 2))
+
+    arbol = obtener_arbol()
+    candidatos = {
+        (a, b) for a, b in candidatos
+        if b not in arbol.padres.get(a, ()) and b not in arbol.hijos.get(a, ()) and b not in arbol.parejas.get(a, ())
+    }
+    centroides = obtener_indice().centroides({p for par in candidatos for p in par}) if candidatos else {}
+
+    encontrados = []
+    for a, b in candidatos:
+        puntaje, detalle = puntuar(personas[a], personas[b], centroides)
+        if puntaje >= umbral:
+            encontrados.append(PosibleDuplicado(familiar_a_id=a, familiar_b_id=b, puntaje=puntaje, detalle=detalle))
+    PosibleDuplicado.objects.bulk_create(
+        encontrados, batch_size=500, update_conflicts=True,
+        unique_fields=['familiar_a', 'familiar_b'], update_fields=['puntaje', 'detalle'],
+    )
+    return {
+        'personas': len(personas), 'comparados': len(candidatos),
+        'posibles': len(encontrados), 'bloques_saltados': saltados,
+    }
+
+
+#---------------------------------------------------------------------------------
+def _descendientes_en_bd(ids):
+    """Todos los descendientes de esas personas, leídos de la tabla Relacion (una consulta por generación)."""
+    vistos, frontera = set(), set(ids)
+    while frontera:
+        hijos = set(
+            Relacion.objects.filter(tipo='PROGENITOR', origen_id__in=frontera).values_list('destino_id', flat=True)
+        )
+        frontera = hijos - vistos
+        vistos |= frontera
+    return vistos
+
+
+def _crearia_ciclo(conservar_id, eliminar_id):
+    """
+    True si al unir las dos personas alguien terminaría siendo ancestro de sí mismo.
+    Mira las relaciones guardadas, no el árbol en memoria: éste puede estar atrasado respecto de
+    lo que otro proceso acaba de guardar.
+    """
+    abajo = _descendientes_en_bd({conservar_id, eliminar_id})
+    if conservar_id in abajo or eliminar_id in abajo:
+        return True
+    padres = Relacion.objects.filter(tipo='PROGENITOR', destino_id__in=(conservar_id, eliminar_id))
+    return bool(set(padres.values_list('origen_id', flat=True)) & abajo)
+
+
+def fusionar_familiares(conservar_id, eliminar_id):
+    """
+    Junta 'eliminar' dentro de 'conservar' en UNA transacción:
+    - sus rostros pasan a conservar (un solo UPDATE),
+    - sus relaciones se re-apuntan a conservar (sin bucles ni repetidas),
+    - los datos que a conservar le faltan (apellido, fecha, xref...) se toman de eliminar,
+    - y eliminar se borra. Si algo falla, no cambia nada.
+    Lanza ValueError si la fusión dejaría un ciclo en el árbol.
+    """
+    if conservar_id == eliminar_id:
+        raise ValueError("No se puede fusionar a una persona consigo misma")
+
+    with transaction.atomic():
+        conservar = Familiar.objects.select_for_update().get(id=conservar_id)
+        eliminar = Familiar.objects.select_for_update().get(id=eliminar_id)
+        # Con las dos personas bloqueadas y dentro de la transacción: nadie cambia sus relaciones
+        # entre la revisión y la fusión.
+        if _crearia_ciclo(conservar.id, eliminar.id):
+            raise ValueError("Fusionarlos dejaría a alguien como ancestro de sí mismo: revisen las relaciones primero.")
+
+        rostros = list(RostroDetectado.objects.filter(familiar_id=eliminar.id).values_list('id', flat=True))
+        RostroDetectado.objects.filter(id__in=rostros).update(familiar=conservar, fecha_modificacion=timezone.now())
+
+        relaciones = list(Relacion.objects.filter(Q(origen_id=eliminar.id) | Q(destino_id=eliminar.id)))
+        nuevas = []
+        for relacion in relaciones:
+            origen = conservar.id if relacion.origen_id == eliminar.id else relacion.origen_id
+            destino = conservar.id if relacion.destino_id == eliminar.id else relacion.destino_id
+            if origen == destino:
+                continue
+            if relacion.tipo == 'PAREJA' and origen > destino:
+                origen, destino = destino, origen
+            nuevas.append(Relacion(origen_id=origen, destino_id=destino, tipo=relacion.tipo))
+        Relacion.objects.filter(id__in=[r.id for r in relaciones]).delete()
+        Relacion.objects.bulk_create(nuevas, ignore_conflicts=True)
+
+        conservar.apellido = conservar.apellido or eliminar.apellido
+        conservar.fecha_nacimiento = conservar.fecha_nacimiento or eliminar.fecha_nacimiento
+        conservar.parentesco = conservar.parentesco or eliminar.parentesco
+        if eliminar.biografia and eliminar.biografia not in conservar.biografia:
+            conservar.biografia = '\n\n'.join(t for t in (conservar.biografia, eliminar.biografia) if t)
+        heredados = {
+            campo: getattr(eliminar, campo) for campo in ('face_id', 'gedcom_xref')
+            if not getattr(conservar, campo) and getattr(eliminar, campo)
+        }
+        eliminar.delete()           # también borra sus pares en PosibleDuplicado
+        for campo, valor in heredados.items():
+            setattr(conservar, campo, valor)   # recién ahora: los dos campos son únicos
+        conservar.save()
+
+        def al_confirmar():
+            # bulk_create y update() no disparan señales: el árbol y el índice se ponen al día a mano.
+            olvidar_arbol()
+            indice = indice_si_cargado()
+            if indice is not None:
+                for rostro in RostroDetectado.objects.filter(id__in=rostros).only('id', 'familiar_id', 'embedding'):
+                    indice.actualizar(rostro)
+
+        transaction.on_commit(al_confirmar)
+    return conservar
@@ -0,0 +1,366 @@
+import functools
+import re
+import secrets
+from collections import defaultdict
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Q
+
+from .arbol import olvidar_arbol
+from .busqueda import reconstruir_indice
+from .models import Configuracion, Familiar, Relacion
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Intercambio con otros programas de genealogía en formato GEDCOM (5.5.1 y 7).
+# - Lectura: el archivo se recorre línea por línea y se arma de a UN registro (INDI, FAM...)
+#   por vez, así un archivo de cientos de MB ocupa siempre la misma memoria.
+#   Las personas se guardan en lotes con bulk_create; el xref del archivo (@I12@) queda en
+#   Familiar.gedcom_xref, y volver a importar el mismo archivo actualiza en vez de duplicar.
+# - Escritura: un generador que va devolviendo el texto por bloques (para StreamingHttpResponse
+#   o para escribir a un archivo) sin armar el GEDCOM entero en memoria. Las personas y las
+#   familias se arman de a LOTE_EXPORTAR personas: la memoria no crece con el tamaño del árbol.
+# - Los familiares cargados a mano reciben al guardarse un xref propio de esta instalación
+#   (xref_local), que un archivo de otro programa no puede traer: importarlo nunca pisa a nadie.
+
+LOTE = 2000
+LOTE_EXPORTAR = 500
+CLAVE_PREFIJO = 'gedcom_prefijo'
+
+MESES = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+_LINEA = re.compile(r'^\s*(\d+)\s+(?:@([^@]+)@\s+)?(\S+)(?: (.*))?$')
+_FECHA = re.compile(r'^(\d{1,2}) ([A-Z]{3}) (\d{3,4})$')
+_NOMBRE = re.compile(r'^(.*?)\s*/([^/]*)/')
+_PUNTERO = re.compile(r'@[^@\s]+@')
+
+
+class Nodo:
+    """Una línea GEDCOM con sus sub-líneas: tag, valor (texto ya unido con CONT/CONC) e hijos."""
+    __slots__ = ('tag', 'valor', 'hijos')
+
+    def __init__(self, tag, valor):
+        self.tag = tag
+        self.valor = valor
+        self.hijos = []
+
+    def primero(self, tag):
+        return next((h for h in self.hijos if h.tag == tag), None)
+
+    def valor_de(self, tag):
+        hijo = self.primero(tag)
+        return hijo.valor if hijo else ''
+
+    def todos(self, tag):
+        return [h for h in self.hijos if h.tag == tag]
+
+
+def leer_registros(archivo):
+    """
+    Genera (xref, nodo) por cada registro de nivel 0 del archivo (abierto en modo texto).
+    Sólo el registro actual está en memoria.
+    """
+    xref, pila = None, []
+    for numero, linea in enumerate(archivo, 1):
+        linea = linea.rstrip('\r\n').lstrip('\ufeff')
+        if not linea.strip():
+            continue
+        partes = _LINEA.match(linea)
+        if not partes:
+            raise ValueError(f"Línea {numero} no es GEDCOM válido: {linea[:80]!r}")
+        nivel, xref_linea, tag, valor = int(partes[1]), partes[2], partes[3].upper(), partes[4] or ''
+        if valor.startswith('@@'):
+            valor = valor[1:]
+
+        if nivel == 0:
+            if pila:
+                yield xref, pila[0]
+            xref, pila = xref_linea, [Nodo(tag, valor)]
+            continue
+        if nivel > len(pila):
+            raise ValueError(f"Línea {numero}: salta del nivel {len(pila) - 1} al {nivel}")
+        del pila[nivel:]
+        padre = pila[-1]
+        if tag == 'CONT':
+            padre.valor += '\n' + valor
+        elif tag == 'CONC':
+            padre.valor += valor
+        else:
+            nodo = Nodo(tag, valor)
+            padre.hijos.append(nodo)
+            pila.append(nodo)
+    if pila:
+        yield xref, pila[0]
+
+
+def leer_fecha(texto):
+    """'12 MAR 1950' -> date. Las fechas aproximadas o incompletas (ABT 1900, MAR 1950) -> None."""
+    partes = _FECHA.match(texto.strip().upper())
+    if not partes or partes[2] not in MESES:
+        return None
+    try:
+        return date(int(partes[3]), MESES.index(partes[2]) + 1, int(partes[1]))
+    except ValueError:
+        return None
+
+
+def escribir_fecha(fecha):
+    return f"{fecha.day} {MESES[fecha.month - 1]} {fecha.year}"
+
+
+def _persona(xref, nodo):
+    """Un registro INDI -> Familiar (sin guardar)."""
+    nombre_nodo = nodo.primero('NAME')
+    nombre, apellido = '', ''
+    if nombre_nodo:
+        nombre = nombre_nodo.valor_de('GIVN')
+        apellido = nombre_nodo.valor_de('SURN')
+        partes = _NOMBRE.match(nombre_nodo.valor)
+        if partes:
+            nombre = nombre or partes[1]
+            apellido = apellido or partes[2]
+        else:
+            nombre = nombre or nombre_nodo.valor
+    nacimiento = nodo.primero('BIRT')
+    notas = [n.valor for n in nodo.todos('NOTE') if n.valor and not _PUNTERO.fullmatch(n.valor)]   # @N1@: nota compartida, no se sigue
+    return Familiar(
+        gedcom_xref=xref,
+        nombre=nombre.strip()[:150] or xref,
+        apellido=apellido.strip()[:100] or None,
+        fecha_nacimiento=leer_fecha(nacimiento.valor_de('DATE')) if nacimiento else None,
+        biografia='\n\n'.join(notas),
+    )
+
+
+def _aristas_familia(nodo):
+    """Un registro FAM -> aristas (xref_origen, xref_destino, tipo)."""
+    padres = [n.valor.strip('@') for n in nodo.hijos if n.tag in ('HUSB', 'WIFE') and n.valor]
+    hijos = [n.valor.strip('@') for n in nodo.todos('CHIL') if n.valor]
+    aristas = [(padre, hijo, 'PROGENITOR') for padre in padres for hijo in hijos]
+    if len(padres) == 2:
+        aristas.append((padres[0], padres[1], 'PAREJA'))
+    return aristas
+
+
+#---------------------------------------------------------------------------------
+def importar_gedcom(archivo, lote=LOTE, informar=None):
+    """
+    Línea por línea:
+    1. Recorre los registros de a uno; junta las personas (INDI) y las aristas de las familias (FAM).
+    2. Cada 'lote' personas hace UN bulk_create que inserta las nuevas y actualiza las que ya
+       tenían ese xref (update_conflicts).
+    3. Cada 'lote' aristas busca los ids de esos xref con UNA consulta e inserta las relaciones
+       (ignore_conflicts: las que ya existían se saltan). Si una familia aparece antes que sus
+       personas, sus aristas esperan al final.
+    Devuelve un dict con los contadores.
+    """
+    resumen = {'personas': 0, 'familias': 0, 'relaciones_nuevas': 0, 'relaciones_sin_persona': 0}
+    personas, aristas, pendientes = [], [], []
+    relaciones_antes = Relacion.objects.count()
+
+    def guardar_personas():
+        if not personas:
+            return
+        Familiar.objects.bulk_create(
+            personas, batch_size=500, update_conflicts=True, unique_fields=['gedcom_xref'],
+            update_fields=['nombre', 'apellido', 'fecha_nacimiento', 'biografia'],
+        )
+        resumen['personas'] += len(personas)
+        personas.clear()
+        if informar:
+            informar(resumen)
+
+    def guardar_aristas(lista):
+        """Inserta las aristas cuyas dos personas ya existen; devuelve las que no."""
+        guardar_personas()
+        xrefs = {x for origen, destino, _ in lista for x in (origen, destino)}
+        ids = dict(Familiar.objects.filter(gedcom_xref__in=xrefs).values_list('gedcom_xref', 'id'))
+        relaciones, faltan = [], []
+        for origen, destino, tipo in lista:
+            if origen not in ids or destino not in ids:
+                faltan.append((origen, destino, tipo))
+                continue
+            origen_id, destino_id = ids[origen], ids[destino]
+            if origen_id == destino_id:
+                continue
+            if tipo == 'PAREJA' and origen_id > destino_id:
+                # Una pareja se guarda siempre en el mismo sentido: re-importar no la duplica.
+                origen_id, destino_id = destino_id, origen_id
+            relaciones.append(Relacion(origen_id=origen_id, destino_id=destino_id, tipo=tipo))
+        Relacion.objects.bulk_create(relaciones, batch_size=500, ignore_conflicts=True)
+        return faltan
+
+    with transaction.atomic():
+        for xref, nodo in leer_registros(archivo):
+            if nodo.tag == 'INDI' and xref:
+                personas.append(_persona(xref, nodo))
+                if len(personas) >= lote:
+                    guardar_personas()
+            elif nodo.tag == 'FAM':
+                resumen['familias'] += 1
+                aristas.extend(_aristas_familia(nodo))
+                if len(aristas) >= lote:
+                    pendientes.extend(guardar_aristas(aristas))
+                    aristas.clear()
+        pendientes.extend(guardar_aristas(aristas))
+        for inicio in range(0, len(pendientes), lote):
+            resumen['relaciones_sin_persona'] += len(guardar_aristas(pendientes[inicio:inicio + lote]))
+        # bulk_create no dispara las señales que mantienen el índice de búsqueda.
+        reconstruir_indice()
+
+    olvidar_arbol()
+    resumen['relaciones_nuevas'] = Relacion.objects.count() - relaciones_antes
+    return resumen
+
+
+#---------------------------------------------------------------------------------
+@functools.cache
+def prefijo_local():
+    """
+    Prefijo de los xref de esta instalación ('GR' + 6 caracteres + '_'). Sólo un GEDCOM exportado desde
+    esta misma instalación trae xrefs con este prefijo, así que re-importarlo actualiza a los mismos
+    familiares y un @GR7@ de otro programa no se confunde con el familiar 7.
+    Se sortea una sola vez y queda guardado en Configuracion: no depende de la SECRET_KEY (que se rota).
+    """
+    configuracion, _ = Configuracion.objects.get_or_create(
+        clave=CLAVE_PREFIJO, defaults={'valor': f"GR{secrets.token_hex(3).upper()}_"},
+    )
+    return configuracion.valor
+
+
+def xref_local(familiar_id):
+    return f"{prefijo_local()}{familiar_id}"
+
+
+def _texto(nivel, tag, valor, version):
+    """Líneas de un texto largo: CONT por cada salto de línea y, en 5.5.1, CONC cada 200 caracteres."""
+    renglones = valor.split('\n')
+    lineas = []
+    for posicion, renglon in enumerate(renglones):
+        etiqueta = tag if posicion == 0 else 'CONT'
+        nivel_linea = nivel if posicion == 0 else nivel + 1
+        if renglon.startswith('@'):
+            renglon = '@' + renglon
+        if version == '5.5.1':
+            pedazos = [renglon[i:i + 200] for i in range(0, len(renglon), 200)] or ['']
+            lineas.append(f"{nivel_linea} {etiqueta} {pedazos[0]}".rstrip())
+            lineas.extend(f"{nivel + 1} CONC {pedazo}" for pedazo in pedazos[1:])
+        else:
+            lineas.append(f"{nivel_linea} {etiqueta} {renglon}".rstrip())
+    return lineas
+
+
+def _cabecera(version):
+    if version == '5.5.1':
+        return ["0 HEAD", "1 SOUR GESTION_RECUERDOS", "1 GEDC", "2 VERS 5.5.1", "2 FORM LINEAGE-LINKED", "1 CHAR UTF-8"]
+    return ["0 HEAD", "1 GEDC", "2 VERS 7.0", "1 SOUR GESTION_RECUERDOS"]
+
+
+def _claves_como_hijo(padres):
+    """
+    Familias en las que figura un hijo con estos padres. GEDCOM admite dos padres por familia:
+    los que sobren van en familias de un solo padre. La clave de una familia son los ids de sus padres.
+    """
+    padres = sorted(padres)
+    return [tuple(padres[:2])] + [(extra,) for extra in padres[2:]]
+
+
+def _xref_familia(clave):
+    return 'F' + '_'.join(str(persona) for persona in clave)
+
+
+def _familias_del_tramo(ids):
+    """
+    Familias de un tramo de personas, con tres consultas y sólo enteros:
+    - familias: {clave: [hijos]} de todas las familias donde alguna de ellas es padre, madre o pareja.
+      Cada pareja sin hijos en común forma una familia sin hijos.
+    - padres: {persona: [padres]} de las personas del tramo y de sus hijos.
+    Los hijos de una familia están todos acá si su primer padre es del tramo (son todos hijos suyos).
+    """
+    hijos = set(
+        Relacion.objects.filter(tipo='PROGENITOR', origen_id__in=ids).values_list('destino_id', flat=True)
+    )
+    padres = defaultdict(list)
+    progenitores = Relacion.objects.filter(tipo='PROGENITOR', destino_id__in=hijos | set(ids))
+    for origen, destino in progenitores.values_list('origen_id', 'destino_id'):
+        padres[destino].append(origen)
+
+    familias = defaultdict(list)
+    for hijo in sorted(hijos):
+        for clave in _claves_como_hijo(padres[hijo]):
+            familias[clave].append(hijo)
+    parejas = Relacion.objects.filter(tipo='PAREJA').filter(Q(origen_id__in=ids) | Q(destino_id__in=ids))
+    for origen, destino in parejas.values_list('origen_id', 'destino_id'):
+        familias.setdefault(tuple(sorted((origen, destino))), [])
+    return familias, padres
+
+
+def _tramos():
+    """Las personas de a LOTE_EXPORTAR, ordenadas por id (paginado por id, no con OFFSET)."""
+    personas = Familiar.objects.order_by('id').only('nombre', 'apellido', 'fecha_nacimiento', 'biografia', 'gedcom_xref')
+    desde = 0
+    while True:
+        tramo = list(personas.filter(id__gt=desde)[:LOTE_EXPORTAR])
+        if not tramo:
+            return
+        yield tramo
+        desde = tramo[-1].id
+
+
+def exportar_gedcom(version='7', tamano_bloque=64 * 1024):
+    """
+    Genera el GEDCOM por bloques de texto de ~tamano_bloque caracteres, en dos pasadas por tramos:
+    1. Las personas (INDI) con las familias que integran (FAMS como padre, FAMC como hijo).
+    2. Las familias (FAM): cada una sale en el tramo de su primer padre, así no se repite.
+    El xref de cada familia sale de los ids de sus padres (F3_8): no hay que recordar una numeración.
+    """
+    if version not in ('7', '5.5.1'):
+        raise ValueError("Versión GEDCOM no soportada (opciones: 7, 5.5.1)")
+    bloque, largo = [], 0
+
+    def agregar(lineas):
+        nonlocal largo
+        bloque.extend(lineas)
+        largo += sum(len(linea) + 1 for linea in lineas)
+
+    agregar(_cabecera(version))
+    for tramo in _tramos():
+        familias, padres = _familias_del_tramo([familiar.id for familiar in tramo])
+        como_padre = defaultdict(list)
+        for clave in familias:
+            for padre in clave:
+                como_padre[padre].append(clave)
+        for familiar in tramo:
+            xref = familiar.gedcom_xref or xref_local(familiar.id)
+            lineas = [f"0 @{xref}@ INDI", f"1 NAME {familiar.nombre} /{familiar.apellido or ''}/", f"2 GIVN {familiar.nombre}"]
+            if familiar.apellido:
+                lineas.append(f"2 SURN {familiar.apellido}")
+            if familiar.fecha_nacimiento:
+                lineas += ["1 BIRT", f"2 DATE {escribir_fecha(familiar.fecha_nacimiento)}"]
+            if familiar.biografia:
+                lineas += _texto(1, 'NOTE', familiar.biografia, version)
+            lineas += [f"1 FAMS @{_xref_familia(clave)}@" for clave in como_padre.get(familiar.id, ())]
+            if padres.get(familiar.id):
+                lineas += [f"1 FAMC @{_xref_familia(clave)}@" for clave in _claves_como_hijo(padres[familiar.id])]
+            agregar(lineas)
+            if largo >= tamano_bloque:
+                yield '\n'.join(bloque) + '\n'
+                bloque, largo = [], 0
+
+    for tramo in _tramos():
+        ids = {familiar.id for familiar in tramo}
+        familias, _ = _familias_del_tramo(list(ids))
+        propias = {clave: hijos for clave, hijos in familias.items() if clave[0] in ids}
+        miembros = {persona for clave, hijos in propias.items() for persona in (*clave, *hijos)}
+        xrefs = dict(Familiar.objects.filter(id__in=miembros).values_list('id', 'gedcom_xref'))
+        for clave, hijos in propias.items():
+            lineas = [f"0 @{_xref_familia(clave)}@ FAM"]
+            for tag, padre in zip(('HUSB', 'WIFE'), clave):
+                lineas.append(f"1 {tag} @{xrefs.get(padre) or xref_local(padre)}@")
+            lineas += [f"1 CHIL @{xrefs.get(hijo) or xref_local(hijo)}@" for hijo in hijos]
+            agregar(lineas)
+            if largo >= tamano_bloque:
+                yield '\n'.join(bloque) + '\n'
+                bloque, largo = [], 0
+
+    agregar(["0 TRLR"])
+    yield '\n'.join(bloque) + '\n'
@@ -0,0 +1,144 @@
+import cv2
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .detectores import a_gris
+from .models import DriveArchivo
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Huellas perceptuales (pHash) para encontrar copias de una misma foto: escaneos repetidos,
+# copias de WhatsApp, versiones reescaladas. Dos fotos casi iguales tienen huellas que
+# difieren en pocos bits (distancia de Hamming).
+# Para no comparar todas contra todas se usa una tabla multi-índice: con radio r, la huella
+# se parte en r+1 pedazos y dos huellas a distancia <= r comparten sí o sí un pedazo idéntico
+# (principio del palomar). Sólo se comparan las que caen en el mismo balde.
+
+BITS = 64
+_MASCARA = (1 << BITS) - 1
+FILAS_POR_BLOQUE = 256   # filas de la matriz de distancias por paso: acota la memoria en baldes grandes
+
+
+def huella_perceptual(img):
+    """
+    pHash de 64 bits: DCT de la imagen reducida a 32x32 en gris; cada bit dice si la
+    frecuencia baja correspondiente está por encima de la mediana. No cambia al reescalar
+    ni al recomprimir. Se devuelve con signo para que entre en un BigIntegerField.
+    """
+    chica = cv2.resize(a_gris(img), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    bajas = cv2.dct(chica)[:8, :8].flatten()
+    bits = bajas > np.median(bajas[1:])   # la componente continua (brillo medio) no cuenta
+    valor = int(np.packbits(bits).view('>u8')[0])
+    return valor - (1 << BITS) if valor >= 1 << (BITS - 1) else valor
+
+
+def distancia(a, b):
+    """Cantidad de bits distintos entre dos huellas."""
+    return ((a ^ b) & _MASCARA).bit_count()
+
+
+def _pedazos(radio):
+    """(desplazamiento, ancho en bits) de cada uno de los radio+1 pedazos de la huella."""
+    cantidad = radio + 1
+    ancho, resto = divmod(BITS, cantidad)
+    pedazos, desde = [], 0
+    for i in range(cantidad):
+        bits = ancho + (1 if i < resto else 0)
+        pedazos.append((desde, bits))
+        desde += bits
+    return pedazos
+
+
+def pares_parecidos(huellas, radio):
+    """
+    Pares (i, j), con i < j, de posiciones de huellas a radio bits o menos: los justos para
+    unir los grupos, no todos. Las huellas repetidas (escaneos en blanco, la misma exportación
+    de WhatsApp) se encadenan cada una con la anterior igual, sin compararlas; entre valores
+    distintos se devuelve un par por cada par de valores parecidos (sus primeras posiciones).
+    Dentro de cada balde la comparación es vectorizada con NumPy, de a FILAS_POR_BLOQUE filas.
+    """
+    valores = np.asarray(huellas, dtype=np.int64).view(np.uint64)
+    unicos, primera, inversa = np.unique(valores, return_index=True, return_inverse=True)
+    inversa = inversa.reshape(-1)
+
+    orden = np.argsort(inversa, kind='stable')
+    iguales = inversa[orden[1:]] == inversa[orden[:-1]]
+    pares = set(zip(orden[:-1][iguales].tolist(), orden[1:][iguales].tolist()))
+
+    for desde, bits in _pedazos(radio):
+        claves = (unicos >> np.uint64(desde)) & np.uint64((1 << bits) - 1)
+        orden = np.argsort(claves, kind='stable')
+        cortes = np.flatnonzero(np.diff(claves[orden])) + 1
+        for balde in np.split(orden, cortes):
+            if len(balde) < 2:
+                continue
+            sub = unicos[balde]
+            for inicio in range(0, len(balde) - 1, FILAS_POR_BLOQUE):
+                filas = sub[inicio:inicio + FILAS_POR_BLOQUE]
+                i, j = np.nonzero(np.bitwise_count(filas[:, None] ^ sub[None, :]) <= radio)
+                i += inicio
+                a, b = primera[balde[i[i < j]]], primera[balde[j[i < j]]]
+                pares.update(zip(np.minimum(a, b).tolist(), np.maximum(a, b).tolist()))
+    return pares
+
+
+def agrupar_parecidas(fotos, radio=None):
+    """
+    fotos: lista de (id, huella, tamaño). Junta las que están a radio bits o menos (también
+    en cadena: si A~B y B~C, van juntas). Devuelve {id_de_la_principal: [ids de las copias]},
+    sólo para los grupos con copias. La principal es la de mayor tamaño (la mejor resolución).
+    """
+    radio = settings.HUELLA_RADIO_DUPLICADOS if radio is None else radio
+    ids = [foto_id for foto_id, _, _ in fotos]
+    padre = list(range(len(fotos)))
+
+    def raiz(x):
+        while padre[x] != x:
+            padre[x] = padre[padre[x]]
+            x = padre[x]
+        return x
+
+    for i, j in pares_parecidos([huella for _, huella, _ in fotos], radio):
+        padre[raiz(i)] = raiz(j)
+
+    grupos = {}
+    for i in range(len(fotos)):
+        grupos.setdefault(raiz(i), []).append(i)
+    resultado = {}
+    for miembros in grupos.values():
+        if len(miembros) > 1:
+            principal = max(miembros, key=lambda m: (fotos[m][2] or 0, ids[m]))
+            resultado[ids[principal]] = [ids[m] for m in miembros if m != principal]
+    return resultado
+
+
+def grupos_de_duplicadas(drive_ids=None):
+    """Agrupa las fotos de DriveArchivo (todas, o sólo las de drive_ids) que tienen huella al día."""
+    filas = DriveArchivo.objects.filter(huella__isnull=False, huella_md5=F('md5')).values_list('drive_id', 'huella', 'tamano')
+    if drive_ids is not None:
+        # Se filtra en Python: un IN con decenas de miles de ids no entra en una consulta de SQLite.
+        drive_ids = set(drive_ids)
+        filas = [fila for fila in filas.iterator(chunk_size=2000) if fila[0] in drive_ids]
+    return agrupar_parecidas(list(filas))
+
+
+def guardar_grupos():
+    """
+    Agrupa todas las fotos y anota en cada copia cuál es su principal (DriveArchivo.copia_de).
+    Se llama cuando cambian las huellas (comando calcular_huellas); el listado de fotos sólo lee
+    la columna. Devuelve los grupos, como grupos_de_duplicadas.
+    """
+    grupos = grupos_de_duplicadas()
+    principal_de = {copia: principal for principal, copias in grupos.items() for copia in copias}
+    actuales = dict(DriveArchivo.objects.exclude(copia_de='').values_list('drive_id', 'copia_de'))
+    cambios = {}
+    for drive_id in actuales.keys() | principal_de.keys():
+        nuevo = principal_de.get(drive_id, '')
+        if actuales.get(drive_id, '') != nuevo:
+            cambios.setdefault(nuevo, []).append(drive_id)
+    with transaction.atomic():
+        for principal, drive_ids in cambios.items():
+            for inicio in range(0, len(drive_ids), 500):
+                DriveArchivo.objects.filter(drive_id__in=drive_ids[inicio:inicio + 500]).update(copia_de=principal)
+    return grupos
@@ -0,0 +1,213 @@
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .reconocimiento import bytes_a_embedding
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Índice en memoria de los embeddings de los rostros ya identificados.
+# Todos los vectores viven en una sola matriz NumPy (una fila por rostro), así que
+# buscar el más parecido es UNA multiplicación matriz-vector: con 100.000 rostros
+# tarda pocos milisegundos. Se mantiene al día con las señales de RostroDetectado.
+# Lo que cambian OTROS procesos (altas, caras etiquetadas o movidas, ediciones en el admin) se trae
+# cada INDICE_ROSTROS_REFRESCO segundos por fecha_modificacion; lo borrado en otro proceso se va
+# al reconstruir el índice entero cada INDICE_ROSTROS_RECONSTRUCCION segundos.
+
+# Las filas se releen con este solape: una transacción que tardó en confirmarse puede traer
+# una fecha_modificacion un poco anterior a la última revisión.
+SOLAPE_REVISION = timedelta(seconds=60)
+
+
+class IndiceRostros:
+    def __init__(self, dimension=128):
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        self._matriz = np.zeros((0, dimension), dtype=np.float32)
+        self._rostros = np.zeros(0, dtype=np.int64)
+        self._familiares = np.zeros(0, dtype=np.int64)
+        self._n = 0
+        self._posicion = {}       # rostro_id -> fila en la matriz
+        self._revisado_desde = None   # fecha_modificacion desde la que se relee al refrescar
+        self._ultima_carga = 0.0
+        self._construido = time.monotonic()
+
+    def __len__(self):
+        return self._n
+
+    #-----------------------------------------------------------------------------
+    def _crecer(self, minimo):
+        """Duplica la capacidad de los arreglos (como una lista de Python) para no copiar en cada alta."""
+        capacidad = max(minimo, 2 * len(self._rostros), 1024)
+        matriz = np.zeros((capacidad, self.dimension), dtype=np.float32)
+        matriz[:self._n] = self._matriz[:self._n]
+        rostros = np.zeros(capacidad, dtype=np.int64)
+        rostros[:self._n] = self._rostros[:self._n]
+        familiares = np.zeros(capacidad, dtype=np.int64)
+        familiares[:self._n] = self._familiares[:self._n]
+        self._matriz, self._rostros, self._familiares = matriz, rostros, familiares
+
+    def _agregar(self, rostro_id, familiar_id, vector):
+        fila = self._posicion.get(rostro_id)
+        if fila is None:
+            if self._n >= len(self._rostros):
+                self._crecer(self._n + 1)
+            fila = self._n
+            self._n += 1
+            self._posicion[rostro_id] = fila
+        self._matriz[fila] = vector
+        self._rostros[fila] = rostro_id
+        self._familiares[fila] = familiar_id
+
+    def _quitar(self, rostro_id):
+        """Borra en O(1): la última fila ocupa el hueco del rostro quitado."""
+        fila = self._posicion.pop(rostro_id, None)
+        if fila is None:
+            return
+        ultima = self._n - 1
+        if fila != ultima:
+            self._matriz[fila] = self._matriz[ultima]
+            self._rostros[fila] = self._rostros[ultima]
+            self._familiares[fila] = self._familiares[ultima]
+            self._posicion[int(self._rostros[fila])] = fila
+        self._n -= 1
+
+    #-----------------------------------------------------------------------------
+    def cargar(self, rostros, revisado_desde):
+        """
+        Aplica filas (rostro_id, familiar_id, embedding_bytes) leídas de la base de datos:
+        las que tienen familiar y embedding entran (o se actualizan), las demás salen.
+        'revisado_desde' es la hora en que empezó la consulta: el próximo refresco relee desde ahí.
+        """
+        with self._lock:
+            for rostro_id, familiar_id, datos in rostros:
+                vector = bytes_a_embedding(datos)
+                if familiar_id is None or vector is None or len(vector) != self.dimension:
+                    self._quitar(rostro_id)
+                else:
+                    self._agregar(rostro_id, familiar_id, vector)
+            self._revisado_desde = revisado_desde - SOLAPE_REVISION
+            self._ultima_carga = time.monotonic()
+
+    def actualizar(self, rostro):
+        """Refleja en el índice un RostroDetectado recién guardado."""
+        vector = bytes_a_embedding(rostro.embedding)
+        with self._lock:
+            if rostro.familiar_id is None or vector is None or len(vector) != self.dimension:
+                self._quitar(rostro.id)
+            else:
+                self._agregar(rostro.id, rostro.familiar_id, vector)
+
+    def quitar(self, rostro_id):
+        with self._lock:
+            self._quitar(rostro_id)
+
+    def sugerir(self, vector, k=5, umbral=None):
+        """
+        Devuelve una lista [(familiar_id, puntaje), ...] ordenada de más a menos probable.
+        Cada uno de los k rostros más parecidos que supera el umbral de similitud coseno
+        suma su similitud como voto para su familiar.
+        """
+        if vector is None:
+            return []
+        if umbral is None:
+            umbral = getattr(settings, 'UMBRAL_SIMILITUD_ROSTROS', 0.363)
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return []
+            similitudes = self._matriz[:n] @ vector
+            k = min(k, n)
+            mejores = np.argpartition(-similitudes, k - 1)[:k]
+            familiares = self._familiares[mejores]
+        votos = {}
+        for familiar_id, similitud in zip(familiares.tolist(), similitudes[mejores].tolist()):
+            if similitud >= umbral:
+                votos[familiar_id] = votos.get(familiar_id, 0.0) + similitud
+        return sorted(votos.items(), key=lambda par: par[1], reverse=True)
+
+    def centroides(self, familiar_ids=None):
+        """{familiar_id: vector promedio (normalizado) de todos sus rostros}, de los pedidos o de todos."""
+        with self._lock:
+            familiares = self._familiares[:self._n].copy()
+            matriz = self._matriz[:self._n].copy()
+        if familiar_ids is not None:
+            elegidas = np.isin(familiares, np.fromiter(familiar_ids, dtype=np.int64))
+            familiares, matriz = familiares[elegidas], matriz[elegidas]
+        if not len(familiares):
+            return {}
+        unicos, grupo = np.unique(familiares, return_inverse=True)
+        sumas = np.zeros((len(unicos), self.dimension), dtype=np.float32)
+        np.add.at(sumas, grupo, matriz)
+        normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+        sumas /= np.maximum(normas, 1e-12)
+        return dict(zip(unicos.tolist(), sumas))
+
+
+#---------------------------------------------------------------------------------
+_indice = None
+_reconstruyendo = False
+_lock_indice = threading.Lock()
+
+
+def _construir():
+    from .models import RostroDetectado
+
+    indice = IndiceRostros()
+    inicio = timezone.now()
+    indice.cargar(
+        RostroDetectado.objects.filter(familiar__isnull=False, embedding__isnull=False)
+        .values_list('id', 'familiar_id', 'embedding').iterator(chunk_size=2000),
+        inicio,
+    )
+    return indice
+
+
+def obtener_indice():
+    """
+    Devuelve el índice del proceso, construyéndolo desde la base de datos la primera vez.
+    Cada INDICE_ROSTROS_REFRESCO segundos trae lo que cambiaron otros procesos (workers) desde la
+    última revisión, y cada INDICE_ROSTROS_RECONSTRUCCION lo vuelve a armar entero (así se van
+    también los rostros que otro proceso borró). Mientras un hilo lo rearma, los demás siguen
+    usando el anterior.
+    """
+    global _indice, _reconstruyendo
+    from .models import RostroDetectado
+
+    with _lock_indice:
+        if _indice is None:
+            _indice = _construir()
+            return _indice
+        ahora = time.monotonic()
+        reconstruir = (
+            not _reconstruyendo
+            and ahora - _indice._construido > getattr(settings, 'INDICE_ROSTROS_RECONSTRUCCION', 900)
+        )
+        if reconstruir:
+            _reconstruyendo = True
+        elif ahora - _indice._ultima_carga > getattr(settings, 'INDICE_ROSTROS_REFRESCO', 60):
+            inicio = timezone.now()
+            _indice.cargar(
+                RostroDetectado.objects.filter(fecha_modificacion__gte=_indice._revisado_desde)
+                .values_list('id', 'familiar_id', 'embedding').iterator(chunk_size=2000),
+                inicio,
+            )
+        indice = _indice
+    if not reconstruir:
+        return indice
+    try:
+        # Lo que se guarde durante la reconstrucción lo trae el primer refresco (relee desde su inicio).
+        nuevo = _construir()
+        with _lock_indice:
+            _indice = nuevo
+        return nuevo
+    finally:
+        _reconstruyendo = False
+
+
+def indice_si_cargado():
+    """El índice sólo si ya fue construido; las señales no lo fuerzan a cargarse."""
+    return _indice
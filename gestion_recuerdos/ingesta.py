@@ -0,0 +1,129 @@
+from functools import partial
+
+import cv2
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .almacenamiento import CARPETA_PERMANENTE, asegurar_al_confirmar, guardar_contenido, liberar_archivos
+from .indice_rostros import indice_si_cargado
+from .miniaturas import generar_miniatura
+from .models import Familiar, RostroDetectado
+from .reconocimiento import calcular_embedding, embedding_a_bytes
+from .temporales import ruta_recorte
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Guarda de una sola vez muchos rostros ya etiquetados (formulario de análisis o API JSON).
+# - Todos los familiares se buscan con UNA consulta (in_bulk).
+# - Todos los RostroDetectado se insertan con UN bulk_create dentro de una transacción.
+# - Los recortes se copian de temp_caras al almacenamiento de recortes (ver almacenamiento.py),
+#   nombrados por su contenido: si la BD falla, se borran los que no quedaron en uso.
+# - Una cara cuya caja ya está guardada para esa foto (la encontró analizar_lote, o es un reintento
+#   del mismo formulario) no se inserta otra vez: se le cambia el familiar a la fila existente.
+
+MAX_POR_LLAMADA = 1000
+
+
+def _caja(valor):
+    """[x, y, ancho, alto] o 'x,y,ancho,alto' -> tupla de enteros; None si no viene o es inválida."""
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        valor = valor.split(',')
+    try:
+        caja = tuple(int(v) for v in valor)
+    except (TypeError, ValueError):
+        return None
+    return caja if len(caja) == 4 else None
+
+
+def guardar_rostros_etiquetados(items):
+    """
+    items: lista de dicts con 'analisis', 'archivo', 'familiar' y opcionalmente
+    'drive_file_id' y 'caja'. Devuelve (rostros_creados, errores) donde errores es
+    una lista de (posición, mensaje) de los items que no se pudieron guardar.
+    Los rostros devueltos incluyen los que ya existían y sólo cambiaron de familiar.
+    """
+    if len(items) > MAX_POR_LLAMADA:
+        raise ValueError(f"Como máximo {MAX_POR_LLAMADA} rostros por llamada")
+
+    ids = {str(item.get('familiar')) for item in items if str(item.get('familiar', '')).isdigit()}
+    familiares = Familiar.objects.in_bulk([int(i) for i in ids])
+    fotos = {item.get('drive_file_id') for item in items if item.get('drive_file_id')}
+    ya_guardados = {
+        (drive_file_id, (x, y, ancho, alto)): rostro_id for rostro_id, drive_file_id, x, y, ancho, alto in
+        RostroDetectado.objects.filter(drive_file_id__in=fotos, x__isnull=False)
+        .values_list('id', 'drive_file_id', 'x', 'y', 'ancho', 'alto')
+    } if fotos else {}
+
+    errores, preparados, reetiquetar, subidos = [], [], {}, []
+    for posicion, item in enumerate(items):
+        familiar_id = str(item.get('familiar', ''))
+        familiar = familiares.get(int(familiar_id)) if familiar_id.isdigit() else None
+        if familiar is None:
+            errores.append((posicion, "Familiar inexistente"))
+            continue
+        caja = _caja(item.get('caja'))
+        if caja is None and item.get('caja'):
+            errores.append((posicion, "Caja inválida (se espera x, y, ancho, alto)"))
+            continue
+        existente = ya_guardados.get((item.get('drive_file_id'), caja)) if caja else None
+        if existente is not None:
+            reetiquetar[existente] = familiar.id
+            continue
+        try:
+            ruta_temp = ruta_recorte(item.get('analisis'), item.get('archivo'))
+        except ValueError as e:
+            errores.append((posicion, str(e)))
+            continue
+        try:
+            with open(ruta_temp, 'rb') as archivo:
+                jpeg = archivo.read()
+        except FileNotFoundError:
+            jpeg = b''
+        recorte = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) if jpeg else None
+        if recorte is None:
+            errores.append((posicion, "El recorte ya no existe"))
+            continue
+
+        caja = caja or (None, None, None, None)
+        rostro = RostroDetectado(
+            familiar=familiar,
+            foto_recorte=guardar_contenido(jpeg, CARPETA_PERMANENTE, '.jpg'),
+            miniatura=generar_miniatura(recorte),
+            drive_file_id=item.get('drive_file_id') or "ID_DESCONOCIDO",
+            x=caja[0], y=caja[1], ancho=caja[2], alto=caja[3],
+            embedding=embedding_a_bytes(calcular_embedding(recorte)),
+        )
+        preparados.append(rostro)
+        subidos += [
+            (rostro.foto_recorte.name, partial(guardar_contenido, jpeg, CARPETA_PERMANENTE, '.jpg')),
+            (rostro.miniatura.name, partial(generar_miniatura, recorte)),
+        ]
+
+    try:
+        with transaction.atomic():
+            creados = RostroDetectado.objects.bulk_create(preparados)
+            asegurar_al_confirmar(subidos)
+            por_familiar = {}
+            for rostro_id, familiar_id in reetiquetar.items():
+                por_familiar.setdefault(familiar_id, []).append(rostro_id)
+            for familiar_id, rostro_ids in por_familiar.items():
+                RostroDetectado.objects.filter(id__in=rostro_ids).update(
+                    familiar_id=familiar_id, fecha_modificacion=timezone.now(),
+                )
+    except Exception:
+        # La transacción se deshizo: se borran los archivos recién subidos que ningún otro rostro usa.
+        liberar_archivos(n for rostro in preparados for n in (rostro.foto_recorte.name, rostro.miniatura.name))
+        raise
+
+    reetiquetados = list(
+        RostroDetectado.objects.filter(id__in=list(reetiquetar)).only('id', 'familiar_id', 'embedding')
+    ) if reetiquetar else []
+
+    # bulk_create y update() no disparan post_save: el índice de embeddings se actualiza a mano.
+    indice = indice_si_cargado()
+    if indice is not None:
+        for rostro in creados + reetiquetados:
+            indice.actualizar(rostro)
+    return creados + reetiquetados, errores
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from gestion_recuerdos.agrupamiento import agrupar_rostros
+
+
+class Command(BaseCommand):
+    help = (
+        "Agrupa los rostros sin identificar en grupos de caras parecidas para etiquetarlos de a grupos "
+        "(/rostros/grupos/). Sólo procesa las caras nuevas; --desde-cero rehace todos los grupos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde-cero', action='store_true', help="Borra los grupos y vuelve a agrupar todas las caras.")
+        parser.add_argument('--similitud', type=float, help="Similitud coseno mínima (por defecto settings.AGRUPAR_ROSTROS_SIMILITUD).")
+
+    def handle(self, *args, **opciones):
+        resumen = agrupar_rostros(opciones['desde_cero'], opciones['similitud'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['caras']} caras agrupadas: {resumen['grupos_nuevos']} grupos nuevos, "
+            f"{resumen['grupos_unidos']} grupos unidos a otros, {resumen['grupos']} grupos en total."
+        ))
@@ -0,0 +1,248 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from gestion_recuerdos.agrupamiento import agrupar_rostros
+from gestion_recuerdos.almacenamiento import CARPETA_PERMANENTE, asegurar_al_confirmar, guardar_contenido
+from gestion_recuerdos.analisis import detectar_en_archivo, recortar, recortar_jpeg
+from gestion_recuerdos.cache_descargas import buscar_md5, leer_imagen_abierta, obtener_cache
+from gestion_recuerdos.detecciones import buscar_deteccion, guardar_deteccion
+from gestion_recuerdos.drive import (
+    buscar_carpeta_raiz, buscar_credenciales_guardadas, crear_servicio, obtener_fotos_recursivo,
+)
+from gestion_recuerdos.huellas import grupos_de_duplicadas
+from gestion_recuerdos.miniaturas import generar_miniatura
+from gestion_recuerdos.models import FotoTrabajo, RostroDetectado, TrabajoLote
+from gestion_recuerdos.reconocimiento import calcular_embedding, embedding_a_bytes
+
+
+class Command(BaseCommand):
+    help = (
+        "Analiza en segundo plano todas las fotos de la carpeta 'Genealogia' de Drive y guarda "
+        "los rostros encontrados como candidatos sin identificar. Se puede reanudar con --reanudar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carpeta', help="ID de la carpeta de Drive (por defecto 'Genealogia').")
+        parser.add_argument('--reanudar', type=int, help="ID de un TrabajoLote interrumpido para continuarlo.")
+        parser.add_argument('--hilos', type=int, default=4, help="Cantidad de descargas/detecciones simultáneas.")
+        parser.add_argument(
+            '--con-duplicadas', action='store_true',
+            help="Analiza también las fotos casi iguales a otra del trabajo (ver calcular_huellas).",
+        )
+        parser.add_argument('--credenciales', help="Archivo JSON con las credenciales (por defecto, la última sesión activa).")
+
+    def handle(self, *args, **opciones):
+        creds_data = buscar_credenciales_guardadas(opciones['credenciales'])
+        if not creds_data:
+            raise CommandError("No hay credenciales de Google: inicia sesión en la web o usa --credenciales.")
+        self.creds_data = creds_data
+        self.local = threading.local()
+
+        if opciones['reanudar']:
+            trabajo = self.reanudar_trabajo(opciones['reanudar'])
+        else:
+            trabajo = self.crear_trabajo(opciones['carpeta'])
+            if not opciones['con_duplicadas']:
+                self.marcar_duplicadas(trabajo)
+
+        pendientes = list(trabajo.fotos.filter(estado='PENDIENTE').values_list('id', 'drive_file_id'))
+        trabajo.estado = 'EN_CURSO'
+        trabajo.save(update_fields=['estado', 'fecha_actualizacion'])
+        self.stdout.write(f"Trabajo {trabajo.id}: {len(pendientes)} fotos pendientes de {trabajo.total}.")
+
+        try:
+            self.procesar(trabajo, pendientes, max(1, opciones['hilos']))
+        except BaseException as e:
+            # Las fotos ya hechas quedan marcadas; el resto se retoma con --reanudar.
+            TrabajoLote.objects.filter(id=trabajo.id).update(estado='FALLIDO', mensaje=str(e))
+            raise
+
+        trabajo.refresh_from_db()
+        trabajo.estado = 'TERMINADO'
+        trabajo.save(update_fields=['estado', 'fecha_actualizacion'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Trabajo {trabajo.id} terminado: {trabajo.procesadas} fotos, "
+            f"{trabajo.rostros} rostros, {trabajo.fallidas} con error."
+        ))
+
+        # Las caras nuevas (todas sin familiar) se suman a los grupos para etiquetarlas de a muchas.
+        if trabajo.rostros:
+            resumen = agrupar_rostros()
+            self.stdout.write(f"{resumen['caras']} caras agrupadas ({resumen['grupos_nuevos']} grupos nuevos).")
+
+    #---------------------------------------------------------------------------------
+    def crear_trabajo(self, carpeta_id):
+        service = crear_servicio(self.creds_data)
+        carpeta_id = carpeta_id or buscar_carpeta_raiz(service)
+        if not carpeta_id:
+            raise CommandError("No existe la carpeta 'Genealogia' en Drive. Organiza Drive primero.")
+
+        items = obtener_fotos_recursivo(service, carpeta_id)
+        trabajo = TrabajoLote.objects.create(carpeta_id=carpeta_id, total=len(items))
+        FotoTrabajo.objects.bulk_create(
+            [FotoTrabajo(trabajo=trabajo, drive_file_id=f['id'], nombre=f['name']) for f in items],
+            batch_size=500, ignore_conflicts=True,
+        )
+        return trabajo
+
+    def marcar_duplicadas(self, trabajo):
+        """
+        Las copias de una misma foto (según su huella perceptual) no se descargan ni se analizan:
+        sólo se analiza la de mayor tamaño de cada grupo.
+        """
+        nombres = dict(trabajo.fotos.values_list('drive_file_id', 'nombre'))
+        grupos = grupos_de_duplicadas(nombres)
+        if not grupos:
+            return
+        copias = 0
+        with transaction.atomic():
+            for principal, duplicadas in grupos.items():
+                copias += trabajo.fotos.filter(drive_file_id__in=duplicadas).update(
+                    estado='DUPLICADA', error=f"Copia de {nombres[principal] or principal}",
+                )
+            TrabajoLote.objects.filter(id=trabajo.id).update(procesadas=F('procesadas') + copias)
+        self.stdout.write(f"{copias} fotos son copias de otras y no se analizan.")
+
+    def reanudar_trabajo(self, trabajo_id):
+        try:
+            trabajo = TrabajoLote.objects.get(id=trabajo_id)
+        except TrabajoLote.DoesNotExist:
+            raise CommandError(f"No existe el trabajo {trabajo_id}.")
+        # Las fotos que fallaron se vuelven a intentar.
+        reintentos = trabajo.fotos.filter(estado='ERROR').update(estado='PENDIENTE', error='')
+        TrabajoLote.objects.filter(id=trabajo.id).update(
+            procesadas=F('procesadas') - reintentos, fallidas=F('fallidas') - reintentos,
+        )
+        trabajo.refresh_from_db()
+        return trabajo
+
+    #---------------------------------------------------------------------------------
+    def analizar_foto(self, file_id):
+        """
+        Se ejecuta en los hilos del pool: descarga, detecta y recorta.
+        Cada hilo tiene su propio cliente de Drive (no es seguro compartirlo entre hilos).
+        Si la foto ya se había analizado con el mismo detector, se reutilizan sus recortes
+        (salvo los que ya son rostros guardados: no se vuelven a leer ni a calcular).
+        Devuelve (md5, es_nueva, [(caja, jpeg, embedding), ...]).
+        """
+        if not hasattr(self.local, 'service'):
+            self.local.service = crear_servicio(self.creds_data)
+
+        md5 = buscar_md5(self.local.service, file_id)
+        previa = buscar_deteccion(file_id, md5) if md5 else None
+        if previa is not None:
+            recortes = []
+            guardadas = cajas_guardadas(file_id)
+            for caja, ruta in zip(previa.cajas, previa.rutas_recortes()):
+                if tuple(caja) in guardadas:
+                    continue
+                with open(os.path.join(settings.MEDIA_ROOT, ruta), 'rb') as archivo:
+                    jpeg = archivo.read()
+                recorte = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                recortes.append((tuple(caja), jpeg, embedding_a_bytes(calcular_embedding(recorte))))
+            return md5, False, recortes
+
+        with obtener_cache().abrir(self.local.service, file_id, md5) as archivo:
+            caras, img = detectar_en_archivo(lambda flags: leer_imagen_abierta(archivo, flags))
+        return md5, True, [
+            (caja, recortar_jpeg(img, caja), embedding_a_bytes(calcular_embedding(recortar(img, caja))))
+            for caja in caras
+        ]
+
+    def procesar(self, trabajo, pendientes, hilos):
+        cola = iter(pendientes)
+        en_vuelo = {}
+
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            def llenar():
+                # Como máximo 2 fotos por hilo en memoria: el pool nunca acumula la carpeta entera.
+                while len(en_vuelo) < hilos * 2:
+                    item = next(cola, None)
+                    if item is None:
+                        return
+                    en_vuelo[pool.submit(self.analizar_foto, item[1])] = item
+
+            llenar()
+            while en_vuelo:
+                hechos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    foto_id, file_id = en_vuelo.pop(futuro)
+                    try:
+                        md5, es_nueva, recortes = futuro.result()
+                    except Exception as e:
+                        self.registrar_error(trabajo, foto_id, file_id, e)
+                    else:
+                        if es_nueva:
+                            guardar_deteccion(file_id, md5, [r[0] for r in recortes], [r[1] for r in recortes])
+                        self.guardar_resultado(trabajo, foto_id, file_id, recortes)
+                llenar()
+
+    def guardar_resultado(self, trabajo, foto_id, file_id, recortes):
+        """
+        Sube los recortes al almacenamiento (nombrados por contenido: la misma foto en otro lote
+        no duplica archivos) y marca la foto como hecha en una sola transacción.
+        Las cajas que ya tienen un RostroDetectado de esta foto (otro lote, o etiquetadas desde la web)
+        no se insertan de nuevo: volver a analizar una carpeta no duplica rostros.
+        """
+        guardadas = cajas_guardadas(file_id)
+        rostros = []
+        for (x, y, w, h), jpeg, embedding in recortes:
+            if jpeg is None or (x, y, w, h) in guardadas:
+                continue
+            recorte = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            rostro = RostroDetectado(
+                familiar=None,
+                foto_recorte=guardar_contenido(jpeg, CARPETA_PERMANENTE, '.jpg'),
+                miniatura=generar_miniatura(recorte),
+                drive_file_id=file_id,
+                x=x, y=y, ancho=w, alto=h,
+                embedding=embedding,
+            )
+            rostros.append((rostro, [
+                (rostro.foto_recorte.name, partial(guardar_contenido, jpeg, CARPETA_PERMANENTE, '.jpg')),
+                (rostro.miniatura.name, partial(generar_miniatura, recorte)),
+            ]))
+
+        with transaction.atomic():
+            # Se vuelve a mirar dentro de la transacción por si otro proceso guardó la misma foto mientras tanto.
+            guardadas = cajas_guardadas(file_id)
+            rostros = [(r, archivos) for r, archivos in rostros if (r.x, r.y, r.ancho, r.alto) not in guardadas]
+            RostroDetectado.objects.bulk_create([r for r, _ in rostros])
+            # Por si un borrado concurrente se llevó un archivo que ya existía (ver almacenamiento.py).
+            asegurar_al_confirmar([archivo for _, archivos in rostros for archivo in archivos])
+            FotoTrabajo.objects.filter(id=foto_id).update(estado='HECHA')
+            TrabajoLote.objects.filter(id=trabajo.id).update(
+                procesadas=F('procesadas') + 1, rostros=F('rostros') + len(rostros),
+            )
+        self.informar(trabajo)
+
+    def registrar_error(self, trabajo, foto_id, file_id, error):
+        with transaction.atomic():
+            FotoTrabajo.objects.filter(id=foto_id).update(estado='ERROR', error=str(error))
+            TrabajoLote.objects.filter(id=trabajo.id).update(
+                procesadas=F('procesadas') + 1, fallidas=F('fallidas') + 1,
+            )
+        self.stderr.write(f"  Error en {file_id}: {error}")
+        self.informar(trabajo)
+
+    def informar(self, trabajo):
+        trabajo.refresh_from_db(fields=['procesadas', 'total', 'rostros', 'fallidas'])
+        if trabajo.procesadas % 10 == 0 or trabajo.procesadas == trabajo.total:
+            self.stdout.write(
+                f"  {trabajo.procesadas}/{trabajo.total} fotos, {trabajo.rostros} rostros, "
+                f"{trabajo.fallidas} errores"
+            )
+
+
+def cajas_guardadas(file_id):
+    """Cajas (x, y, ancho, alto) que ya tienen un RostroDetectado para esta foto de Drive."""
+    return set(RostroDetectado.objects.filter(drive_file_id=file_id).values_list('x', 'y', 'ancho', 'alto'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from gestion_recuerdos.duplicados_familiares import buscar_duplicados
+
+
+class Command(BaseCommand):
+    help = (
+        "Busca familiares que parecen ser la misma persona (nombre parecido, fecha de nacimiento, rostros) "
+        "y los deja en la cola de revisión (/arbol/duplicados/)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--umbral', type=float, help="Puntaje mínimo 0..1 (por defecto settings.FAMILIARES_UMBRAL_DUPLICADO).")
+
+    def handle(self, *args, **opciones):
+        resumen = buscar_duplicados(opciones['umbral'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['personas']} familiares, {resumen['comparados']} pares comparados, "
+            f"{resumen['posibles']} posibles duplicados en la cola."
+        ))
+        if resumen['bloques_saltados']:
+            self.stdout.write(self.style.WARNING(
+                f"{resumen['bloques_saltados']} bloques demasiado grandes se saltaron (nombres muy comunes sin fecha)."
+            ))
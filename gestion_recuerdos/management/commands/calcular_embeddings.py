@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_recuerdos.almacenamiento import leer_contenido
+from gestion_recuerdos.models import RostroDetectado
+from gestion_recuerdos.reconocimiento import calcular_embedding, embedding_a_bytes, reconocimiento_disponible
+
+
+class Command(BaseCommand):
+    help = "Calcula el embedding de los rostros guardados que todavía no lo tienen."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true', help="Recalcula también los que ya tienen embedding.")
+
+    def handle(self, *args, **opciones):
+        if not reconocimiento_disponible():
+            raise CommandError(f"No se encontró el modelo en {settings.MODELO_RECONOCIMIENTO_ROSTROS}.")
+
+        rostros = RostroDetectado.objects.all()
+        if not opciones['todos']:
+            rostros = rostros.filter(embedding__isnull=True)
+
+        calculados = 0
+        for rostro in rostros.iterator(chunk_size=500):
+            try:
+                datos = leer_contenido(rostro.foto_recorte.name)
+            except FileNotFoundError:
+                continue
+            recorte = cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_COLOR)
+            embedding = calcular_embedding(recorte)
+            if embedding is None:
+                continue
+            rostro.embedding = embedding_a_bytes(embedding)
+            rostro.save(update_fields=['embedding'])
+            calculados += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{calculados} embeddings calculados."))
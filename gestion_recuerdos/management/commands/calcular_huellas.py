@@ -0,0 +1,68 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from gestion_recuerdos.analisis import decodificar_imagen
+from gestion_recuerdos.drive import buscar_credenciales_guardadas
+from gestion_recuerdos.drive_async import ClienteDriveAsync, ErrorDrive
+from gestion_recuerdos.huellas import guardar_grupos, huella_perceptual
+from gestion_recuerdos.models import DriveArchivo
+
+POR_TANDA = 200
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula la huella perceptual de las fotos sincronizadas que no la tienen (o cuya foto cambió). "
+        "Usa la miniatura de Drive, no la foto original: unos pocos KB por foto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--credenciales', help="Archivo JSON con las credenciales (por defecto, la última sesión activa).")
+        parser.add_argument('--todas', action='store_true', help="Recalcula también las que ya están al día.")
+
+    def handle(self, *args, **opciones):
+        creds_data = buscar_credenciales_guardadas(opciones['credenciales'])
+        if not creds_data:
+            raise CommandError("No hay credenciales de Google: inicia sesión en la web o usa --credenciales.")
+
+        fotos = DriveArchivo.objects.filter(mime_type__startswith='image/')
+        if not opciones['todas']:
+            fotos = fotos.filter(Q(huella__isnull=True) | ~Q(huella_md5=F('md5')))
+        pendientes = list(fotos.values_list('id', 'drive_id', 'md5'))
+        self.stdout.write(f"{len(pendientes)} fotos sin huella.")
+
+        calculadas, fallidas = asyncio.run(self.calcular(ClienteDriveAsync(creds_data), pendientes))
+        grupos = guardar_grupos()
+        self.stdout.write(self.style.SUCCESS(
+            f"{calculadas} huellas calculadas, {fallidas} con error. "
+            f"{len(grupos)} fotos tienen copias ({sum(len(c) for c in grupos.values())} copias en total)."
+        ))
+
+    async def calcular(self, cliente, pendientes):
+        calculadas = fallidas = 0
+        for inicio in range(0, len(pendientes), POR_TANDA):
+            tanda = pendientes[inicio:inicio + POR_TANDA]
+            # El semáforo del cliente limita cuántas descargas hay en vuelo a la vez.
+            resultados = await asyncio.gather(*(self.huella(cliente, drive_id) for _, drive_id, _ in tanda))
+            actualizar = []
+            for (archivo_id, drive_id, md5), huella in zip(tanda, resultados):
+                if huella is None:
+                    fallidas += 1
+                    continue
+                actualizar.append(DriveArchivo(id=archivo_id, huella=huella, huella_md5=md5))
+            await sync_to_async(DriveArchivo.objects.bulk_update)(actualizar, ['huella', 'huella_md5'])
+            calculadas += len(actualizar)
+            self.stdout.write(f"  {inicio + len(tanda)}/{len(pendientes)}")
+        return calculadas, fallidas
+
+    async def huella(self, cliente, drive_id):
+        try:
+            datos = await cliente.descargar_miniatura(drive_id) or await cliente.descargar(drive_id)
+        except ErrorDrive as e:
+            self.stderr.write(f"  Error en {drive_id}: {e}")
+            return None
+        img = decodificar_imagen(datos)
+        return None if img is None else huella_perceptual(img)
@@ -0,0 +1,147 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_recuerdos.detectores import DETECTORES
+
+EXTENSIONES = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+
+
+def _memoria_pico_mb():
+    try:
+        import resource
+    except ImportError:   # Windows
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / 1024, 1)   # Linux lo da en KB
+
+
+def _medir(nombre, fotos, repeticiones):
+    """
+    Corre en un proceso nuevo por detector, así la memoria pico de uno no se mezcla con la de otro.
+    Devuelve {foto: cajas}, los tiempos por foto (s) y lo que tardó en cargar el modelo.
+    """
+    import django
+    django.setup()
+    from gestion_recuerdos.analisis import detectar_en_archivo, obtener_detector
+    from gestion_recuerdos.cache_descargas import leer_imagen_abierta
+
+    inicio = time.perf_counter()
+    detector = obtener_detector(nombre)
+    carga = time.perf_counter() - inicio
+
+    cajas, tiempos = {}, []
+    for ruta in fotos:
+        for _ in range(repeticiones):
+            with open(ruta, 'rb') as archivo:
+                inicio = time.perf_counter()
+                encontradas, _ = detectar_en_archivo(lambda flags: leer_imagen_abierta(archivo, flags), detector)
+                tiempos.append(time.perf_counter() - inicio)
+        cajas[os.path.basename(ruta)] = [list(c) for c in encontradas]
+    return {'cajas': cajas, 'tiempos': tiempos, 'carga': carga, 'memoria_pico_mb': _memoria_pico_mb()}
+
+
+def _comparar(encontradas, esperadas, umbral):
+    """Empareja cada caja etiquetada con la detección que más se le superpone. Devuelve los aciertos."""
+    from gestion_recuerdos.analisis import solape
+    libres = list(encontradas)
+    aciertos = 0
+    for esperada in esperadas:
+        if not libres:
+            break
+        mejor = max(libres, key=lambda c: solape(c, esperada))
+        if solape(mejor, esperada) >= umbral:
+            aciertos += 1
+            libres.remove(mejor)
+    return aciertos
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los detectores de rostros sobre una carpeta local de fotos de prueba: "
+        "latencia por foto, fotos por segundo, memoria pico y recall contra cajas etiquetadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('carpeta', help="Carpeta con las fotos de prueba.")
+        parser.add_argument(
+            '--etiquetas',
+            help="JSON {\"foto.jpg\": [[x, y, ancho, alto], ...]} (por defecto <carpeta>/etiquetas.json).",
+        )
+        parser.add_argument('--detectores', nargs='+', choices=sorted(DETECTORES), help="Por defecto, todos.")
+        parser.add_argument('--repeticiones', type=int, default=1, help="Veces que se analiza cada foto.")
+        parser.add_argument('--iou', type=float, default=0.5, help="Superposición mínima para contar un acierto.")
+        parser.add_argument('--json', help="Guarda también el resultado completo en este archivo.")
+
+    def handle(self, *args, **opciones):
+        carpeta = opciones['carpeta']
+        if not os.path.isdir(carpeta):
+            raise CommandError(f"No existe la carpeta {carpeta}.")
+        fotos = sorted(
+            os.path.join(carpeta, nombre) for nombre in os.listdir(carpeta)
+            if nombre.lower().endswith(EXTENSIONES)
+        )
+        if not fotos:
+            raise CommandError(f"No hay fotos en {carpeta}.")
+
+        ruta_etiquetas = opciones['etiquetas'] or os.path.join(carpeta, 'etiquetas.json')
+        etiquetas = {}
+        if os.path.exists(ruta_etiquetas):
+            with open(ruta_etiquetas, encoding='utf-8') as archivo:
+                etiquetas = json.load(archivo)
+        else:
+            self.stderr.write(f"Sin {ruta_etiquetas}: no se calcula el recall.")
+
+        resultados = {}
+        contexto = multiprocessing.get_context('spawn')
+        for nombre in opciones['detectores'] or sorted(DETECTORES):
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                try:
+                    medicion = pool.submit(_medir, nombre, fotos, max(1, opciones['repeticiones'])).result()
+                except ValueError as e:
+                    self.stderr.write(f"{nombre}: {e}")
+                    continue
+            resultados[nombre] = self.resumir(medicion, etiquetas, opciones['iou'])
+
+        self.mostrar(resultados, len(fotos))
+        if opciones['json']:
+            with open(opciones['json'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultados, archivo, indent=2)
+
+    def resumir(self, medicion, etiquetas, umbral):
+        tiempos = medicion['tiempos']
+        esperadas = encontradas = en_etiquetadas = aciertos = 0
+        for foto, cajas in medicion['cajas'].items():
+            encontradas += len(cajas)
+            if foto in etiquetas:
+                esperadas += len(etiquetas[foto])
+                en_etiquetadas += len(cajas)
+                aciertos += _comparar([tuple(c) for c in cajas], [tuple(c) for c in etiquetas[foto]], umbral)
+        return {
+            'carga_ms': round(medicion['carga'] * 1000, 1),
+            'media_ms': round(1000 * sum(tiempos) / len(tiempos), 1),
+            'p50_ms': round(1000 * _percentil(tiempos, 50), 1),
+            'p95_ms': round(1000 * _percentil(tiempos, 95), 1),
+            'fotos_por_segundo': round(len(tiempos) / sum(tiempos), 2) if sum(tiempos) else None,
+            'memoria_pico_mb': medicion['memoria_pico_mb'],
+            'rostros': encontradas,
+            'recall': round(aciertos / esperadas, 3) if esperadas else None,
+            'precision': round(aciertos / en_etiquetadas, 3) if en_etiquetadas else None,
+            'cajas': medicion['cajas'],
+        }
+
+    def mostrar(self, resultados, cantidad):
+        self.stdout.write(f"{cantidad} fotos")
+        columnas = ['carga_ms', 'media_ms', 'p50_ms', 'p95_ms', 'fotos_por_segundo', 'memoria_pico_mb', 'rostros', 'recall', 'precision']
+        self.stdout.write(f"{'detector':<10}" + "".join(f"{c:>18}" for c in columnas))
+        for nombre, fila in resultados.items():
+            self.stdout.write(f"{nombre:<10}" + "".join(f"{'-' if fila[c] is None else fila[c]:>18}" for c in columnas))
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from gestion_recuerdos.gedcom import exportar_gedcom
+
+
+class Command(BaseCommand):
+    help = "Exporta todos los familiares y sus relaciones a un archivo GEDCOM ('-' para la salida estándar)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del archivo .ged a crear, o '-'")
+        parser.add_argument('--gedcom', dest='version_gedcom', choices=['7', '5.5.1'], default='7',
+                            help="Versión de GEDCOM (por defecto 7).")
+
+    def handle(self, *args, **opciones):
+        if opciones['archivo'] == '-':
+            for bloque in exportar_gedcom(opciones['version_gedcom']):
+                sys.stdout.write(bloque)
+            return
+        with open(opciones['archivo'], 'w', encoding='utf-8', newline='\n') as archivo:
+            for bloque in exportar_gedcom(opciones['version_gedcom']):
+                archivo.write(bloque)
+        self.stdout.write(self.style.SUCCESS(
+            f"GEDCOM {opciones['version_gedcom']} escrito en {opciones['archivo']}."
+        ))
@@ -0,0 +1,58 @@
+import asyncio
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_recuerdos.drive import buscar_credenciales_guardadas
+from gestion_recuerdos.drive_async import ClienteDriveAsync, ErrorDrive
+from gestion_recuerdos.metadatos import anios_con_fotos, guardar_leidos, leer_metadatos, pendientes
+
+POR_TANDA = 200
+
+
+class Command(BaseCommand):
+    help = (
+        "Lee fecha, lugar (GPS), cámara y orientación de las fotos que todavía no los tienen: "
+        "del imageMediaMetadata de Drive o, si no hay, de la cabecera EXIF bajada con un Range (nunca la foto entera)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--credenciales', help="Archivo JSON con las credenciales (por defecto, la última sesión activa).")
+        parser.add_argument('--todas', action='store_true', help="Vuelve a leer también las que ya están al día.")
+
+    def handle(self, *args, **opciones):
+        creds_data = buscar_credenciales_guardadas(opciones['credenciales'])
+        if not creds_data:
+            raise CommandError("No hay credenciales de Google: inicia sesión en la web o usa --credenciales.")
+
+        drive_ids = pendientes(opciones['todas'])
+        self.stdout.write(f"{len(drive_ids)} fotos sin metadatos.")
+
+        origenes, fallidas = asyncio.run(self.extraer(ClienteDriveAsync(creds_data), drive_ids))
+        anios = anios_con_fotos()
+        self.stdout.write(self.style.SUCCESS(
+            f"{origenes['DRIVE']} desde Drive, {origenes['EXIF']} desde la cabecera EXIF, "
+            f"{origenes['NINGUNO']} sin metadatos, {fallidas} con error. "
+            + (f"Hay fotos fechadas de {anios[0]['anio']} a {anios[-1]['anio']}." if anios else "")
+        ))
+
+    async def extraer(self, cliente, drive_ids):
+        origenes, fallidas = Counter(), 0
+        for inicio in range(0, len(drive_ids), POR_TANDA):
+            tanda = drive_ids[inicio:inicio + POR_TANDA]
+            # El semáforo del cliente limita cuántas llamadas hay en vuelo a la vez.
+            resultados = await asyncio.gather(*(self.leer(cliente, drive_id) for drive_id in tanda))
+            leidos = [leido for leido in resultados if leido is not None]
+            fallidas += len(tanda) - len(leidos)
+            origenes.update(leido['origen'] for leido in leidos)
+            await sync_to_async(guardar_leidos)(leidos)
+            self.stdout.write(f"  {inicio + len(tanda)}/{len(drive_ids)}")
+        return origenes, fallidas
+
+    async def leer(self, cliente, drive_id):
+        try:
+            return await leer_metadatos(cliente, drive_id)
+        except ErrorDrive as e:
+            self.stderr.write(f"  Error en {drive_id}: {e}")
+            return None
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from gestion_recuerdos.miniaturas import generar_miniatura_de_archivo
+from gestion_recuerdos.models import RostroDetectado
+
+
+class Command(BaseCommand):
+    help = "Genera las miniaturas de la galería para los rostros guardados que todavía no la tienen."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true', help="Regenera también las que ya existen.")
+
+    def handle(self, *args, **opciones):
+        rostros = RostroDetectado.objects.only('id', 'foto_recorte', 'miniatura')
+        if not opciones['todos']:
+            rostros = rostros.filter(miniatura='')
+
+        generadas, lote = 0, []
+        for rostro in rostros.iterator(chunk_size=500):
+            rostro.miniatura = generar_miniatura_de_archivo(rostro.foto_recorte.name)
+            if not rostro.miniatura:
+                continue
+            lote.append(rostro)
+            if len(lote) >= 500:
+                RostroDetectado.objects.bulk_update(lote, ['miniatura'])
+                generadas += len(lote)
+                lote = []
+        if lote:
+            RostroDetectado.objects.bulk_update(lote, ['miniatura'])
+            generadas += len(lote)
+
+        self.stdout.write(self.style.SUCCESS(f"{generadas} miniaturas generadas."))
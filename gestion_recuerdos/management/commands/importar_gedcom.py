@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_recuerdos.gedcom import LOTE, importar_gedcom
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa personas y familias desde un archivo GEDCOM (5.5.1 o 7). "
+        "Volver a importar el mismo archivo actualiza las personas en vez de duplicarlas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del archivo .ged")
+        parser.add_argument('--lote', type=int, default=LOTE, help=f"Personas por inserción (por defecto {LOTE}).")
+        parser.add_argument('--codificacion', default='utf-8-sig', help="Codificación del archivo (por defecto UTF-8).")
+
+    def handle(self, *args, **opciones):
+        def informar(resumen):
+            self.stdout.write(f"  {resumen['personas']} personas...")
+
+        try:
+            with open(opciones['archivo'], encoding=opciones['codificacion'], errors='replace', newline='') as archivo:
+                resumen = importar_gedcom(archivo, opciones['lote'], informar)
+        except OSError as e:
+            raise CommandError(f"No se pudo leer el archivo: {e}")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['personas']} personas y {resumen['familias']} familias leídas; "
+            f"{resumen['relaciones_nuevas']} relaciones nuevas."
+        ))
+        if resumen['relaciones_sin_persona']:
+            self.stdout.write(self.style.WARNING(
+                f"{resumen['relaciones_sin_persona']} relaciones apuntan a personas que no están en el archivo."
+            ))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gestion_recuerdos.temporales import limpiar_vencidos
+
+
+class Command(BaseCommand):
+    help = "Borra las carpetas de recortes temporales (media/temp_caras) más viejas que TEMP_CARAS_TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=settings.TEMP_CARAS_TTL, help="Antigüedad máxima en segundos.")
+
+    def handle(self, *args, **opciones):
+        borradas = limpiar_vencidos(opciones['ttl'])
+        self.stdout.write(self.style.SUCCESS(f"{borradas} carpetas temporales borradas."))
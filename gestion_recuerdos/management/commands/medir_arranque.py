@@ -0,0 +1,117 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Se ejecuta en un intérprete nuevo (python -c): este proceso ya tiene Django cargado y no serviría
+# para medir. Importa los componentes en el orden en que los carga un worker y después de cada uno
+# anota el tiempo y la memoria residente (RSS) del proceso.
+_MEDICION = r'''
+import json, os, sys, time
+
+def rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as archivo:
+            return int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+pasos = []
+def medir(nombre, funcion):
+    inicio = time.perf_counter()
+    funcion()
+    pasos.append((nombre, time.perf_counter() - inicio, rss()))
+
+medir('intérprete', lambda: None)
+import django
+medir('django.setup() (settings, apps, modelos, señales)', django.setup)
+from django.conf import settings
+from importlib import import_module
+medir('core/urls.py y vistas', lambda: import_module(settings.ROOT_URLCONF))
+for modulo in ('numpy', 'cv2', 'googleapiclient.discovery', 'google_auth_oauthlib.flow', 'httpx'):
+    medir(modulo, lambda: import_module(modulo))
+from gestion_recuerdos.carga_perezosa import cargar_todos
+medir('servicios de la app (carga_perezosa)', cargar_todos)
+
+def modelos():
+    from gestion_recuerdos.analisis import obtener_detector
+    from gestion_recuerdos.reconocimiento import _reconocedor, reconocimiento_disponible
+    obtener_detector()
+    if reconocimiento_disponible():
+        _reconocedor()
+medir('detector y modelo de reconocimiento', modelos)
+
+if '--sin-bd' not in sys.argv:
+    from gestion_recuerdos.indice_rostros import obtener_indice
+    from gestion_recuerdos.arbol import obtener_arbol
+    medir('índice de rostros (BD)', obtener_indice)
+    medir('árbol genealógico (BD)', obtener_arbol)
+print(json.dumps(pasos))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide cuánto tarda y cuánta memoria (RSS) ocupa arrancar un proceso, componente por componente: "
+        "Django, las vistas, OpenCV, numpy, los clientes de Google, los modelos y el índice de rostros."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=3, help="Procesos nuevos a medir (se informa la mediana).")
+        parser.add_argument('--sin-bd', action='store_true', help="No carga el índice de rostros ni el árbol.")
+        parser.add_argument('--json', action='store_true', help="Imprime el resultado en JSON.")
+
+    def handle(self, *args, **opciones):
+        entorno = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+        entorno.pop('GESTION_RECUERDOS_WEB', None)   # se mide el arranque liviano, sin precalentar
+        corridas = []
+        for _ in range(max(1, opciones['repeticiones'])):
+            argumentos = [sys.executable, '-c', _MEDICION] + (['--sin-bd'] if opciones['sin_bd'] else [])
+            resultado = subprocess.run(argumentos, capture_output=True, text=True, env=entorno, cwd=settings.BASE_DIR)
+            if resultado.returncode != 0:
+                raise CommandError(f"La medición falló:\n{resultado.stderr}")
+            corridas.append(json.loads(resultado.stdout.strip().splitlines()[-1]))
+
+        filas = []
+        for i, (nombre, _, _) in enumerate(corridas[0]):
+            segundos = statistics.median(corrida[i][1] for corrida in corridas)
+            rss = [corrida[i][2] for corrida in corridas]
+            anterior = [corrida[i - 1][2] for corrida in corridas] if i else [0] * len(corridas)
+            delta = statistics.median(a - b for a, b in zip(rss, anterior)) if None not in rss + anterior else None
+            filas.append({'componente': nombre, 'segundos': segundos, 'rss_mb': _mb(statistics.median(rss)) if None not in rss else None,
+                          'delta_rss_mb': _mb(delta) if delta is not None else None})
+
+        if opciones['json']:
+            self.stdout.write(json.dumps(filas, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(f"{'Componente':<52} {'Tiempo':>9} {'+RSS':>9} {'RSS':>9}")
+        for fila in filas:
+            self.stdout.write(
+                f"{fila['componente']:<52} {fila['segundos'] * 1000:>7.0f}ms "
+                f"{_texto_mb(fila['delta_rss_mb']):>9} {_texto_mb(fila['rss_mb']):>9}"
+            )
+        hasta_vistas = next(i for i, fila in enumerate(filas) if fila['componente'].startswith('core/urls.py'))
+        arranque = sum(fila['segundos'] for fila in filas[1:hasta_vistas + 1])
+        total = sum(fila['segundos'] for fila in filas[1:])
+        self.stdout.write(self.style.SUCCESS(
+            f"Arranque liviano (manage.py, migraciones, galería): {arranque * 1000:.0f} ms, "
+            f"{_texto_mb(filas[hasta_vistas]['rss_mb'])}. Worker precalentado: {total * 1000:.0f} ms, "
+            f"{_texto_mb(filas[-1]['rss_mb'])}."
+        ))
+
+
+def _mb(valor):
+    return round(valor / 1024 ** 2, 1)
+
+
+def _texto_mb(valor):
+    return 'n/d' if valor is None else f"{valor:.1f} MB"
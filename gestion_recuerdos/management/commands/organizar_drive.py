@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_recuerdos.drive import buscar_credenciales_guardadas, crear_servicio
+from gestion_recuerdos.models import TrabajoLote
+from gestion_recuerdos.reorganizar import ejecutar_organizacion, esta_colgado, tomar_colgado
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve todas las fotos de la raíz de Drive a 'Genealogia' usando peticiones batch de 100. "
+        "Si hay un trabajo de organización colgado (su proceso se reinició), lo retoma."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reanudar', type=int, help="ID de un TrabajoLote de organización interrumpido para continuarlo.")
+        parser.add_argument('--credenciales', help="Archivo JSON con las credenciales (por defecto, la última sesión activa).")
+
+    def handle(self, *args, **opciones):
+        creds_data = buscar_credenciales_guardadas(opciones['credenciales'])
+        if not creds_data:
+            raise CommandError("No hay credenciales de Google: inicia sesión en la web o usa --credenciales.")
+
+        trabajo = self.elegir_trabajo(opciones['reanudar'])
+        try:
+            trabajo = ejecutar_organizacion(
+                trabajo, crear_servicio(creds_data),
+                informar=lambda t: self.stdout.write(f"  {t.procesadas}/{t.total} fotos, {t.fallidas} errores"),
+            )
+        except Exception as e:
+            TrabajoLote.objects.filter(id=trabajo.id).update(estado='FALLIDO', mensaje=str(e))
+            raise
+        self.stdout.write(self.style.SUCCESS(f"Trabajo {trabajo.id}: {trabajo.mensaje}"))
+
+    def elegir_trabajo(self, trabajo_id):
+        if trabajo_id:
+            try:
+                trabajo = TrabajoLote.objects.get(id=trabajo_id, tipo='ORGANIZAR')
+            except TrabajoLote.DoesNotExist:
+                raise CommandError(f"No existe el trabajo de organización {trabajo_id}.")
+            if trabajo.estado == 'TERMINADO':
+                raise CommandError(f"El trabajo {trabajo_id} ya terminó.")
+            if trabajo.estado in ('PENDIENTE', 'EN_CURSO') and not (esta_colgado(trabajo) and tomar_colgado(trabajo)):
+                raise CommandError(f"El trabajo {trabajo_id} sigue en curso en otro proceso.")
+            self.stdout.write(f"Retomando el trabajo {trabajo.id}.")
+            return trabajo
+
+        activo = TrabajoLote.objects.filter(tipo='ORGANIZAR', estado__in=('PENDIENTE', 'EN_CURSO')).order_by('-id').first()
+        if activo is not None:
+            if not esta_colgado(activo):
+                raise CommandError(f"El trabajo {activo.id} está organizando Drive en este momento.")
+            if tomar_colgado(activo):
+                self.stdout.write(f"El trabajo {activo.id} había quedado colgado: se retoma.")
+                return activo
+        return TrabajoLote.objects.create(tipo='ORGANIZAR', carpeta_id='')
@@ -0,0 +1,358 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import reverse
+
+from gestion_recuerdos import cache_descargas, drive_falso
+from gestion_recuerdos.drive_falso import arbol_de_prueba
+from gestion_recuerdos.models import TrabajoLote
+
+ENDPOINTS = ['organizar_drive', 'ver_fotos', 'sincronizar_drive', 'analizar_rostros', 'analizar_en_vivo', 'galeria', 'linea_de_tiempo']
+ESPERA_TRABAJO_SEGUNDOS = 300
+TOLERANCIA_MINIMA_MS = 5     # diferencias de p95 menores a esto son ruido, no regresiones
+
+
+def _rss():
+    try:
+        with open('/proc/self/statm') as archivo:
+            return int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def _percentil(valores, p):
+    """Percentil por rango más cercano (sobre los valores ya ordenados)."""
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, max(0, int(round(p / 100 * len(valores) + 0.5)) - 1))]
+
+
+def _pedir(cliente, url):
+    """GET con el cliente de pruebas; lee entero el cuerpo (también si es streaming). Devuelve (respuesta, bytes, consultas)."""
+    respuesta = cliente.get(url)
+    contenido = b''.join(respuesta.streaming_content) if respuesta.streaming else respuesta.content
+    return respuesta, contenido, int(respuesta.get('X-Consultas-DB', 0) or 0)
+
+
+def _error(respuesta, contenido):
+    if respuesta.status_code >= 400:
+        return f"HTTP {respuesta.status_code}: {contenido[:200].decode(errors='replace')}"
+    # Varias vistas atrapan la excepción y responden 200 con "Error: ..." (o el evento 'fallo' en el SSE).
+    if contenido.startswith(b'Error') or b'event: fallo' in contenido:
+        return contenido[:300].decode(errors='replace')
+    return None
+
+
+#---------------------------------------------------------------------------------
+# Escenarios: cada uno hace lo que haría un usuario en ese endpoint y devuelve (error o None, consultas a la BD).
+def _simple(nombre_url, con_foto=False):
+    def escenario(cliente, foto):
+        respuesta, contenido, consultas = _pedir(cliente, reverse(nombre_url, args=[foto] if con_foto else []))
+        return _error(respuesta, contenido), consultas
+    return escenario
+
+
+def _analizar_en_vivo(cliente, foto):
+    """La página y después su flujo de eventos completo, como lo haría el EventSource del navegador."""
+    respuesta, contenido, consultas = _pedir(cliente, reverse('analizar_en_vivo', args=[foto]))
+    error = _error(respuesta, contenido)
+    eventos = re.search(rb"/analizar/[^/'\"]+/eventos/[0-9a-f]{32}/", contenido)
+    if error or not eventos:
+        return error or "La página no trae la URL de eventos", consultas
+    respuesta, contenido, mas = _pedir(cliente, eventos.group(0).decode())
+    return _error(respuesta, contenido), consultas + mas
+
+
+def _organizar_drive(cliente, foto):
+    """Lanza la organización y espera a que el trabajo en segundo plano termine (se mide de punta a punta)."""
+    respuesta, contenido, consultas = _pedir(cliente, reverse('organizar_drive'))
+    if respuesta.status_code != 302:
+        return _error(respuesta, contenido) or f"Se esperaba una redirección, llegó {respuesta.status_code}", consultas
+    trabajo_id = int(re.search(r'/trabajos/(\d+)/', respuesta['Location']).group(1))
+    limite = time.monotonic() + ESPERA_TRABAJO_SEGUNDOS
+    while time.monotonic() < limite:
+        trabajo = TrabajoLote.objects.get(id=trabajo_id)
+        if trabajo.estado in ('TERMINADO', 'FALLIDO'):
+            return (trabajo.mensaje if trabajo.estado == 'FALLIDO' or trabajo.fallidas else None), consultas
+        time.sleep(0.05)
+    return f"El trabajo {trabajo_id} no terminó en {ESPERA_TRABAJO_SEGUNDOS} s", consultas
+
+
+ESCENARIOS = {
+    'organizar_drive': _organizar_drive,
+    'ver_fotos': _simple('ver_fotos'),
+    'sincronizar_drive': _simple('sincronizar_drive'),
+    'analizar_rostros': _simple('analizar_rostros', con_foto=True),
+    'analizar_en_vivo': _analizar_en_vivo,
+    'galeria': _simple('galeria'),
+    'linea_de_tiempo': _simple('linea_de_tiempo'),
+}
+# organizar_drive mueve las fotos de Drive: se corre una sola vez, antes que el resto.
+UNA_SOLA_VEZ = {'organizar_drive'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de punta a punta: levanta un Drive falso en memoria (árbol, latencia y 429 configurables) "
+        "y una base de datos descartable, y llama a las vistas de verdad desde varios hilos a la vez. "
+        "Informa por endpoint latencia p50/p95/p99, peticiones por segundo, consultas a la BD, llamadas a Drive y memoria. "
+        "Con --guardar / --comparar sirve para detectar regresiones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help=f"Separados por coma (de: {', '.join(ENDPOINTS)}).")
+        parser.add_argument('--peticiones', type=int, default=40, help="Peticiones medidas por endpoint.")
+        parser.add_argument('--concurrencia', type=int, default=8, help="Hilos pidiendo a la vez.")
+        parser.add_argument('--calentar', type=int, default=1, help="Peticiones previas por endpoint que no se miden (la primera se informa aparte).")
+        parser.add_argument('--arbol', help="JSON con el árbol de Drive (ver drive_falso.arbol_de_prueba) o con todas las opciones del Drive falso.")
+        parser.add_argument('--carpetas', type=int, default=10, help="Árbol generado: carpetas de eventos dentro de 'Genealogia'.")
+        parser.add_argument('--fotos-por-carpeta', type=int, default=20)
+        parser.add_argument('--sueltas', type=int, default=30, help="Árbol generado: fotos sueltas en la raíz (para organizar_drive).")
+        parser.add_argument('--imagenes', help="Carpeta con fotos de ejemplo (por defecto se generan fotos sintéticas, sin caras).")
+        parser.add_argument('--latencia-ms', type=float, default=40, help="Latencia de cada llamada a Drive.")
+        parser.add_argument('--variacion-ms', type=float, default=20, help="Latencia extra al azar, entre 0 y este valor.")
+        parser.add_argument('--tasa-429', type=float, default=0.0, help="Fracción de llamadas a Drive que responden 429 (0.02 = 2%%).")
+        parser.add_argument('--mbps', type=float, default=0, help="Ancho de banda simulado de las descargas (0 = sin límite).")
+        parser.add_argument('--tracemalloc', action='store_true', help="Mide también el pico de memoria de Python por endpoint (más lento).")
+        parser.add_argument('--json', action='store_true', help="Imprime el resultado en JSON.")
+        parser.add_argument('--guardar', help="Guarda el resultado en este archivo JSON (la línea de base).")
+        parser.add_argument('--comparar', help="Compara contra una línea de base guardada y falla si algún endpoint empeoró.")
+        parser.add_argument('--tolerancia', type=float, default=0.25, help="Cuánto puede empeorar el p95 o las peticiones/s (0.25 = 25%%).")
+
+    def handle(self, *args, **opciones):
+        endpoints = [e.strip() for e in opciones['endpoints'].split(',') if e.strip()]
+        desconocidos = set(endpoints) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f"Endpoints desconocidos: {', '.join(sorted(desconocidos))}")
+
+        config = {
+            'arbol': arbol_de_prueba(opciones['carpetas'], opciones['fotos_por_carpeta'], opciones['sueltas']),
+            'latencia_ms': opciones['latencia_ms'], 'variacion_ms': opciones['variacion_ms'],
+            'tasa_429': opciones['tasa_429'], 'mbps': opciones['mbps'], 'imagenes': opciones['imagenes'],
+        }
+        if opciones['arbol']:
+            with open(opciones['arbol'], encoding='utf-8') as archivo:
+                datos = json.load(archivo)
+            config.update(datos if 'arbol' in datos else {'arbol': datos})
+
+        carpeta = tempfile.mkdtemp(prefix='prueba_carga_')
+        try:
+            resultado = self.correr(endpoints, config, carpeta, opciones)
+        finally:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+        if opciones['guardar']:
+            with open(opciones['guardar'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+        if opciones['json']:
+            self.stdout.write(json.dumps(resultado, ensure_ascii=False, indent=2))
+        else:
+            self.imprimir(resultado)
+        if opciones['comparar']:
+            self.comparar(resultado, opciones['comparar'], opciones['tolerancia'])
+
+    #---------------------------------------------------------------------------------
+    def correr(self, endpoints, config, carpeta, opciones):
+        """
+        Línea por línea:
+        1. Crea una base de datos de prueba (SQLite en la carpeta temporal) con todas las migraciones:
+           la prueba nunca toca los datos reales.
+        2. Apunta MEDIA_ROOT, la caché de descargas y el almacenamiento de recortes a la carpeta temporal
+           y activa el Drive falso (settings.DRIVE_FALSO).
+        3. Corre cada endpoint por turno (calentamiento + peticiones medidas) y junta los números.
+        """
+        conexion = connections['default']
+        if conexion.vendor == 'sqlite':
+            conexion.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(carpeta, 'prueba_carga.sqlite3')
+        media = os.path.join(carpeta, 'media')
+        almacenes = {**settings.STORAGES, 'recortes': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media},
+        }}
+
+        setup_test_environment()
+        bases = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            with override_settings(
+                DRIVE_FALSO=config, MEDIA_ROOT=media, CACHE_DRIVE_CARPETA=os.path.join(media, 'cache_drive'),
+                STORAGES=almacenes, PERFIL_PETICIONES=False, DEBUG=False,
+            ):
+                cache_descargas._cache = None     # que la caché de descargas se arme con la carpeta temporal
+                falso = drive_falso.obtener()
+                fotos = falso.fotos()
+                self.stderr.write(
+                    f"Drive falso: {len(falso.archivos)} archivos ({len(fotos)} fotos), "
+                    f"latencia {config['latencia_ms']:.0f}±{config['variacion_ms']:.0f} ms, 429 en el {config['tasa_429']:.1%}."
+                )
+                if opciones['tracemalloc']:
+                    tracemalloc.start()
+                filas = [self.fase(nombre, falso, fotos, opciones) for nombre in endpoints]
+                cache_descargas._cache = None
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            connections.close_all()
+            teardown_databases(bases, verbosity=0)
+            teardown_test_environment()
+
+        return {
+            'configuracion': {
+                'peticiones': opciones['peticiones'], 'concurrencia': opciones['concurrencia'],
+                'latencia_ms': config['latencia_ms'], 'variacion_ms': config['variacion_ms'],
+                'tasa_429': config['tasa_429'], 'mbps': config['mbps'], 'fotos': len(fotos),
+            },
+            'endpoints': filas,
+        }
+
+    def fase(self, nombre, falso, fotos, opciones):
+        escenario = ESCENARIOS[nombre]
+        peticiones = 1 if nombre in UNA_SOLA_VEZ else max(1, opciones['peticiones'])
+        concurrencia = 1 if nombre in UNA_SOLA_VEZ else max(1, opciones['concurrencia'])
+        calentar = 0 if nombre in UNA_SOLA_VEZ else max(0, opciones['calentar'])
+
+        # Calentamiento: la primera petición paga lo que se hace una vez (rastreo completo, cargar el detector...).
+        primera = None
+        if calentar:
+            cliente = self.cliente()
+            for i in range(calentar):
+                inicio = time.perf_counter()
+                escenario(cliente, fotos[-1 - i % len(fotos)])
+                primera = primera if primera is not None else time.perf_counter() - inicio
+            connections.close_all()
+
+        antes = falso.estadisticas()
+        rss_inicio = _rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        latencias, errores, consultas = [], [], []
+        siguiente = iter(range(peticiones))
+        lock = threading.Lock()
+
+        def trabajador():
+            cliente = self.cliente()
+            try:
+                while True:
+                    with lock:
+                        i = next(siguiente, None)
+                    if i is None:
+                        return
+                    inicio = time.perf_counter()
+                    try:
+                        error, cuantas = escenario(cliente, fotos[i % len(fotos)])
+                    except Exception as e:
+                        error, cuantas = f"{type(e).__name__}: {e}", 0
+                    duracion = time.perf_counter() - inicio
+                    with lock:
+                        latencias.append(duracion)
+                        consultas.append(cuantas)
+                        if error:
+                            errores.append(error)
+            finally:
+                connections.close_all()   # cada hilo tiene su propia conexión a la BD
+
+        pico = [rss_inicio or 0]
+        corriendo = threading.Event()
+
+        def medir_memoria():
+            while not corriendo.wait(0.01):
+                pico[0] = max(pico[0], _rss() or 0)
+
+        muestreo = threading.Thread(target=medir_memoria, daemon=True)
+        muestreo.start()
+        inicio = time.perf_counter()
+        hilos = [threading.Thread(target=trabajador, name=f"carga-{nombre}-{n}") for n in range(concurrencia)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        total = time.perf_counter() - inicio
+        corriendo.set()
+        muestreo.join()
+        despues = falso.estadisticas()
+
+        latencias.sort()
+        ms = lambda segundos: round(segundos * 1000, 1) if segundos is not None else None
+        mb = lambda valor: round(valor / 1024 ** 2, 1) if valor is not None else None
+        fila = {
+            'endpoint': nombre, 'peticiones': len(latencias), 'errores': len(errores), 'concurrencia': concurrencia,
+            'primera_ms': ms(primera),
+            'p50_ms': ms(_percentil(latencias, 50)), 'p95_ms': ms(_percentil(latencias, 95)),
+            'p99_ms': ms(_percentil(latencias, 99)), 'max_ms': ms(latencias[-1] if latencias else None),
+            'peticiones_por_segundo': round(len(latencias) / total, 2) if total else None,
+            'consultas_db_promedio': round(sum(consultas) / len(consultas), 1) if consultas else None,
+            'llamadas_drive_promedio': round((despues['total_llamadas'] - antes['total_llamadas']) / max(len(latencias), 1), 1),
+            'errores_429': despues['errores_429'] - antes['errores_429'],
+            'mb_descargados': mb(despues['bytes_servidos'] - antes['bytes_servidos']),
+            'rss_inicio_mb': mb(rss_inicio), 'rss_pico_mb': mb(pico[0]), 'rss_fin_mb': mb(_rss()),
+            'ejemplos_de_error': sorted(set(errores))[:3],
+        }
+        if tracemalloc.is_tracing():
+            fila['python_pico_mb'] = mb(tracemalloc.get_traced_memory()[1])
+        self.stderr.write(f"  {nombre}: {fila['peticiones']} peticiones, p95 {fila['p95_ms']} ms, {fila['errores']} errores")
+        return fila
+
+    @staticmethod
+    def cliente():
+        """Un navegador con la sesión ya iniciada (credenciales del Drive falso)."""
+        cliente = Client(raise_request_exception=False)
+        sesion = cliente.session
+        sesion['credentials'] = dict(drive_falso.CREDENCIALES)
+        sesion.save()
+        return cliente
+
+    #---------------------------------------------------------------------------------
+    def imprimir(self, resultado):
+        config = resultado['configuracion']
+        self.stdout.write(
+            f"{config['fotos']} fotos, {config['peticiones']} peticiones por endpoint con {config['concurrencia']} hilos, "
+            f"Drive a {config['latencia_ms']:.0f}±{config['variacion_ms']:.0f} ms y {config['tasa_429']:.1%} de 429."
+        )
+        self.stdout.write(
+            f"{'Endpoint':<18} {'Pet.':>5} {'Err.':>5} {'1ª':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'pet/s':>7} "
+            f"{'BD/pet':>7} {'Drive/pet':>9} {'429':>4} {'RSS pico':>9} {'ΔRSS':>7}"
+            + (f" {'Python pico':>11}" if any('python_pico_mb' in fila for fila in resultado['endpoints']) else '')
+        )
+        texto = lambda valor, unidad='': '-' if valor is None else f"{valor:.0f}{unidad}"
+        for fila in resultado['endpoints']:
+            delta = fila['rss_fin_mb'] - fila['rss_inicio_mb'] if fila['rss_inicio_mb'] is not None else None
+            self.stdout.write(
+                f"{fila['endpoint']:<18} {fila['peticiones']:>5} {fila['errores']:>5} {texto(fila['primera_ms'], 'ms'):>8} "
+                f"{texto(fila['p50_ms'], 'ms'):>8} {texto(fila['p95_ms'], 'ms'):>8} {texto(fila['p99_ms'], 'ms'):>8} "
+                f"{fila['peticiones_por_segundo']:>7.1f} {fila['consultas_db_promedio']:>7.1f} {fila['llamadas_drive_promedio']:>9.1f} "
+                f"{fila['errores_429']:>4} {texto(fila['rss_pico_mb'], 'MB'):>9} {texto(delta, 'MB'):>7}"
+                + (f" {texto(fila['python_pico_mb'], 'MB'):>11}" if 'python_pico_mb' in fila else '')
+            )
+            for ejemplo in fila['ejemplos_de_error']:
+                self.stdout.write(self.style.WARNING(f"    error: {ejemplo}"))
+
+    def comparar(self, resultado, ruta, tolerancia):
+        """Falla (código de salida 1) si algún endpoint tiene peor p95, menos peticiones/s o más errores que la base."""
+        with open(ruta, encoding='utf-8') as archivo:
+            base = {fila['endpoint']: fila for fila in json.load(archivo)['endpoints']}
+        regresiones = []
+        for fila in resultado['endpoints']:
+            anterior = base.get(fila['endpoint'])
+            if anterior is None:
+                continue
+            if (fila['p95_ms'] or 0) > (anterior['p95_ms'] or 0) * (1 + tolerancia) and \
+                    (fila['p95_ms'] or 0) - (anterior['p95_ms'] or 0) > TOLERANCIA_MINIMA_MS:
+                regresiones.append(f"{fila['endpoint']}: p95 {anterior['p95_ms']} -> {fila['p95_ms']} ms")
+            if fila['peticiones_por_segundo'] < anterior['peticiones_por_segundo'] * (1 - tolerancia):
+                regresiones.append(
+                    f"{fila['endpoint']}: {anterior['peticiones_por_segundo']} -> {fila['peticiones_por_segundo']} peticiones/s"
+                )
+            if fila['errores'] > anterior['errores']:
+                regresiones.append(f"{fila['endpoint']}: errores {anterior['errores']} -> {fila['errores']}")
+        if regresiones:
+            raise CommandError("Regresiones respecto de la base:\n  " + "\n  ".join(regresiones))
+        self.stdout.write(self.style.SUCCESS(f"Sin regresiones respecto de {ruta} (tolerancia {tolerancia:.0%})."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_recuerdos.drive import buscar_credenciales_guardadas, crear_servicio
+from gestion_recuerdos.models import DriveArchivo, EstadoSincronizacion
+from gestion_recuerdos.sincronizacion import aplicar_cambios, rastreo_completo
+
+
+class Command(BaseCommand):
+    help = (
+        "Sincroniza la tabla local DriveArchivo con la carpeta 'Genealogia' de Drive. "
+        "La primera vez (o con --completo) recorre todo; después sólo aplica cambios."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help="Fuerza un rastreo completo desde cero.")
+        parser.add_argument('--credenciales', help="Archivo JSON con las credenciales (por defecto, la última sesión activa).")
+
+    def handle(self, *args, **opciones):
+        creds_data = buscar_credenciales_guardadas(opciones['credenciales'])
+        if not creds_data:
+            raise CommandError("No hay credenciales de Google: inicia sesión en la web o usa --credenciales.")
+        service = crear_servicio(creds_data)
+
+        estado = EstadoSincronizacion.objects.filter(clave='drive').first()
+        if estado is None or opciones['completo']:
+            if rastreo_completo(service) is None:
+                raise CommandError("No existe la carpeta 'Genealogia' en Drive.")
+            self.stdout.write(f"Rastreo completo: {DriveArchivo.objects.count()} elementos.")
+        else:
+            cambios = aplicar_cambios(service, estado)
+            self.stdout.write(f"{cambios} cambios aplicados.")
@@ -0,0 +1,325 @@
+from datetime import datetime
+
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from .drive import MIME_CARPETA
+from .models import DriveArchivo, MetadatosFoto, RostroDetectado
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Fecha de captura, lugar (GPS), cámara y orientación de cada foto, sin bajar la foto entera.
+# 1. Drive ya lee el EXIF de las fotos y lo devuelve en 'imageMediaMetadata': se pide junto con el
+#    resto de los campos al sincronizar (sincronizacion.CAMPOS_ARCHIVO), así que casi siempre es gratis.
+# 2. Si Drive no lo tiene (fotos que todavía no procesó, formatos raros), el comando extraer_metadatos
+#    baja SÓLO la cabecera del archivo con una petición HTTP "Range" (64 KB, más si el bloque EXIF es
+#    más largo) y la lee con Pillow.
+# Todo queda en la tabla MetadatosFoto con índices por año, evento (carpeta) y zona.
+
+CAMPOS_DRIVE = "imageMediaMetadata(time, location, cameraMake, cameraModel, rotation, width, height)"
+BYTES_CABECERA = 64 * 1024
+MAX_CABECERA = 512 * 1024    # si el EXIF no apareció hasta acá, la foto no lo tiene (o está más adelante)
+POR_TANDA = 500
+
+# rotation de Drive (cuartos de vuelta en sentido horario) -> Orientation del EXIF.
+ORIENTACION_DRIVE = {0: 1, 1: 6, 2: 3, 3: 8}
+
+# Etiquetas EXIF que se usan.
+_IFD_EXIF, _IFD_GPS = 0x8769, 0x8825
+_MARCA, _MODELO, _ORIENTACION, _FECHA = 0x010F, 0x0110, 0x0112, 0x0132
+_FECHA_ORIGINAL, _FECHA_DIGITAL, _ANCHO, _ALTO = 0x9003, 0x9004, 0xA002, 0xA003
+_LAT_REF, _LAT, _LON_REF, _LON, _ALT_REF, _ALT = 1, 2, 3, 4, 5, 6
+
+
+def _fecha(texto):
+    """'2019:07:14 18:03:22' (formato EXIF, también el de Drive) -> datetime, o None si no sirve."""
+    if isinstance(texto, bytes):
+        texto = texto.decode('ascii', 'ignore')
+    texto = (texto or '').strip('\x00 ')
+    try:
+        fecha = datetime.strptime(texto[:19], '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None   # '0000:00:00 00:00:00', vacío o basura
+    if not 1826 <= fecha.year <= timezone.now().year + 1:
+        return None   # reloj de la cámara sin configurar
+    return timezone.make_aware(fecha, timezone.get_default_timezone())
+
+
+def _camara(marca, modelo):
+    marca, modelo = (str(marca or '').strip('\x00 '), str(modelo or '').strip('\x00 '))
+    if marca and modelo.lower().startswith(marca.lower()):
+        return modelo[:120]     # "Canon" + "Canon EOS 40D" -> "Canon EOS 40D"
+    return f"{marca} {modelo}".strip()[:120]
+
+
+def desde_drive(meta):
+    """Convierte el imageMediaMetadata de Drive al dict común (mismas claves que leer_exif)."""
+    ubicacion = meta.get('location') or {}
+    rotacion = meta.get('rotation')
+    return {
+        'fecha_captura': _fecha(meta.get('time')),
+        'latitud': ubicacion.get('latitude'),
+        'longitud': ubicacion.get('longitude'),
+        'altitud': ubicacion.get('altitude'),
+        'camara': _camara(meta.get('cameraMake'), meta.get('cameraModel')),
+        'orientacion': ORIENTACION_DRIVE.get(rotacion) if rotacion is not None else None,
+        'ancho': meta.get('width'),
+        'alto': meta.get('height'),
+    }
+
+
+#---------------------------------------------------------------------------------
+def segmento_exif(datos):
+    """
+    Busca el bloque APP1 "Exif" recorriendo los marcadores JPEG de la cabecera.
+    Devuelve (bloque o None, bytes necesarios): si la cabecera bajada quedó corta,
+    el segundo valor dice hasta qué byte hay que bajar para seguir buscando.
+    """
+    if datos[:4] in (b'II*\x00', b'MM\x00*'):
+        return datos, 0                # TIFF (y muchos RAW): el archivo entero empieza como EXIF
+    if datos[:2] != b'\xff\xd8':
+        return None, 0                 # ni JPEG ni TIFF (PNG, HEIC...): no se busca
+    posicion = 2
+    while True:
+        if posicion + 4 > len(datos):
+            return None, posicion + 4
+        if datos[posicion] != 0xFF:
+            return None, 0             # cabecera rota
+        marcador = datos[posicion + 1]
+        if marcador == 0xFF:
+            posicion += 1              # relleno entre marcadores
+            continue
+        if marcador in (0xD9, 0xDA):
+            return None, 0             # empezó la imagen (o terminó el archivo) sin EXIF
+        fin = posicion + 2 + int.from_bytes(datos[posicion + 2:posicion + 4], 'big')
+        if marcador == 0xE1:
+            if fin > len(datos):
+                return None, fin
+            if datos[posicion + 4:posicion + 10] == b'Exif\x00\x00':
+                return datos[posicion + 4:fin], 0
+        posicion = fin
+
+
+def _grados(valor, referencia):
+    try:
+        grados, minutos, segundos = (float(parte) for parte in valor)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    total = grados + minutos / 60 + segundos / 3600
+    return -total if str(referencia).strip('\x00 ').upper() in ('S', 'W') else total
+
+
+def leer_exif(bloque):
+    """Lee el bloque EXIF (de segmento_exif) con Pillow y devuelve el dict común, o None si está roto."""
+    from PIL import Image
+
+    exif = Image.Exif()
+    try:
+        exif.load(bloque)
+        detalle = exif.get_ifd(_IFD_EXIF)
+        gps = exif.get_ifd(_IFD_GPS)
+    except Exception:
+        return None     # EXIF truncado o mal escrito: cuenta como "sin metadatos"
+
+    fecha = None
+    for texto in (detalle.get(_FECHA_ORIGINAL), detalle.get(_FECHA_DIGITAL), exif.get(_FECHA)):
+        fecha = fecha or _fecha(texto)
+    latitud = _grados(gps.get(_LAT), gps.get(_LAT_REF)) if _LAT in gps else None
+    longitud = _grados(gps.get(_LON), gps.get(_LON_REF)) if _LON in gps else None
+    altitud = None
+    if _ALT in gps:
+        try:
+            altitud = float(gps[_ALT]) * (-1 if gps.get(_ALT_REF) in (1, b'\x01') else 1)
+        except (TypeError, ValueError, ZeroDivisionError):
+            pass
+    orientacion = exif.get(_ORIENTACION)
+    return {
+        'fecha_captura': fecha,
+        'latitud': latitud if latitud is not None and longitud is not None else None,
+        'longitud': longitud if latitud is not None and longitud is not None else None,
+        'altitud': altitud,
+        'camara': _camara(exif.get(_MARCA), exif.get(_MODELO)),
+        'orientacion': orientacion if orientacion in range(1, 9) else None,
+        'ancho': detalle.get(_ANCHO) if isinstance(detalle.get(_ANCHO), int) else None,
+        'alto': detalle.get(_ALTO) if isinstance(detalle.get(_ALTO), int) else None,
+    }
+
+
+async def leer_metadatos(cliente, drive_id):
+    """
+    Línea por línea:
+    1. Pide a Drive el md5, la carpeta y el imageMediaMetadata de la foto (una llamada chica).
+    2. Si Drive no tiene metadatos, baja los primeros BYTES_CABECERA bytes con un Range y busca el EXIF;
+       si el bloque sigue más allá, pide sólo lo que falta (nunca más de MAX_CABECERA).
+    Devuelve el dict común más drive_file_id, md5, origen y carpeta_id (lo guarda guardar_leidos).
+    """
+    archivo = await cliente.obtener(drive_id, f"md5Checksum, parents, {CAMPOS_DRIVE}")
+    leido = {'drive_file_id': drive_id, 'md5': archivo.get('md5Checksum', ''), 'carpeta_id': _carpeta(archivo)}
+    if archivo.get('imageMediaMetadata'):
+        return {**leido, **desde_drive(archivo['imageMediaMetadata']), 'origen': 'DRIVE'}
+
+    datos = b''
+    hasta = BYTES_CABECERA
+    while hasta <= MAX_CABECERA:
+        parte = await cliente.descargar_rango(drive_id, len(datos), hasta)
+        datos += parte
+        bloque, faltan = segmento_exif(datos)
+        if bloque is not None:
+            exif = leer_exif(bloque)
+            if exif is not None:
+                return {**leido, **exif, 'origen': 'EXIF'}
+            break
+        if not faltan or len(datos) < hasta:
+            break        # no hay EXIF, o el archivo terminó antes
+        hasta = max(faltan, len(datos) + BYTES_CABECERA)
+    return {**leido, 'origen': 'NINGUNO'}
+
+
+#---------------------------------------------------------------------------------
+def _carpeta(item):
+    padres = item.get('parents') or []
+    return padres[0] if padres else ''
+
+
+def _por_tandas(valores, tamano=POR_TANDA):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio:inicio + tamano]
+
+
+def _nombres_carpetas(ids):
+    nombres = {}
+    for tanda in _por_tandas(ids - {''}):
+        nombres.update(DriveArchivo.objects.filter(drive_id__in=tanda).values_list('drive_id', 'nombre'))
+    return nombres
+
+
+def _fila(leido, nombres):
+    fecha = leido.get('fecha_captura')
+    latitud, longitud = leido.get('latitud'), leido.get('longitud')
+    return MetadatosFoto(
+        drive_file_id=leido['drive_file_id'],
+        md5=leido.get('md5') or '',
+        origen=leido['origen'],
+        fecha_captura=fecha,
+        anio=fecha.year if fecha else None,
+        latitud=latitud,
+        longitud=longitud,
+        altitud=leido.get('altitud'),
+        zona=f"{latitud:.2f},{longitud:.2f}" if latitud is not None and longitud is not None else '',
+        camara=leido.get('camara') or '',
+        orientacion=leido.get('orientacion'),
+        ancho=leido.get('ancho'),
+        alto=leido.get('alto'),
+        carpeta_id=leido.get('carpeta_id', ''),
+        evento=nombres.get(leido.get('carpeta_id', ''), ''),
+    )
+
+
+def guardar_leidos(leidos):
+    """Guarda (o reemplaza) los metadatos leídos, con el nombre de su carpeta como evento."""
+    nombres = _nombres_carpetas({leido.get('carpeta_id', '') for leido in leidos})
+    MetadatosFoto.objects.bulk_create(
+        [_fila(leido, nombres) for leido in leidos],
+        batch_size=POR_TANDA,
+        update_conflicts=True,
+        unique_fields=['drive_file_id'],
+        update_fields=[
+            'md5', 'origen', 'fecha_captura', 'anio', 'latitud', 'longitud', 'altitud', 'zona',
+            'camara', 'orientacion', 'ancho', 'alto', 'carpeta_id', 'evento', 'fecha_lectura',
+        ],
+    )
+
+
+def guardar_desde_sincronizacion(items):
+    """
+    Llamada por sincronizacion._guardar con los items tal como llegan de Drive (ya guardados en DriveArchivo).
+    1. Las fotos que traen imageMediaMetadata se guardan con origen DRIVE.
+    2. Las que no lo traen sólo corrigen su carpeta/evento si ya tenían fila (leerlas es trabajo de extraer_metadatos).
+    3. Las carpetas que llegan (p. ej. renombradas) corrigen el evento de sus fotos.
+    """
+    fotos = [item for item in items if item.get('mimeType', '').startswith('image/')]
+    carpetas = {item['id']: item.get('name', '') for item in items if item.get('mimeType') == MIME_CARPETA}
+    if not fotos and not carpetas:
+        return
+    nombres = _nombres_carpetas({_carpeta(item) for item in fotos})
+
+    leidos = [
+        {**desde_drive(item['imageMediaMetadata']), 'drive_file_id': item['id'], 'md5': item.get('md5Checksum', ''),
+         'carpeta_id': _carpeta(item), 'origen': 'DRIVE'}
+        for item in fotos if item.get('imageMediaMetadata')
+    ]
+    if leidos:
+        guardar_leidos(leidos)
+
+    cambios = {}
+    movidas = {item['id']: _carpeta(item) for item in fotos if not item.get('imageMediaMetadata')}
+    for tanda in _por_tandas(movidas):
+        for fila_id, drive_id, carpeta_id, evento in MetadatosFoto.objects.filter(drive_file_id__in=tanda).values_list(
+            'id', 'drive_file_id', 'carpeta_id', 'evento'
+        ):
+            nueva = movidas[drive_id]
+            if (carpeta_id, evento) != (nueva, nombres.get(nueva, '')):
+                cambios[fila_id] = MetadatosFoto(id=fila_id, carpeta_id=nueva, evento=nombres.get(nueva, ''))
+    for tanda in _por_tandas(carpetas):
+        for fila_id, carpeta_id, evento in MetadatosFoto.objects.filter(carpeta_id__in=tanda).values_list(
+            'id', 'carpeta_id', 'evento'
+        ):
+            if fila_id not in cambios and evento != carpetas[carpeta_id]:
+                cambios[fila_id] = MetadatosFoto(id=fila_id, carpeta_id=carpeta_id, evento=carpetas[carpeta_id])
+    MetadatosFoto.objects.bulk_update(list(cambios.values()), ['carpeta_id', 'evento'], batch_size=POR_TANDA)
+
+
+def pendientes(todas=False):
+    """
+    drive_ids a leer: las fotos sincronizadas sin metadatos (o cuyo archivo cambió desde que se leyeron)
+    y las fotos con rostros guardados que no están en la tabla.
+    """
+    fotos = DriveArchivo.objects.filter(mime_type__startswith='image/')
+    con_rostros = RostroDetectado.objects.values_list('drive_file_id', flat=True).distinct()
+    if not todas:
+        fotos = fotos.exclude(Exists(MetadatosFoto.objects.filter(drive_file_id=OuterRef('drive_id'), md5=OuterRef('md5'))))
+        con_rostros = con_rostros.exclude(Exists(MetadatosFoto.objects.filter(drive_file_id=OuterRef('drive_file_id'))))
+    ids = list(fotos.values_list('drive_id', flat=True))
+    vistos = set(ids)
+    ids.extend(drive_id for drive_id in con_rostros if drive_id not in vistos)
+    return ids
+
+
+#---------------------------------------------------------------------------------
+def anios_con_fotos():
+    """[{'anio': 1987, 'fotos': 42}, ...] con una consulta agrupada sobre el índice (anio, fecha_captura)."""
+    return list(
+        MetadatosFoto.objects.filter(anio__isnull=False)
+        .values('anio').annotate(fotos=Count('id')).order_by('anio')
+    )
+
+
+def fotos_de(anio=None, evento=None, zona=None, limite=500):
+    """Metadatos de las fotos de un año, un evento o una zona, en orden cronológico."""
+    filas = MetadatosFoto.objects.all()
+    if anio is not None:
+        filas = filas.filter(anio=anio)
+    if evento is not None:
+        filas = filas.filter(evento=evento)
+    if zona is not None:
+        filas = filas.filter(zona=zona)
+    return list(filas.order_by('fecha_captura', 'id')[:limite])
+
+
+def rostros_por_decada(familiar_id):
+    """
+    Las caras de un familiar agrupadas por la década en que se sacó su foto: {1980: [rostro, ...], None: [...]}.
+    Cada cara busca el año de su foto por el índice único de drive_file_id (una sola consulta en total).
+    """
+    anio = MetadatosFoto.objects.filter(drive_file_id=OuterRef('drive_file_id')).values('anio')[:1]
+    rostros = (
+        RostroDetectado.objects.filter(familiar_id=familiar_id)
+        .annotate(anio=Subquery(anio))
+        .only('id', 'drive_file_id', 'foto_recorte', 'miniatura')
+        .order_by('anio', 'id')
+    )
+    decadas = {}
+    for rostro in rostros:
+        decadas.setdefault(rostro.anio // 10 * 10 if rostro.anio else None, []).append(rostro)
+    return decadas
+
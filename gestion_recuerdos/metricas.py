@@ -0,0 +1,204 @@
+import contextvars
+import cProfile
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Mide en qué se va el tiempo de cada petición: llamadas a la API de Drive, descargas,
+# decodificación, detección, consultas a la BD y armado del HTML.
+# - etapa('nombre') cronometra un bloque (o una función, usado como decorador).
+# - MedicionMiddleware junta las etapas de cada petición, cuenta sus consultas a la BD,
+#   las devuelve en la cabecera Server-Timing (se ven en las herramientas del navegador)
+#   y, si PERFIL_PETICIONES está activo, guarda un volcado de cProfile por petición.
+# - /metricas/ publica todo en el formato de texto de Prometheus (sólo para quien autoriza
+#   puede_ver_metricas: staff, METRICAS_TOKEN o METRICAS_IPS).
+# Los valores son de ESTE proceso: con varios procesos, Prometheus los consulta a cada uno.
+# Server-Timing sólo junta las etapas que corren en el hilo de la petición mientras la vista trabaja.
+# Las de un cuerpo en streaming (se envía después de que la vista devolvió la respuesta) y las de
+# hilos o procesos que lance la vista (threading no copia las ContextVar) sólo van al histograma.
+# Para sumar a Server-Timing las etapas de un hilo que la vista espera, se lo lanza con
+# contextvars.copy_context().run(funcion, ...).
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+AYUDAS = {
+    'gr_peticiones_total': "Peticiones atendidas, por vista y código de estado.",
+    'gr_peticion_segundos': "Duración de cada petición, por vista.",
+    'gr_peticion_consultas_db': "Consultas a la base de datos por petición, por vista.",
+    'gr_etapa_segundos': "Duración de cada etapa (drive_api, descarga, decodificacion, deteccion, html...).",
+    'gr_drive_bytes_descargados_total': "Bytes de fotos originales bajados de Drive.",
+    'gr_rostros_detectados_total': "Rostros encontrados por el detector.",
+    'gr_credenciales_refrescos_total': "Access tokens de Google pedidos con el refresh token.",
+    'gr_detecciones_reutilizadas_total': "Fotos cuya detección guardada se reutilizó (sin bajar ni detectar).",
+}
+
+
+class Metricas:
+    """Contadores e histogramas en memoria, seguros entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {}    # (nombre, etiquetas) -> valor
+        self.histogramas = {}   # (nombre, etiquetas) -> [límites, cuentas por tramo, suma]
+
+    def sumar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, limites=LIMITES_SEGUNDOS, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                histograma = self.histogramas[clave] = [limites, [0] * (len(limites) + 1), 0.0]
+            histograma[1][bisect_left(histograma[0], valor)] += 1
+            histograma[2] += valor
+
+    def texto(self):
+        """Todas las métricas en el formato de exposición de texto de Prometheus (versión 0.0.4)."""
+        with self._lock:
+            contadores = sorted(self.contadores.items())
+            histogramas = sorted((clave, (h[0], list(h[1]), h[2])) for clave, h in self.histogramas.items())
+        lineas, vistos = [], set()
+
+        def encabezado(nombre, tipo):
+            if nombre not in vistos:
+                vistos.add(nombre)
+                lineas.append(f"# HELP {nombre} {AYUDAS.get(nombre, nombre)}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for (nombre, etiquetas), valor in contadores:
+            encabezado(nombre, 'counter')
+            lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+        for (nombre, etiquetas), (limites, cuentas, suma) in histogramas:
+            encabezado(nombre, 'histogram')
+            acumulado = 0
+            for limite, cuenta in zip(limites, cuentas):
+                acumulado += cuenta
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', limite),))} {acumulado}")
+            acumulado += cuentas[-1]
+            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', '+Inf'),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {suma}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {acumulado}")
+        return "\n".join(lineas) + "\n"
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ''
+    escapar = lambda valor: str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{clave}="{escapar(valor)}"' for clave, valor in pares) + '}'
+
+
+metricas = Metricas()
+
+# Etapas de la petición en curso ({nombre: segundos}); None fuera de una petición (comandos, hilos y
+# procesos aparte, cuerpos en streaming: ver arriba).
+_etapas_peticion = contextvars.ContextVar('etapas_peticion', default=None)
+_lock_etapas = threading.Lock()   # por si varios hilos comparten el contexto de la petición
+
+
+@contextmanager
+def etapa(nombre):
+    """
+    Cronometra el bloque: va al histograma gr_etapa_segundos y, si corre dentro del contexto de una
+    petición, a su Server-Timing.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        metricas.observar('gr_etapa_segundos', duracion, etapa=nombre)
+        etapas = _etapas_peticion.get()
+        if etapas is not None:
+            with _lock_etapas:
+                etapas[nombre] = etapas.get(nombre, 0.0) + duracion
+
+
+def puede_ver_metricas(request):
+    """True para staff con sesión, para el token de METRICAS_TOKEN (Authorization: Bearer) o las IPs de METRICAS_IPS."""
+    usuario = getattr(request, 'user', None)
+    if usuario is not None and usuario.is_active and usuario.is_staff:
+        return True
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    cabecera = request.headers.get('Authorization', '')
+    if token and cabecera.startswith('Bearer ') and hmac.compare_digest(cabecera[7:].encode(), token.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICAS_IPS', ())
+
+
+#---------------------------------------------------------------------------------
+_lock_perfil = threading.Lock()   # un solo cProfile activo a la vez en el proceso
+
+
+class MedicionMiddleware:
+    """
+    Línea por línea:
+    1. Abre la lista de etapas de esta petición y cuenta cada consulta a la BD (execute_wrapper).
+    2. Si PERFIL_PETICIONES está activo y no hay otra petición perfilándose, corre la vista bajo cProfile.
+    3. Registra duración, consultas y estado por vista, y agrega la cabecera Server-Timing.
+    4. Guarda el perfil en PERFIL_CARPETA si la petición tardó al menos PERFIL_MINIMO_SEGUNDOS.
+    En las respuestas en streaming se mide hasta que empieza el envío, no el cuerpo completo: las etapas del
+    cuerpo (por ejemplo 'embeddings' en el análisis en vivo) van al histograma pero no a Server-Timing,
+    que ya salió con las cabeceras. Por eso la ContextVar se limpia acá y no al terminar el cuerpo.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        etapas = {}
+        consultas = [0, 0.0]
+
+        def contar(ejecutar, sql, params, many, contexto):
+            inicio = time.perf_counter()
+            try:
+                return ejecutar(sql, params, many, contexto)
+            finally:
+                consultas[0] += 1
+                consultas[1] += time.perf_counter() - inicio
+
+        perfil = None
+        if getattr(settings, 'PERFIL_PETICIONES', False) and _lock_perfil.acquire(blocking=False):
+            perfil = cProfile.Profile()
+        token = _etapas_peticion.set(etapas)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(contar):
+                if perfil is not None:
+                    perfil.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if perfil is not None:
+                        perfil.disable()
+                        _lock_perfil.release()
+        finally:
+            _etapas_peticion.reset(token)
+        duracion = time.perf_counter() - inicio
+
+        vista = request.resolver_match.url_name if request.resolver_match else 'sin_ruta'
+        metricas.sumar('gr_peticiones_total', vista=vista, estado=response.status_code)
+        metricas.observar('gr_peticion_segundos', duracion, vista=vista)
+        metricas.observar('gr_peticion_consultas_db', consultas[0], limites=LIMITES_CONSULTAS, vista=vista)
+
+        etapas['db'] = consultas[1]
+        etapas['total'] = duracion
+        response['Server-Timing'] = ', '.join(f"{nombre};dur={segundos * 1000:.1f}" for nombre, segundos in etapas.items())
+        response['X-Consultas-DB'] = str(consultas[0])
+
+        if perfil is not None and duracion >= getattr(settings, 'PERFIL_MINIMO_SEGUNDOS', 0):
+            carpeta = settings.PERFIL_CARPETA
+            os.makedirs(carpeta, exist_ok=True)
+            perfil.dump_stats(os.path.join(carpeta, f"{vista}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{int(duracion * 1000)}ms.prof"))
+        return response
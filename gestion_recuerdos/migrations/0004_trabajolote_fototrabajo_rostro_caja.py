@@ -0,0 +1,64 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0003_familiar_apellido_familiar_face_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('TERMINADO', 'Terminado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=10)),
+                ('carpeta_id', models.CharField(max_length=255)),
+                ('total', models.IntegerField(default=0)),
+                ('procesadas', models.IntegerField(default=0)),
+                ('fallidas', models.IntegerField(default=0)),
+                ('rostros', models.IntegerField(default=0)),
+                ('mensaje', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='rostrodetectado',
+            name='alto',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rostrodetectado',
+            name='ancho',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rostrodetectado',
+            name='x',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rostrodetectado',
+            name='y',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='FotoTrabajo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('drive_file_id', models.CharField(max_length=255)),
+                ('nombre', models.CharField(blank=True, max_length=255)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('HECHA', 'Hecha'), ('ERROR', 'Error')], default='PENDIENTE', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('trabajo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fotos', to='gestion_recuerdos.trabajolote')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trabajo', 'estado'], name='gestion_rec_trabajo_54a185_idx')],
+                'constraints': [models.UniqueConstraint(fields=('trabajo', 'drive_file_id'), name='foto_unica_por_trabajo')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0004_trabajolote_fototrabajo_rostro_caja'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rostrodetectado',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
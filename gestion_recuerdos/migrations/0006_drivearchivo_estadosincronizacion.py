@@ -0,0 +1,39 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0005_rostrodetectado_embedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoSincronizacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(default='drive', max_length=50, unique=True)),
+                ('carpeta_raiz_id', models.CharField(max_length=255)),
+                ('page_token', models.CharField(max_length=255)),
+                ('fecha_rastreo_completo', models.DateTimeField(blank=True, null=True)),
+                ('fecha_ultimo_cambio', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DriveArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('drive_id', models.CharField(max_length=255, unique=True)),
+                ('nombre', models.CharField(max_length=255)),
+                ('mime_type', models.CharField(max_length=255)),
+                ('padres', models.JSONField(default=list)),
+                ('md5', models.CharField(blank=True, max_length=32)),
+                ('modificado', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mime_type', 'nombre'], name='gestion_rec_mime_ty_c52003_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0006_drivearchivo_estadosincronizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeteccionGuardada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('drive_file_id', models.CharField(max_length=255, unique=True)),
+                ('md5', models.CharField(max_length=32)),
+                ('detector', models.CharField(max_length=50)),
+                ('parametros', models.JSONField(default=dict)),
+                ('cajas', models.JSONField(default=list)),
+                ('fecha_creacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
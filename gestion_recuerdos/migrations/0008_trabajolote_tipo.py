@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0007_deteccionguardada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajolote',
+            name='tipo',
+            field=models.CharField(choices=[('ANALISIS', 'Análisis de rostros'), ('ORGANIZAR', 'Organizar Drive')], default='ANALISIS', max_length=10),
+        ),
+    ]
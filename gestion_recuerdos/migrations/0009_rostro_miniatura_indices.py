@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0008_trabajolote_tipo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rostrodetectado',
+            name='miniatura',
+            field=models.ImageField(blank=True, upload_to='miniaturas/'),
+        ),
+        migrations.AddIndex(
+            model_name='rostrodetectado',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='rostro_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rostrodetectado',
+            index=models.Index(fields=['familiar', '-fecha_creacion', '-id'], name='rostro_familiar_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rostrodetectado',
+            index=models.Index(fields=['drive_file_id'], name='rostro_drive_file_idx'),
+        ),
+    ]
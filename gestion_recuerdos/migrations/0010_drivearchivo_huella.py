@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0009_rostro_miniatura_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivearchivo',
+            name='huella',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='drivearchivo',
+            name='huella_md5',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='drivearchivo',
+            name='tamano',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='fototrabajo',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('HECHA', 'Hecha'), ('ERROR', 'Error'), ('DUPLICADA', 'Duplicada')], default='PENDIENTE', max_length=10),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0010_drivearchivo_huella'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Relacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('PROGENITOR', 'Padre/Madre de'), ('PAREJA', 'Pareja de')], max_length=10)),
+                ('destino', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relaciones_entrantes', to='gestion_recuerdos.familiar')),
+                ('origen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relaciones_salientes', to='gestion_recuerdos.familiar')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['destino', 'tipo'], name='gestion_rec_destino_c09c05_idx')],
+                'constraints': [models.UniqueConstraint(fields=('origen', 'destino', 'tipo'), name='relacion_unica'), models.CheckConstraint(condition=models.Q(('origen', models.F('destino')), _negated=True), name='relacion_sin_bucle')],
+            },
+        ),
+    ]
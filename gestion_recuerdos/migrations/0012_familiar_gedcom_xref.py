@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0011_relacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='familiar',
+            name='gedcom_xref',
+            field=models.CharField(blank=True, max_length=40, null=True, unique=True),
+        ),
+    ]
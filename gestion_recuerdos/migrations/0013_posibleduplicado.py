@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0012_familiar_gedcom_xref'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PosibleDuplicado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntaje', models.FloatField()),
+                ('detalle', models.JSONField(default=dict)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente de revisar'), ('DESCARTADO', 'No son la misma persona')], default='PENDIENTE', max_length=10)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('familiar_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='gestion_recuerdos.familiar')),
+                ('familiar_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='gestion_recuerdos.familiar')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', '-puntaje'], name='gestion_rec_estado_24ffed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('familiar_a', 'familiar_b'), name='duplicado_par_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:20
+
+from django.db import migrations
+
+# Índice de búsqueda de texto completo de los familiares (ver gestion_recuerdos/busqueda.py).
+# No es un modelo: en SQLite es una tabla virtual FTS5 y en PostgreSQL índices GIN de expresiones.
+
+SQLITE_CREAR = """
+CREATE VIRTUAL TABLE IF NOT EXISTS familiar_busqueda USING fts5(
+    nombre, apellido, biografia,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+SQLITE_LLENAR = """
+INSERT INTO familiar_busqueda (rowid, nombre, apellido, biografia)
+SELECT id, nombre, coalesce(apellido, ''), coalesce(biografia, '') FROM gestion_recuerdos_familiar
+"""
+
+POSTGRES_CREAR = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() no es IMMUTABLE y los índices lo exigen: se envuelve fijando el diccionario.
+    """
+    CREATE OR REPLACE FUNCTION gr_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent', $1) $$
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS familiar_busqueda_gin ON gestion_recuerdos_familiar USING GIN (
+        to_tsvector('simple', gr_unaccent(coalesce(nombre, '') || ' ' || coalesce(apellido, '') || ' ' || coalesce(biografia, '')))
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS familiar_nombre_gin ON gestion_recuerdos_familiar USING GIN (
+        to_tsvector('simple', gr_unaccent(coalesce(nombre, '') || ' ' || coalesce(apellido, '')))
+    )
+    """,
+]
+POSTGRES_BORRAR = [
+    "DROP INDEX IF EXISTS familiar_nombre_gin",
+    "DROP INDEX IF EXISTS familiar_busqueda_gin",
+    "DROP FUNCTION IF EXISTS gr_unaccent(text)",
+]
+
+
+def crear_indice(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREAR)
+        schema_editor.execute(SQLITE_LLENAR)
+    elif conexion.vendor == 'postgresql':
+        for sentencia in POSTGRES_CREAR:
+            schema_editor.execute(sentencia)
+
+
+def borrar_indice(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS familiar_busqueda")
+    elif conexion.vendor == 'postgresql':
+        for sentencia in POSTGRES_BORRAR:
+            schema_editor.execute(sentencia)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0013_posibleduplicado'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0014_busqueda_familiares'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GrupoRostros',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('suma', models.BinaryField()),
+                ('tamano', models.IntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('sugerido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='gestion_recuerdos.familiar')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='rostrodetectado',
+            name='grupo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rostros', to='gestion_recuerdos.gruporostros'),
+        ),
+        migrations.AddIndex(
+            model_name='gruporostros',
+            index=models.Index(fields=['-tamano'], name='gestion_rec_tamano_f0cb1a_idx'),
+        ),
+    ]
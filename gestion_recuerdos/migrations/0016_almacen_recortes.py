@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:15
+
+import gestion_recuerdos.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0015_grupos_rostros'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rostrodetectado',
+            name='foto_recorte',
+            field=models.ImageField(storage=gestion_recuerdos.almacenamiento.almacen_recortes, upload_to='rostros_permanentes/'),
+        ),
+        migrations.AlterField(
+            model_name='rostrodetectado',
+            name='miniatura',
+            field=models.ImageField(blank=True, storage=gestion_recuerdos.almacenamiento.almacen_recortes, upload_to='miniaturas/'),
+        ),
+        migrations.AddIndex(
+            model_name='rostrodetectado',
+            index=models.Index(fields=['foto_recorte'], name='rostro_recorte_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rostrodetectado',
+            index=models.Index(fields=['miniatura'], name='rostro_miniatura_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0016_almacen_recortes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetadatosFoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('drive_file_id', models.CharField(max_length=255, unique=True)),
+                ('md5', models.CharField(blank=True, max_length=32)),
+                ('origen', models.CharField(choices=[('DRIVE', 'imageMediaMetadata de Drive'), ('EXIF', 'Cabecera EXIF (descarga parcial)'), ('NINGUNO', 'Sin metadatos')], default='NINGUNO', max_length=10)),
+                ('fecha_captura', models.DateTimeField(blank=True, null=True)),
+                ('anio', models.SmallIntegerField(blank=True, null=True)),
+                ('latitud', models.FloatField(blank=True, null=True)),
+                ('longitud', models.FloatField(blank=True, null=True)),
+                ('altitud', models.FloatField(blank=True, null=True)),
+                ('zona', models.CharField(blank=True, max_length=24)),
+                ('camara', models.CharField(blank=True, max_length=120)),
+                ('orientacion', models.SmallIntegerField(blank=True, null=True)),
+                ('ancho', models.IntegerField(blank=True, null=True)),
+                ('alto', models.IntegerField(blank=True, null=True)),
+                ('carpeta_id', models.CharField(blank=True, max_length=255)),
+                ('evento', models.CharField(blank=True, max_length=255)),
+                ('fecha_lectura', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['anio', 'fecha_captura'], name='metadatos_anio_idx'), models.Index(fields=['evento', 'fecha_captura'], name='metadatos_evento_idx'), models.Index(fields=['zona', 'fecha_captura'], name='metadatos_zona_idx'), models.Index(fields=['carpeta_id'], name='metadatos_carpeta_idx')],
+            },
+        ),
+    ]
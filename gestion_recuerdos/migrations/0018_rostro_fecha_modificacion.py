@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0017_metadatos_fotos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rostrodetectado',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='rostrodetectado',
+            index=models.Index(fields=['fecha_modificacion'], name='rostro_modificacion_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0018_rostro_fecha_modificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivearchivo',
+            name='copia_de',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
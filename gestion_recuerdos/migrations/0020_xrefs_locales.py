@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:10
+
+import secrets
+
+from django.db import migrations
+from django.db.models import CharField, Q, Value
+from django.db.models.functions import Cast, Concat
+
+# Los familiares cargados a mano tenían el xref GR<id>, que un GEDCOM de otro programa también
+# puede traer (y al importarlo pisaba al familiar con ese id). Pasan a un prefijo propio de esta
+# instalación ('GR' + 6 caracteres al azar + '_'); los que no tenían xref reciben el suyo.
+# 0022_configuracion guarda ese prefijo para que gedcom.prefijo_local siga usando el mismo.
+
+
+def a_prefijo_local(apps, schema_editor):
+    Familiar = apps.get_model('gestion_recuerdos', 'Familiar')
+    prefijo = f"GR{secrets.token_hex(3).upper()}_"
+    Familiar.objects.filter(
+        Q(gedcom_xref__isnull=True) | Q(gedcom_xref=Concat(Value('GR'), Cast('id', CharField())))
+    ).update(gedcom_xref=Concat(Value(prefijo), Cast('id', CharField())))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0019_drivearchivo_copia_de'),
+    ]
+
+    operations = [
+        migrations.RunPython(a_prefijo_local, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0020_xrefs_locales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='familiar',
+            index=models.Index(fields=['nombre', 'apellido'], name='familiar_nombre_idx'),
+        ),
+    ]
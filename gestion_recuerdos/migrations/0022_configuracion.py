@@ -0,0 +1,44 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:08
+
+import re
+
+from django.db import migrations, models
+
+# El prefijo de los xref GEDCOM de esta instalación (gedcom.prefijo_local) pasa a guardarse en
+# Configuracion. Si ya hay familiares con xref propio (0020_xrefs_locales) se guarda ese mismo
+# prefijo, para que los GEDCOM exportados antes sigan actualizando a los mismos familiares.
+# Si no hay ninguno, gedcom.prefijo_local sortea uno al primer uso.
+
+XREF_LOCAL = re.compile(r'^(GR[0-9A-F]{6}_)(\d+)$')
+
+
+def guardar_prefijo(apps, schema_editor):
+    Configuracion = apps.get_model('gestion_recuerdos', 'Configuracion')
+    Familiar = apps.get_model('gestion_recuerdos', 'Familiar')
+    if Configuracion.objects.filter(clave='gedcom_prefijo').exists():
+        return
+    candidatos = Familiar.objects.filter(gedcom_xref__regex=r'^GR[0-9A-F]{6}_[0-9]+$').order_by('id')
+    for familiar_id, xref in candidatos.values_list('id', 'gedcom_xref').iterator(chunk_size=2000):
+        coincide = XREF_LOCAL.match(xref)
+        if int(coincide.group(2)) == familiar_id:
+            Configuracion.objects.create(clave='gedcom_prefijo', valor=coincide.group(1))
+            return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_recuerdos', '0021_familiar_nombre_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Configuracion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=50, unique=True)),
+                ('valor', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.RunPython(guardar_prefijo, migrations.RunPython.noop),
+    ]
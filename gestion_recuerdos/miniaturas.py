@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .almacenamiento import guardar_contenido, leer_contenido
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Genera la miniatura de cada recorte al guardarlo (miniaturas/ del almacenamiento de recortes).
+# La galería carga estas imágenes chicas (unos pocos KB) en lugar del recorte completo.
+
+CARPETA_MINIATURAS = 'miniaturas'
+
+
+def generar_miniatura(img):
+    """
+    Reduce la imagen (BGR) a MINIATURA_LADO píxeles por lado como máximo y la guarda en WebP
+    (o JPEG si OpenCV no tiene WebP). Devuelve su nombre en el almacenamiento, o '' si falla.
+    """
+    if img is None or img.size == 0:
+        return ''
+    lado = settings.MINIATURA_LADO
+    alto, ancho = img.shape[:2]
+    escala = min(1.0, lado / max(alto, ancho))
+    if escala < 1.0:
+        img = cv2.resize(img, (max(1, int(ancho * escala)), max(1, int(alto * escala))), interpolation=cv2.INTER_AREA)
+
+    ok, buffer = cv2.imencode('.webp', img, [cv2.IMWRITE_WEBP_QUALITY, 80])
+    extension = '.webp'
+    if not ok:
+        ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        extension = '.jpg'
+    if not ok:
+        return ''
+    # Mismo recorte -> misma miniatura -> mismo nombre: se guarda una sola vez.
+    return guardar_contenido(buffer.tobytes(), CARPETA_MINIATURAS, extension)
+
+
+def generar_miniatura_de_archivo(nombre):
+    """Miniatura de un recorte ya guardado en el almacenamiento de recortes."""
+    try:
+        datos = leer_contenido(nombre)
+    except FileNotFoundError:
+        return ''
+    return generar_miniatura(cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_COLOR))
@@ -1,7 +1,10 @@
 from django.db import models
 
+from .almacenamiento import almacen_recortes
+
 # --- IMPORTACIONES EXPLICADAS ---
 # models: Herramienta de Django para crear las tablas de la base de datos sin usar SQL.
+# almacen_recortes: dónde viven los recortes y miniaturas (disco o S3/MinIO, ver almacenamiento.py).
 
 class Familiar(models.Model):
     """Representa a una persona real de tu árbol genealógico."""
@@ -21,22 +24,310 @@ class Familiar(models.Model):
     # Identificador para la IA
     face_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
 
+    # Identificador del registro en un archivo GEDCOM (sin las @): volver a importar el mismo
+    # archivo actualiza estas personas en vez de duplicarlas.
+    gedcom_xref = models.CharField(max_length=40, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Orden alfabético del autocompletado y del índice del árbol (lista_arbol pagina por este orden).
+            models.Index(fields=['nombre', 'apellido'], name='familiar_nombre_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nombre} {self.apellido if self.apellido else ''}"
 
+class Relacion(models.Model):
+    """
+    Una arista del árbol genealógico entre dos familiares.
+    PROGENITOR: 'origen' es padre o madre de 'destino'. PAREJA: vale en los dos sentidos.
+    """
+    TIPO_CHOICES = [
+        ('PROGENITOR', 'Padre/Madre de'),
+        ('PAREJA', 'Pareja de'),
+    ]
+    origen = models.ForeignKey(Familiar, on_delete=models.CASCADE, related_name='relaciones_salientes')
+    destino = models.ForeignKey(Familiar, on_delete=models.CASCADE, related_name='relaciones_entrantes')
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['origen', 'destino', 'tipo'], name='relacion_unica'),
+            models.CheckConstraint(condition=~models.Q(origen=models.F('destino')), name='relacion_sin_bucle'),
+        ]
+        indexes = [
+            models.Index(fields=['destino', 'tipo']),
+        ]
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from .arbol import obtener_arbol
+        # Nadie puede ser padre de su propio ancestro: el árbol dejaría de ser un árbol.
+        if self.tipo == 'PROGENITOR' and self.origen_id and self.destino_id:
+            if self.destino_id in obtener_arbol().ancestros(self.origen_id):
+                raise ValidationError("Esa relación crearía un ciclo: el hijo ya es ancestro del padre.")
+
+    def __str__(self):
+        return f"{self.origen} → {self.get_tipo_display()} → {self.destino}"
+
+class PosibleDuplicado(models.Model):
+    """Dos familiares que parecen ser la misma persona, esperando que alguien lo confirme."""
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente de revisar'),
+        ('DESCARTADO', 'No son la misma persona'),
+    ]
+    # familiar_a siempre tiene el id menor: cada par aparece una sola vez.
+    familiar_a = models.ForeignKey(Familiar, on_delete=models.CASCADE, related_name='+')
+    familiar_b = models.ForeignKey(Familiar, on_delete=models.CASCADE, related_name='+')
+    puntaje = models.FloatField()
+    detalle = models.JSONField(default=dict)     # puntaje de cada parte: nombre, fecha, rostro
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['familiar_a', 'familiar_b'], name='duplicado_par_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['estado', '-puntaje']),
+        ]
+
+    def __str__(self):
+        return f"{self.familiar_a} ≈ {self.familiar_b} ({self.puntaje:.2f}, {self.estado})"
+
+class GrupoRostros(models.Model):
+    """Rostros sin identificar que parecen de la misma persona, para etiquetarlos todos de una vez."""
+    # Suma (float32) de los embeddings del grupo: el centro es suma/|suma| y sumar una cara nueva es O(1).
+    suma = models.BinaryField(editable=False)
+    tamano = models.IntegerField(default=0)
+    # Familiar que el índice de rostros ya identificados sugiere para el centro del grupo.
+    sugerido = models.ForeignKey(Familiar, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-tamano']),
+        ]
+
+    def __str__(self):
+        return f"Grupo {self.id} ({self.tamano} rostros)"
+
 class RostroDetectado(models.Model):
     """Guarda cada recorte facial y lo vincula a un familiar."""
     # ForeignKey: Vincula este rostro con un Familiar de la tabla de arriba.
     familiar = models.ForeignKey(Familiar, on_delete=models.CASCADE, related_name='rostros', null=True, blank=True)
     
-    # ImageField: Gestiona la ruta del archivo en la carpeta media/rostros_permanentes/
-    foto_recorte = models.ImageField(upload_to='rostros_permanentes/')
+    # ImageField: Gestiona la ruta del archivo en rostros_permanentes/ del almacenamiento de recortes
+    # (disco o S3/MinIO, ver almacenamiento.py). Varios rostros pueden compartir el mismo archivo.
+    foto_recorte = models.ImageField(upload_to='rostros_permanentes/', storage=almacen_recortes)
+
+    # Miniatura chica (WebP) que muestra la galería en vez del recorte completo.
+    miniatura = models.ImageField(upload_to='miniaturas/', blank=True, storage=almacen_recortes)
     
     # drive_file_id: Para recordar de qué foto de Google Drive salió este recorte.
     drive_file_id = models.CharField(max_length=255)
+
+    # Caja del rostro dentro de la foto original (en píxeles).
+    x = models.IntegerField(null=True, blank=True)
+    y = models.IntegerField(null=True, blank=True)
+    ancho = models.IntegerField(null=True, blank=True)
+    alto = models.IntegerField(null=True, blank=True)
+
+    # Embedding: vector float32 (128 valores) que resume la cara para compararla con otras.
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+
+    # Grupo de caras parecidas al que pertenece mientras no tenga familiar (ver agrupamiento.py).
+    grupo = models.ForeignKey(GrupoRostros, on_delete=models.SET_NULL, null=True, blank=True, related_name='rostros')
     
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    # Última vez que cambió (familiar, embedding...): los demás procesos refrescan su índice de
+    # rostros con esto. Los update() en bloque no lo tocan solos: hay que pasarlo a mano.
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # La galería pagina por fecha (más nuevos primero), con o sin filtro por familiar/foto.
+            models.Index(fields=['-fecha_creacion', '-id'], name='rostro_fecha_idx'),
+            models.Index(fields=['familiar', '-fecha_creacion', '-id'], name='rostro_familiar_fecha_idx'),
+            models.Index(fields=['drive_file_id'], name='rostro_drive_file_idx'),
+            models.Index(fields=['fecha_modificacion'], name='rostro_modificacion_idx'),
+            # Para contar cuántos rostros usan un archivo antes de borrarlo (liberar_archivos).
+            models.Index(fields=['foto_recorte'], name='rostro_recorte_idx'),
+            models.Index(fields=['miniatura'], name='rostro_miniatura_idx'),
+        ]
+
     def __str__(self):
         nombre = self.familiar.nombre if self.familiar else "No identificado"
         return f"Rostro de {nombre} (Drive ID: {self.drive_file_id})"
+
+
+class TrabajoLote(models.Model):
+    """Un trabajo en segundo plano sobre muchas fotos de Drive (analizarlas u organizarlas)."""
+    TIPO_CHOICES = [
+        ('ANALISIS', 'Análisis de rostros'),
+        ('ORGANIZAR', 'Organizar Drive'),
+    ]
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, default='ANALISIS')
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'En curso'),
+        ('TERMINADO', 'Terminado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    carpeta_id = models.CharField(max_length=255)
+
+    # Contadores de progreso (se actualizan mientras el trabajo avanza).
+    total = models.IntegerField(default=0)
+    procesadas = models.IntegerField(default=0)
+    fallidas = models.IntegerField(default=0)
+    rostros = models.IntegerField(default=0)
+    mensaje = models.TextField(blank=True)
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Trabajo {self.id} {self.tipo} ({self.estado}) {self.procesadas}/{self.total}"
+
+class FotoTrabajo(models.Model):
+    """Cada foto que un TrabajoLote tiene que analizar. Permite reanudar."""
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('HECHA', 'Hecha'),
+        ('ERROR', 'Error'),
+        ('DUPLICADA', 'Duplicada'),   # casi igual a otra foto del trabajo: no se analiza
+    ]
+    trabajo = models.ForeignKey(TrabajoLote, on_delete=models.CASCADE, related_name='fotos')
+    drive_file_id = models.CharField(max_length=255)
+    nombre = models.CharField(max_length=255, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trabajo', 'drive_file_id'], name='foto_unica_por_trabajo'),
+        ]
+        indexes = [
+            models.Index(fields=['trabajo', 'estado']),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre or self.drive_file_id} ({self.estado})"
+
+class DriveArchivo(models.Model):
+    """Copia local de los metadatos de cada archivo/carpeta dentro de 'Genealogia' en Drive."""
+    drive_id = models.CharField(max_length=255, unique=True)
+    nombre = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=255)
+    padres = models.JSONField(default=list)
+    md5 = models.CharField(max_length=32, blank=True)
+    modificado = models.DateTimeField(null=True, blank=True)
+    tamano = models.BigIntegerField(null=True, blank=True)   # bytes, según Drive
+
+    # Huella perceptual (pHash de 64 bits) para encontrar copias de la misma foto aunque
+    # estén reescaladas o recomprimidas. huella_md5 dice de qué versión del archivo es.
+    huella = models.BigIntegerField(null=True, blank=True)
+    huella_md5 = models.CharField(max_length=32, blank=True)
+    # drive_id de la foto principal de su grupo, si ésta es una copia. Lo guarda calcular_huellas
+    # (huellas.guardar_grupos) para que el listado no tenga que agrupar en cada visita.
+    copia_de = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['mime_type', 'nombre']),
+        ]
+
+    @property
+    def es_carpeta(self):
+        return self.mime_type == 'application/vnd.google-apps.folder'
+
+    def __str__(self):
+        return self.nombre
+
+class EstadoSincronizacion(models.Model):
+    """Guarda el 'page token' de la API de cambios de Drive para sincronizar sólo lo nuevo."""
+    clave = models.CharField(max_length=50, unique=True, default='drive')
+    carpeta_raiz_id = models.CharField(max_length=255)
+    page_token = models.CharField(max_length=255)
+    fecha_rastreo_completo = models.DateTimeField(null=True, blank=True)
+    fecha_ultimo_cambio = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Sincronización {self.clave} (token {self.page_token})"
+
+class Configuracion(models.Model):
+    """Valores propios de esta instalación que se fijan una vez y no deben cambiar (p. ej. el prefijo de los xref GEDCOM)."""
+    clave = models.CharField(max_length=50, unique=True)
+    valor = models.CharField(max_length=255)
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
+
+class DeteccionGuardada(models.Model):
+    """Resultado de la detección de rostros de una foto de Drive, para no repetirla."""
+    drive_file_id = models.CharField(max_length=255, unique=True)
+    md5 = models.CharField(max_length=32)
+
+    # Con qué detector y parámetros se obtuvo (si cambian en settings, se vuelve a detectar).
+    detector = models.CharField(max_length=50)
+    parametros = models.JSONField(default=dict)
+
+    # Lista de cajas [x, y, w, h] en píxeles de la foto original.
+    cajas = models.JSONField(default=list)
+    fecha_creacion = models.DateTimeField(auto_now=True)
+
+    def rutas_recortes(self):
+        """Rutas (relativas a MEDIA_ROOT) de los recortes guardados de cada caja."""
+        return [f"detecciones/{self.id}/cara_{i}.jpg" for i in range(len(self.cajas))]
+
+    def __str__(self):
+        return f"Detección {self.drive_file_id}: {len(self.cajas)} rostros ({self.detector})"
+
+class MetadatosFoto(models.Model):
+    """
+    Fecha, lugar y cámara de cada foto de Drive, sacados de su EXIF (ver metadatos.py).
+    Se enlaza por drive_file_id con DriveArchivo.drive_id y con RostroDetectado.drive_file_id,
+    así la línea de tiempo y "las caras de alguien por década" se resuelven con índices, sin bajar fotos.
+    """
+    ORIGENES = [
+        ('DRIVE', 'imageMediaMetadata de Drive'),
+        ('EXIF', 'Cabecera EXIF (descarga parcial)'),
+        ('NINGUNO', 'Sin metadatos'),
+    ]
+    drive_file_id = models.CharField(max_length=255, unique=True)
+    md5 = models.CharField(max_length=32, blank=True)   # versión del archivo de la que salieron los datos
+    origen = models.CharField(max_length=10, choices=ORIGENES, default='NINGUNO')
+
+    # Hora del reloj de la cámara, tal cual (el EXIF no dice la zona horaria).
+    fecha_captura = models.DateTimeField(null=True, blank=True)
+    anio = models.SmallIntegerField(null=True, blank=True)
+
+    latitud = models.FloatField(null=True, blank=True)
+    longitud = models.FloatField(null=True, blank=True)
+    altitud = models.FloatField(null=True, blank=True)
+    # Celda de ~1 km ("-34.61,-58.38") para agrupar las fotos sacadas en el mismo lugar.
+    zona = models.CharField(max_length=24, blank=True)
+
+    camara = models.CharField(max_length=120, blank=True)
+    orientacion = models.SmallIntegerField(null=True, blank=True)   # código EXIF 1-8 (1 = derecha)
+    ancho = models.IntegerField(null=True, blank=True)
+    alto = models.IntegerField(null=True, blank=True)
+
+    # El "evento" es la carpeta de Drive donde está la foto (p. ej. "Casamiento 1987").
+    carpeta_id = models.CharField(max_length=255, blank=True)
+    evento = models.CharField(max_length=255, blank=True)
+
+    fecha_lectura = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['anio', 'fecha_captura'], name='metadatos_anio_idx'),
+            models.Index(fields=['evento', 'fecha_captura'], name='metadatos_evento_idx'),
+            models.Index(fields=['zona', 'fecha_captura'], name='metadatos_zona_idx'),
+            models.Index(fields=['carpeta_id'], name='metadatos_carpeta_idx'),
+        ]
+
+    def __str__(self):
+        return f"Metadatos {self.drive_file_id} ({self.anio or 'sin fecha'}, {self.origen})"
@@ -0,0 +1,66 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Convierte un recorte de rostro en un "embedding": un vector de 128 números (float32)
+# que se parece mucho entre fotos de la misma persona. Usa el modelo SFace de OpenCV
+# (archivo ONNX, corre en CPU). Si el archivo del modelo no está, todo sigue funcionando
+# pero sin sugerencias automáticas.
+
+TAMANO_ENTRADA = (112, 112)
+
+_local = threading.local()
+_listos = []                      # reconocedores armados al arrancar que todavía no tomó ningún hilo
+_lock_listos = threading.Lock()
+
+
+def ruta_modelo():
+    return getattr(settings, 'MODELO_RECONOCIMIENTO_ROSTROS', '')
+
+
+def reconocimiento_disponible():
+    return bool(ruta_modelo()) and os.path.exists(ruta_modelo())
+
+
+def _reconocedor():
+    """
+    Un reconocedor por hilo: la red de OpenCV no se puede usar desde dos hilos a la vez.
+    La primera vez, el hilo se queda con uno de los que armó precalentar_reconocedores, si queda alguno.
+    """
+    if not hasattr(_local, 'reconocedor'):
+        with _lock_listos:
+            reconocedor = _listos.pop() if _listos else None
+        _local.reconocedor = reconocedor or cv2.FaceRecognizerSF.create(ruta_modelo(), '')
+    return _local.reconocedor
+
+
+def precalentar_reconocedores(cantidad):
+    """Arma 'cantidad' reconocedores para que los hilos de las peticiones los tomen (ver analisis.precalentar_detectores)."""
+    reconocedores = [cv2.FaceRecognizerSF.create(ruta_modelo(), '') for _ in range(cantidad)]
+    with _lock_listos:
+        _listos.extend(reconocedores)
+
+
+def calcular_embedding(recorte):
+    """
+    Recibe el recorte BGR de una cara y devuelve su vector normalizado (float32, largo 1),
+    o None si el modelo no está instalado o el recorte está vacío.
+    """
+    if not reconocimiento_disponible() or recorte is None or recorte.size == 0:
+        return None
+    entrada = cv2.resize(recorte, TAMANO_ENTRADA)
+    vector = _reconocedor().feature(entrada).astype(np.float32).ravel()
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma else None
+
+
+def embedding_a_bytes(vector):
+    return None if vector is None else np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def bytes_a_embedding(datos):
+    return None if not datos else np.frombuffer(bytes(datos), dtype=np.float32)
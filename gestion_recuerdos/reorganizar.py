@@ -0,0 +1,209 @@
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from .drive import CARPETA_RAIZ, MIME_CARPETA, buscar_carpeta_raiz, crear_servicio, listar_paginado
+from .models import FotoTrabajo, TrabajoLote
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Mueve todas las fotos sueltas de "Mi unidad" a la carpeta 'Genealogia'.
+# En vez de un files().update() por foto (una llamada HTTP cada una), se agrupan hasta
+# 100 operaciones en una sola petición "batch" de la API de Drive. Las que Drive rechaza
+# por límite de cuota (429/403 rateLimitExceeded) o error del servidor se reintentan, y también
+# la petición batch entera si es ella la que falla (429/5xx o un corte de red).
+# El trabajo guarda un "latido" (fecha_actualizacion) después de cada lote: si el proceso que lo
+# corría se reinicia, queda EN_CURSO sin latido y se retoma (organizar_en_segundo_plano o
+# manage.py organizar_drive --reanudar). Retomar es seguro: lo ya movido no está más en la raíz.
+
+MAX_POR_LOTE = 100
+REINTENTOS = 5
+SIN_LATIDO = timedelta(minutes=10)   # un trabajo en curso sin avances hace más que esto quedó colgado
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+MOTIVOS_CUOTA = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+def asegurar_carpeta_raiz(service):
+    """Devuelve el id de 'Genealogia', creándola si no existe."""
+    folder_id = buscar_carpeta_raiz(service)
+    if folder_id:
+        return folder_id
+    folder_metadata = {'name': CARPETA_RAIZ, 'mimeType': MIME_CARPETA}
+    return service.files().create(body=folder_metadata, fields='id').execute().get('id')
+
+
+def _es_reintentable(error):
+    if not isinstance(error, HttpError):
+        return False
+    estado = error.resp.status
+    if estado in ESTADOS_REINTENTABLES:
+        return True
+    if estado == 403:
+        try:
+            errores = json.loads(error.content)['error']['errors']
+        except (ValueError, KeyError, TypeError):
+            return False
+        return any(e.get('reason') in MOTIVOS_CUOTA for e in errores)
+    return False
+
+
+def mover_lote(service, folder_id, fotos):
+    """
+    Mueve hasta 100 fotos con una sola petición batch.
+    Devuelve (movidas, fallidas) donde fallidas es {foto_id: mensaje}.
+    """
+    pendientes = {foto['id']: foto for foto in fotos}
+    movidas, fallidas = [], {}
+
+    for intento in range(REINTENTOS + 1):
+        reintentar = {}
+
+        def al_responder(request_id, respuesta, error):
+            if error is None:
+                movidas.append(request_id)
+            elif _es_reintentable(error) and intento < REINTENTOS:
+                reintentar[request_id] = pendientes[request_id]
+            else:
+                fallidas[request_id] = str(error)
+
+        batch = service.new_batch_http_request(callback=al_responder)
+        for foto in pendientes.values():
+            batch.add(
+                service.files().update(
+                    fileId=foto['id'],
+                    addParents=folder_id,
+                    removeParents=",".join(foto.get('parents', [])),
+                    fields='id',
+                ),
+                request_id=foto['id'],
+            )
+        try:
+            batch.execute()
+        except (HttpError, OSError) as error:
+            # Falló la petición batch entera: se reintenta todo lo que no llegó a tener respuesta.
+            if (isinstance(error, HttpError) and not _es_reintentable(error)) or intento == REINTENTOS:
+                raise
+            respondidas = set(movidas) | set(fallidas)
+            reintentar = {foto_id: foto for foto_id, foto in pendientes.items() if foto_id not in respondidas}
+
+        if not reintentar:
+            break
+        pendientes = reintentar
+        # Espera exponencial con algo de azar para no chocar de nuevo con el límite
+        time.sleep(min(32, 2 ** intento) + random.random())
+
+    return movidas, fallidas
+
+
+def esta_colgado(trabajo):
+    """True si el trabajo figura en curso pero hace más de SIN_LATIDO que no avanza."""
+    return trabajo.estado in ('PENDIENTE', 'EN_CURSO') and trabajo.fecha_actualizacion < timezone.now() - SIN_LATIDO
+
+
+def tomar_colgado(trabajo):
+    """
+    Se queda con un trabajo colgado para retomarlo. Si dos procesos lo intentan a la vez,
+    sólo uno gana: el update compara la fecha_actualizacion que leyó.
+    """
+    return TrabajoLote.objects.filter(id=trabajo.id, fecha_actualizacion=trabajo.fecha_actualizacion).update(
+        estado='EN_CURSO', fecha_actualizacion=timezone.now(),
+    ) == 1
+
+
+def _preparar_fotos(trabajo, fotos):
+    """
+    Registra las fotos de la raíz en el trabajo. Al retomar uno interrumpido:
+    - las que siguen en la raíz se vuelven a intentar (aunque hayan fallado antes),
+    - las pendientes que ya no están en la raíz se movieron antes del corte: quedan hechas.
+    """
+    reanudando = trabajo.fotos.exists()
+    FotoTrabajo.objects.bulk_create(
+        [FotoTrabajo(trabajo=trabajo, drive_file_id=f['id'], nombre=f.get('name', '')) for f in fotos],
+        batch_size=500, ignore_conflicts=True,
+    )
+    if not reanudando:
+        return
+    en_raiz = [f['id'] for f in fotos]
+    for inicio in range(0, len(en_raiz), 500):
+        trabajo.fotos.filter(drive_file_id__in=en_raiz[inicio:inicio + 500]).exclude(estado='PENDIENTE').update(
+            estado='PENDIENTE', error='',
+        )
+    movidas = list(set(trabajo.fotos.filter(estado='PENDIENTE').values_list('drive_file_id', flat=True)) - set(en_raiz))
+    for inicio in range(0, len(movidas), 500):
+        trabajo.fotos.filter(drive_file_id__in=movidas[inicio:inicio + 500]).update(estado='HECHA')
+
+
+def ejecutar_organizacion(trabajo, service, informar=None):
+    """
+    Línea por línea:
+    1. Se asegura de que exista 'Genealogia'.
+    2. Lista TODAS las fotos de la raíz de Drive (con paginación).
+    3. Las registra en el trabajo (si es uno retomado, ver _preparar_fotos) y arma los contadores.
+    4. Las mueve en lotes de 100 y va guardando el progreso (y el latido) en el TrabajoLote.
+    """
+    folder_id = asegurar_carpeta_raiz(service)
+    query_fotos = "mimeType contains 'image/' and 'root' in parents and trashed = false"
+    fotos = list(listar_paginado(service, query_fotos, "id, name, parents"))
+
+    with transaction.atomic():
+        _preparar_fotos(trabajo, fotos)
+        cuentas = dict(trabajo.fotos.values('estado').annotate(n=Count('id')).values_list('estado', 'n'))
+        total = sum(cuentas.values())
+        TrabajoLote.objects.filter(id=trabajo.id).update(
+            carpeta_id=folder_id, estado='EN_CURSO', total=total,
+            procesadas=total - cuentas.get('PENDIENTE', 0), fallidas=cuentas.get('ERROR', 0),
+            fecha_actualizacion=timezone.now(),
+        )
+
+    for inicio in range(0, len(fotos), MAX_POR_LOTE):
+        movidas, fallidas = mover_lote(service, folder_id, fotos[inicio:inicio + MAX_POR_LOTE])
+        with transaction.atomic():
+            FotoTrabajo.objects.filter(trabajo=trabajo, drive_file_id__in=movidas).update(estado='HECHA')
+            for foto_id, mensaje in fallidas.items():
+                FotoTrabajo.objects.filter(trabajo=trabajo, drive_file_id=foto_id).update(estado='ERROR', error=mensaje)
+            TrabajoLote.objects.filter(id=trabajo.id).update(
+                procesadas=F('procesadas') + len(movidas) + len(fallidas),
+                fallidas=F('fallidas') + len(fallidas),
+                fecha_actualizacion=timezone.now(),
+            )
+        if informar:
+            trabajo.refresh_from_db()
+            informar(trabajo)
+
+    trabajo.refresh_from_db()
+    trabajo.estado = 'TERMINADO'
+    trabajo.mensaje = f"{trabajo.procesadas - trabajo.fallidas} fotos movidas, {trabajo.fallidas} con error."
+    trabajo.save(update_fields=['estado', 'mensaje', 'fecha_actualizacion'])
+    return trabajo
+
+
+def organizar_en_segundo_plano(creds_data):
+    """
+    Ejecuta la organización en un hilo aparte: la petición web vuelve enseguida.
+    Si ya hay una corriendo, devuelve esa; si hay una colgada (el proceso que la corría se
+    reinició), la retoma; si no, crea un trabajo nuevo.
+    """
+    activo = TrabajoLote.objects.filter(tipo='ORGANIZAR', estado__in=('PENDIENTE', 'EN_CURSO')).order_by('-id').first()
+    if activo is not None:
+        if not esta_colgado(activo) or not tomar_colgado(activo):
+            return activo   # sigue corriendo (o lo acaba de retomar otro proceso)
+        trabajo = activo
+    else:
+        trabajo = TrabajoLote.objects.create(tipo='ORGANIZAR', carpeta_id='', estado='PENDIENTE')
+
+    def correr():
+        try:
+            ejecutar_organizacion(trabajo, crear_servicio(creds_data))
+        except Exception as e:
+            TrabajoLote.objects.filter(id=trabajo.id).update(estado='FALLIDO', mensaje=str(e))
+        finally:
+            connection.close()   # el hilo tiene su propia conexión a la BD
+
+    threading.Thread(target=correr, name=f"organizar-{trabajo.id}", daemon=True).start()
+    return trabajo
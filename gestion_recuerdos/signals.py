@@ -0,0 +1,64 @@
+import sys
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .arbol import arbol_si_cargado
+from .busqueda import indexar_familiar, quitar_familiar
+from .gedcom import xref_local
+from .models import Familiar, Relacion, RostroDetectado
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Señales: Django llama a estas funciones cada vez que se guarda o borra un RostroDetectado.
+# Así el índice de embeddings en memoria nunca queda desactualizado en este proceso.
+# Lo mismo con el árbol genealógico cuando se agrega o borra una Relacion,
+# y con el índice de búsqueda cuando se guarda o borra un Familiar. Un Familiar nuevo sin xref
+# GEDCOM recibe el suyo al guardarse, así exportar el árbol no tiene que escribir en la BD.
+# Este módulo se carga al arrancar cualquier proceso: no importa nada pesado (numpy, OpenCV).
+
+
+def indice_si_cargado():
+    """El índice de rostros sólo puede estar cargado si alguien importó su módulo; si no, no se importa acá."""
+    modulo = sys.modules.get('gestion_recuerdos.indice_rostros')
+    return modulo.indice_si_cargado() if modulo is not None else None
+
+
+@receiver(post_save, sender=RostroDetectado)
+def rostro_guardado(sender, instance, **kwargs):
+    indice = indice_si_cargado()
+    if indice is not None:
+        indice.actualizar(instance)
+
+
+@receiver(post_delete, sender=RostroDetectado)
+def rostro_borrado(sender, instance, **kwargs):
+    indice = indice_si_cargado()
+    if indice is not None:
+        indice.quitar(instance.id)
+
+
+@receiver(post_save, sender=Relacion)
+def relacion_guardada(sender, instance, **kwargs):
+    arbol = arbol_si_cargado()
+    if arbol is not None:
+        arbol.agregar(instance.origen_id, instance.destino_id, instance.tipo)
+
+
+@receiver(post_delete, sender=Relacion)
+def relacion_borrada(sender, instance, **kwargs):
+    arbol = arbol_si_cargado()
+    if arbol is not None:
+        arbol.quitar(instance.origen_id, instance.destino_id, instance.tipo)
+
+
+@receiver(post_save, sender=Familiar)
+def familiar_guardado(sender, instance, **kwargs):
+    if instance.gedcom_xref is None:
+        instance.gedcom_xref = xref_local(instance.id)
+        Familiar.objects.filter(id=instance.id, gedcom_xref__isnull=True).update(gedcom_xref=instance.gedcom_xref)
+    indexar_familiar(instance)
+
+
+@receiver(post_delete, sender=Familiar)
+def familiar_borrado(sender, instance, **kwargs):
+    quitar_familiar(instance.id)
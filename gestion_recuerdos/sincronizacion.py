@@ -0,0 +1,272 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .drive import MIME_CARPETA, buscar_carpeta_raiz, listar_paginado
+from .metadatos import CAMPOS_DRIVE, guardar_desde_sincronizacion
+from .models import DriveArchivo, EstadoSincronizacion
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Mantiene la tabla DriveArchivo igual a lo que hay dentro de 'Genealogia' en Drive.
+# 1. rastreo_completo: se hace UNA vez, recorriendo todas las carpetas con paginación.
+# 2. aplicar_cambios: después sólo se piden los cambios desde el último "page token"
+#    (API changes.list), normalmente una sola llamada aunque haya miles de carpetas.
+# Cada paso tiene su versión async (con ClienteDriveAsync) para las vistas async.
+# Con cada foto se pide también su imageMediaMetadata (fecha, GPS, cámara): llega en la misma
+# respuesta y se guarda en MetadatosFoto sin ninguna llamada extra (ver metadatos.py).
+
+CAMPOS_ARCHIVO = f"id, name, mimeType, parents, md5Checksum, modifiedTime, size, trashed, {CAMPOS_DRIVE}"
+CAMPOS_CAMBIOS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({CAMPOS_ARCHIVO}))"
+CARPETAS_POR_CONSULTA = 40   # varias carpetas en un mismo "q" = menos viajes a la API
+
+
+def _a_modelo(item):
+    return DriveArchivo(
+        drive_id=item['id'],
+        nombre=item.get('name', ''),
+        mime_type=item.get('mimeType', ''),
+        padres=item.get('parents', []),
+        md5=item.get('md5Checksum', ''),
+        modificado=parse_datetime(item['modifiedTime']) if item.get('modifiedTime') else None,
+        tamano=int(item['size']) if item.get('size') else None,
+    )
+
+
+def _consulta_hijos(grupo):
+    padres = " or ".join(f"'{carpeta_id}' in parents" for carpeta_id in grupo)
+    return f"({padres}) and trashed = false"
+
+
+def _rastrear_desde(service, carpetas):
+    """Recorre en anchura el árbol bajo las carpetas dadas y devuelve todos sus elementos."""
+    encontrados = []
+    pendientes = list(carpetas)
+    while pendientes:
+        grupo, pendientes = pendientes[:CARPETAS_POR_CONSULTA], pendientes[CARPETAS_POR_CONSULTA:]
+        for item in listar_paginado(service, _consulta_hijos(grupo), CAMPOS_ARCHIVO):
+            encontrados.append(item)
+            if item['mimeType'] == MIME_CARPETA:
+                pendientes.append(item['id'])
+    return encontrados
+
+
+async def _rastrear_desde_async(cliente, carpetas):
+    """Igual que _rastrear_desde, pero todas las consultas de un mismo nivel van en paralelo."""
+    encontrados = []
+    nivel = list(carpetas)
+    while nivel:
+        grupos = [nivel[i:i + CARPETAS_POR_CONSULTA] for i in range(0, len(nivel), CARPETAS_POR_CONSULTA)]
+        respuestas = await asyncio.gather(*(cliente.listar(_consulta_hijos(g), CAMPOS_ARCHIVO) for g in grupos))
+        nivel = []
+        for items in respuestas:
+            encontrados.extend(items)
+            nivel.extend(i['id'] for i in items if i['mimeType'] == MIME_CARPETA)
+    return encontrados
+
+
+def _guardar(items, huellas=None):
+    archivos = [_a_modelo(item) for item in items]
+    for archivo in archivos:
+        if huellas and archivo.drive_id in huellas:
+            archivo.huella, archivo.huella_md5, archivo.copia_de = huellas[archivo.drive_id]
+    DriveArchivo.objects.bulk_create(
+        archivos,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['drive_id'],
+        update_fields=['nombre', 'mime_type', 'padres', 'md5', 'modificado', 'tamano'],
+    )
+    guardar_desde_sincronizacion(items)
+
+
+def _guardar_rastreo(raiz_id, token, items):
+    with transaction.atomic():
+        # Las huellas perceptuales cuestan una descarga cada una: se conservan al reconstruir,
+        # junto con el grupo de copias que se calculó con ellas (huellas.guardar_grupos).
+        huellas = {
+            drive_id: (huella, huella_md5, copia_de) for drive_id, huella, huella_md5, copia_de in
+            DriveArchivo.objects.filter(huella__isnull=False).values_list('drive_id', 'huella', 'huella_md5', 'copia_de')
+        }
+        DriveArchivo.objects.all().delete()
+        _guardar(items, huellas)
+        estado, _ = EstadoSincronizacion.objects.update_or_create(
+            clave='drive',
+            defaults={
+                'carpeta_raiz_id': raiz_id,
+                'page_token': token,
+                'fecha_rastreo_completo': timezone.now(),
+                'fecha_ultimo_cambio': timezone.now(),
+            },
+        )
+    return estado
+
+
+def rastreo_completo(service):
+    """
+    Reconstruye DriveArchivo desde cero. Devuelve el EstadoSincronizacion o None
+    si la carpeta 'Genealogia' no existe.
+    """
+    # El token se pide ANTES de recorrer: lo que cambie durante el rastreo llegará como cambio.
+    token = service.changes().getStartPageToken().execute()['startPageToken']
+    raiz_id = buscar_carpeta_raiz(service)
+    if not raiz_id:
+        return None
+    return _guardar_rastreo(raiz_id, token, _rastrear_desde(service, [raiz_id]))
+
+
+async def rastreo_completo_async(cliente):
+    token = await cliente.token_inicial_cambios()
+    raiz_id = await cliente.buscar_carpeta_raiz()
+    if not raiz_id:
+        return None
+    items = await _rastrear_desde_async(cliente, [raiz_id])
+    return await sync_to_async(_guardar_rastreo)(raiz_id, token, items)
+
+
+#---------------------------------------------------------------------------------
+def _carpetas_conocidas(estado):
+    carpetas = set(
+        DriveArchivo.objects.filter(mime_type=MIME_CARPETA).values_list('drive_id', flat=True)
+    )
+    carpetas.add(estado.carpeta_raiz_id)
+    return carpetas
+
+
+def _clasificar_cambios(cambios, carpetas):
+    """
+    Decide qué hacer con cada cambio: guardarlo si quedó dentro del árbol o borrarlo si salió.
+    Devuelve (borrar, guardar, carpetas_nuevas, carpeta_quitada).
+    """
+    # Las carpetas primero, para que sus hijos ya las encuentren como "conocidas".
+    cambios = sorted(cambios, key=lambda c: (c.get('file') or {}).get('mimeType') != MIME_CARPETA)
+
+    borrar, guardar, carpetas_nuevas = [], [], []
+    carpeta_quitada = False
+    for cambio in cambios:
+        item = cambio.get('file')
+        dentro = item and not item.get('trashed') and any(p in carpetas for p in item.get('parents', []))
+        if cambio.get('removed') or not dentro:
+            borrar.append(cambio['fileId'])
+            if cambio['fileId'] in carpetas:
+                carpetas.discard(cambio['fileId'])
+                carpeta_quitada = True
+            continue
+        guardar.append(item)
+        if item['mimeType'] == MIME_CARPETA and item['id'] not in carpetas:
+            carpetas.add(item['id'])
+            carpetas_nuevas.append(item['id'])
+    return borrar, guardar, carpetas_nuevas, carpeta_quitada
+
+
+def _guardar_cambios(estado, nuevo_token, hubo_cambios, borrar, guardar, carpeta_quitada):
+    with transaction.atomic():
+        DriveArchivo.objects.filter(drive_id__in=borrar).delete()
+        _guardar(guardar)
+        if carpeta_quitada:
+            _podar_huerfanos(estado.carpeta_raiz_id)
+        estado.page_token = nuevo_token
+        if hubo_cambios:
+            estado.fecha_ultimo_cambio = timezone.now()
+        estado.save()
+
+
+def aplicar_cambios(service, estado):
+    """
+    Trae los cambios desde estado.page_token y los aplica a DriveArchivo.
+    Devuelve la cantidad de cambios procesados.
+    """
+    if not estado.page_token:
+        # Sin token no se sabe desde cuándo pedir cambios: se rastrea todo (y se guarda uno nuevo).
+        rastreo_completo(service)
+        return 0
+    token = pagina = estado.page_token
+    cambios, nuevo_token = [], None
+    while token:
+        pagina = token
+        respuesta = service.changes().list(
+            pageToken=pagina, pageSize=1000, spaces='drive', fields=CAMPOS_CAMBIOS,
+        ).execute()
+        cambios.extend(respuesta.get('changes', []))
+        if 'newStartPageToken' in respuesta:
+            nuevo_token = respuesta['newStartPageToken']
+            break
+        token = respuesta.get('nextPageToken')
+    # Drive siempre cierra con newStartPageToken; si no llegó, la próxima vez se sigue desde la
+    # última página leída (volver a aplicar esos cambios no hace daño).
+    nuevo_token = nuevo_token or pagina
+
+    borrar, guardar, carpetas_nuevas, carpeta_quitada = _clasificar_cambios(cambios, _carpetas_conocidas(estado))
+    # Una carpeta que entra al árbol trae su contenido, que no aparece como cambio.
+    if carpetas_nuevas:
+        guardar.extend(_rastrear_desde(service, carpetas_nuevas))
+
+    _guardar_cambios(estado, nuevo_token, bool(cambios), borrar, guardar, carpeta_quitada)
+    return len(cambios)
+
+
+async def aplicar_cambios_async(cliente, estado):
+    if not estado.page_token:
+        await rastreo_completo_async(cliente)
+        return 0
+    token = pagina = estado.page_token
+    cambios, nuevo_token = [], None
+    while token:
+        pagina = token
+        respuesta = await cliente.listar_cambios(pagina, CAMPOS_CAMBIOS)
+        cambios.extend(respuesta.get('changes', []))
+        if 'newStartPageToken' in respuesta:
+            nuevo_token = respuesta['newStartPageToken']
+            break
+        token = respuesta.get('nextPageToken')
+    nuevo_token = nuevo_token or pagina
+
+    carpetas = await sync_to_async(_carpetas_conocidas)(estado)
+    borrar, guardar, carpetas_nuevas, carpeta_quitada = _clasificar_cambios(cambios, carpetas)
+    if carpetas_nuevas:
+        guardar.extend(await _rastrear_desde_async(cliente, carpetas_nuevas))
+
+    await sync_to_async(_guardar_cambios)(estado, nuevo_token, bool(cambios), borrar, guardar, carpeta_quitada)
+    return len(cambios)
+
+
+def _podar_huerfanos(raiz_id):
+    """
+    Si una carpeta salió del árbol, también salen sus descendientes (que no llegan como cambio).
+    Lee la tabla UNA vez, recorre en memoria desde la raíz y borra todo lo que no se alcanzó.
+    """
+    hijos, todos = {}, []
+    for drive_id, padres in DriveArchivo.objects.values_list('drive_id', 'padres').iterator(chunk_size=5000):
+        todos.append(drive_id)
+        for padre in padres:
+            hijos.setdefault(padre, []).append(drive_id)
+    alcanzados = set()
+    pendientes = [raiz_id]
+    while pendientes:
+        for hijo in hijos.get(pendientes.pop(), ()):
+            if hijo not in alcanzados:
+                alcanzados.add(hijo)
+                pendientes.append(hijo)
+    huerfanos = [drive_id for drive_id in todos if drive_id not in alcanzados]
+    for inicio in range(0, len(huerfanos), 500):
+        DriveArchivo.objects.filter(drive_id__in=huerfanos[inicio:inicio + 500]).delete()
+
+
+#---------------------------------------------------------------------------------
+def sincronizar(service):
+    """Rastreo completo la primera vez; después, sólo cambios."""
+    estado = EstadoSincronizacion.objects.filter(clave='drive').first()
+    if estado is None:
+        return rastreo_completo(service)
+    aplicar_cambios(service, estado)
+    return estado
+
+
+async def sincronizar_async(cliente):
+    estado = await EstadoSincronizacion.objects.filter(clave='drive').afirst()
+    if estado is None:
+        return await rastreo_completo_async(cliente)
+    await aplicar_cambios_async(cliente, estado)
+    return estado
@@ -0,0 +1,91 @@
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Carpeta temporal de recortes, separada por análisis:
+#   media/temp_caras/<id_de_analisis>/cara_<i>_<azar>.jpg
+# Cada análisis (pestaña, usuario o worker) tiene su propia subcarpeta, así nadie pisa
+# los recortes de otro. Las subcarpetas viejas se borran solas pasado un tiempo (TTL).
+
+CARPETA_TEMP = 'temp_caras'
+_ID_VALIDO = re.compile(r'^[0-9a-f]{32}$')
+_NOMBRE_VALIDO = re.compile(r'^cara_\d+_[0-9a-f]{8}\.jpg$')
+
+_ultima_limpieza = None
+_lock_limpieza = threading.Lock()
+
+
+def carpeta_base():
+    return os.path.join(settings.MEDIA_ROOT, CARPETA_TEMP)
+
+
+def crear_analisis():
+    """Crea la subcarpeta de un análisis nuevo y devuelve su id."""
+    limpiar_vencidos_si_toca()
+    analisis_id = uuid.uuid4().hex
+    os.makedirs(os.path.join(carpeta_base(), analisis_id))
+    return analisis_id
+
+
+def nombre_recorte(indice):
+    return f"cara_{indice}_{secrets.token_hex(4)}.jpg"
+
+
+def ruta_recorte(analisis_id, nombre):
+    """
+    Ruta absoluta de un recorte temporal. Valida el id y el nombre que vienen del formulario
+    para que nadie pueda pedir archivos fuera de temp_caras (por ejemplo con '../').
+    """
+    if not _ID_VALIDO.match(analisis_id or '') or not _NOMBRE_VALIDO.match(nombre or ''):
+        raise ValueError("Recorte temporal inválido")
+    return os.path.join(carpeta_base(), analisis_id, nombre)
+
+
+def url_recorte(analisis_id, nombre):
+    return f"{settings.MEDIA_URL}{CARPETA_TEMP}/{analisis_id}/{nombre}"
+
+
+def borrar_analisis(analisis_id):
+    if _ID_VALIDO.match(analisis_id or ''):
+        shutil.rmtree(os.path.join(carpeta_base(), analisis_id), ignore_errors=True)
+
+
+#---------------------------------------------------------------------------------
+def limpiar_vencidos(ttl=None):
+    """Borra las subcarpetas de análisis más viejas que el TTL. Devuelve cuántas borró."""
+    ttl = settings.TEMP_CARAS_TTL if ttl is None else ttl
+    limite = time.time() - ttl
+    borradas = 0
+    if not os.path.isdir(carpeta_base()):
+        return 0
+    for entrada in os.scandir(carpeta_base()):
+        try:
+            if entrada.stat().st_mtime >= limite:
+                continue
+            if entrada.is_dir():
+                shutil.rmtree(entrada.path, ignore_errors=True)
+            else:
+                # Recortes sueltos del formato anterior (temp_caras/cara_0.jpg)
+                os.remove(entrada.path)
+            borradas += 1
+        except FileNotFoundError:
+            pass   # otro worker la borró al mismo tiempo
+    return borradas
+
+
+def limpiar_vencidos_si_toca():
+    """Limpia como mucho una vez cada TEMP_CARAS_INTERVALO_LIMPIEZA segundos por proceso."""
+    global _ultima_limpieza
+    with _lock_limpieza:
+        ahora = time.monotonic()
+        if _ultima_limpieza is not None and ahora - _ultima_limpieza < settings.TEMP_CARAS_INTERVALO_LIMPIEZA:
+            return
+        _ultima_limpieza = ahora
+    limpiar_vencidos()
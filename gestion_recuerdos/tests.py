@@ -1,3 +1,484 @@
-from django.test import TestCase
+import io
+import os
+import re
+from datetime import date, datetime
+import shutil
+import tempfile
+import time
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from . import cache_descargas, drive, drive_falso, gedcom, huellas, metadatos, sincronizacion
+from .arbol import nombre_parentesco
+from .duplicados_familiares import clave_fonetica
+from .drive_falso import RAIZ, arbol_de_prueba
+from .models import Configuracion, DriveArchivo, EstadoSincronizacion, Familiar, FotoTrabajo, Relacion, RostroDetectado, TrabajoLote
+from .temporales import crear_analisis, nombre_recorte, ruta_recorte
+
+# --- IMPORTACIONES EXPLICADAS ---
+# Pruebas de las vistas contra el Drive falso (drive_falso): ninguna sale a internet.
+# - Cada prueba arma su propio Drive falso (un dict de configuración nuevo = una instancia nueva)
+#   y una carpeta de medios temporal, igual que el comando prueba_carga.
+# - Las fotos sintéticas no tienen caras: el análisis se prueba de punta a punta (descarga,
+#   detección, caché) y el guardado de rostros con un recorte escrito a mano.
+
+
+class ConDriveFalso:
+    """Mezcla para los TestCase: Drive falso chico, medios en una carpeta temporal y sesión iniciada."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp(prefix='pruebas_gr_')
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.config = {'arbol': arbol_de_prueba(carpetas=2, fotos_por_carpeta=3, sueltas=4)}
+        ajustes = override_settings(
+            DRIVE_FALSO=self.config, MEDIA_ROOT=media, CACHE_DRIVE_CARPETA=os.path.join(media, 'cache_drive'),
+            STORAGES={**settings.STORAGES, 'recortes': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media},
+            }},
+            PERFIL_PETICIONES=False,
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # La caché de descargas se arma con la carpeta de la prueba y se olvida al terminar.
+        cache_descargas._cache = None
+        self.addCleanup(setattr, cache_descargas, '_cache', None)
+
+        self.falso = drive_falso.obtener()
+        self.cliente = Client()
+        sesion = self.cliente.session
+        sesion['credentials'] = dict(drive_falso.CREDENCIALES)
+        sesion.save()
+
+    def llamadas(self, operacion=None):
+        estadisticas = self.falso.estadisticas()
+        return estadisticas['llamadas'].get(operacion, 0) if operacion else estadisticas['total_llamadas']
+
+
+#-----------------------------------------------------------------------------
+class ListarFotosTests(ConDriveFalso, TestCase):
+
+    def test_sin_sesion_manda_a_iniciar_sesion(self):
+        respuesta = Client().get(reverse('ver_fotos'))
+        self.assertRedirects(respuesta, reverse('login_google'), fetch_redirect_response=False)
+
+    def test_la_primera_vez_recorre_drive_y_despues_lee_la_tabla_local(self):
+        respuesta = self.cliente.get(reverse('ver_fotos'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(EstadoSincronizacion.objects.filter(clave='drive').exists())
+
+        fotos = DriveArchivo.objects.filter(mime_type__startswith='image/')
+        self.assertEqual(fotos.count(), 6)   # las de 'Genealogia'; las sueltas de la raíz no
+        self.assertContains(respuesta, "6 fotos en todas las subcarpetas")
+        for drive_id in fotos.values_list('drive_id', flat=True):
+            self.assertContains(respuesta, reverse('analizar_en_vivo', args=[drive_id]))
+
+        antes = self.llamadas()
+        respuesta = self.cliente.get(reverse('ver_fotos'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.llamadas(), antes)
+
+    def test_las_copias_se_muestran_bajo_la_principal(self):
+        self.cliente.get(reverse('ver_fotos'))
+        principal, copia, *_ = DriveArchivo.objects.filter(mime_type__startswith='image/').order_by('nombre')
+        DriveArchivo.objects.filter(pk=copia.pk).update(copia_de=principal.drive_id)
+
+        respuesta = self.cliente.get(reverse('ver_fotos'))
+        self.assertContains(respuesta, "(1 son copias de otras)")
+        self.assertContains(respuesta, "1 copia(s)")
+        # La copia aparece una sola vez: dentro del grupo, no como foto suelta
+        self.assertContains(respuesta, reverse('analizar_en_vivo', args=[copia.drive_id]), count=1)
+
+    def test_un_rastreo_completo_conserva_los_grupos_de_copias(self):
+        self.cliente.get(reverse('ver_fotos'))
+        principal, copia, *_ = DriveArchivo.objects.filter(mime_type__startswith='image/').order_by('nombre')
+        DriveArchivo.objects.filter(pk__in=[principal.pk, copia.pk]).update(huella=7, huella_md5=F('md5'))
+        DriveArchivo.objects.filter(pk=copia.pk).update(copia_de=principal.drive_id)
+
+        sincronizacion.rastreo_completo(drive.crear_servicio(dict(drive_falso.CREDENCIALES)))
+        self.assertEqual(DriveArchivo.objects.get(drive_id=copia.drive_id).copia_de, principal.drive_id)
+        self.assertContains(self.cliente.get(reverse('ver_fotos')), "(1 son copias de otras)")
+
+
+#-----------------------------------------------------------------------------
+class AnalizarRostrosTests(ConDriveFalso, TestCase):
+
+    def test_analiza_la_foto_y_la_segunda_vez_no_la_baja_de_nuevo(self):
+        foto = self.falso.fotos()[0]
+        respuesta = self.cliente.get(reverse('analizar_rostros', args=[foto]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotContains(respuesta, "Error:")
+        self.assertContains(respuesta, "Resultados del Análisis")
+        self.assertContains(respuesta, f"name='foto' value='{foto}'")
+        self.assertEqual(self.llamadas('files.get_media'), 1)
+
+        respuesta = self.cliente.get(reverse('analizar_rostros', args=[foto]))
+        self.assertContains(respuesta, "Resultados del Análisis")
+        self.assertEqual(self.llamadas('files.get_media'), 1)
+
+    def test_una_foto_que_no_existe_muestra_el_error(self):
+        respuesta = self.cliente.get(reverse('analizar_rostros', args=['no-existe']))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.content.startswith(b"Error:"))
+
+    def test_el_id_de_la_url_se_escapa(self):
+        respuesta = self.cliente.get(reverse('analizar_rostros', args=["x'><img src=x onerror=alert(1)>"]))
+        self.assertNotContains(respuesta, "<img src=x")
+
+
+#-----------------------------------------------------------------------------
+class ConRecorte(ConDriveFalso):
+    """Un familiar, una foto del Drive falso y un análisis con el recorte de una cara."""
+
+    def setUp(self):
+        super().setUp()
+        self.familiar = Familiar.objects.create(nombre='Ana', apellido='Prueba')
+        self.foto = self.falso.fotos()[0]
+        self.analisis = crear_analisis()
+        self.recorte = nombre_recorte(0)
+        cv2.imwrite(ruta_recorte(self.analisis, self.recorte), np.full((80, 80, 3), 128, np.uint8))
+
+    def datos(self, **extra):
+        return {'analisis': self.analisis, 'foto': self.foto, 'archivo_0': self.recorte,
+                'caja_0': '1,2,30,40', 'familiar_0': str(self.familiar.id), **extra}
+
+
+class GuardarRostroTests(ConRecorte, TestCase):
+
+    def test_guarda_la_cara_y_borra_la_carpeta_del_analisis(self):
+        respuesta = self.cliente.post(reverse('guardar_rostro'), self.datos())
+        self.assertContains(respuesta, "¡Guardado con éxito! (1 caras)")
+        rostro = RostroDetectado.objects.get()
+        self.assertEqual((rostro.familiar_id, rostro.drive_file_id), (self.familiar.id, self.foto))
+        self.assertFalse(os.path.exists(ruta_recorte(self.analisis, self.recorte)))
+
+    def test_si_una_cara_falla_conserva_la_carpeta_para_reintentar(self):
+        datos = self.datos(archivo_1=self.recorte, caja_1='1,2,30,40', familiar_1='999999999')
+        respuesta = self.cliente.post(reverse('guardar_rostro'), datos)
+        self.assertContains(respuesta, "Se guardaron 1 de 2 caras")
+        self.assertContains(respuesta, "Cara 2:")
+        self.assertTrue(os.path.exists(ruta_recorte(self.analisis, self.recorte)))
+
+    def test_reintentar_no_duplica_la_cara(self):
+        otro = Familiar.objects.create(nombre='Beto', apellido='Prueba')
+        self.cliente.post(reverse('guardar_rostro'), self.datos(
+            archivo_1='cara_1_00000000.jpg', caja_1='9,9,9,9', familiar_1=str(self.familiar.id),
+        ))
+        self.cliente.post(reverse('guardar_rostro'), self.datos(familiar_0=str(otro.id)))
+        self.assertEqual(list(RostroDetectado.objects.values_list('familiar_id', flat=True)), [otro.id])
+
+    def test_sin_sesion_no_guarda_nada(self):
+        respuesta = Client().post(reverse('guardar_rostro'), self.datos())
+        self.assertRedirects(respuesta, reverse('login_google'), fetch_redirect_response=False)
+        self.assertFalse(RostroDetectado.objects.exists())
+
+    def test_el_formulario_del_analisis_trae_el_token_csrf(self):
+        cliente = Client(enforce_csrf_checks=True)
+        cliente.cookies = self.cliente.cookies
+        pagina = cliente.get(reverse('analizar_en_vivo', args=[self.foto])).content.decode()
+        token = re.search(r"name='csrfmiddlewaretoken' value='([^']+)'", pagina).group(1)
+        respuesta = cliente.post(reverse('guardar_rostro'), self.datos(csrfmiddlewaretoken=token))
+        self.assertContains(respuesta, "¡Guardado con éxito! (1 caras)")
+
+    def test_sin_token_csrf_no_guarda_nada(self):
+        cliente = Client(enforce_csrf_checks=True)
+        cliente.cookies = self.cliente.cookies
+        respuesta = cliente.post(reverse('guardar_rostro'), self.datos())
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertFalse(RostroDetectado.objects.exists())
+
+
+@override_settings(ROSTROS_API_TOKEN='token-de-prueba')
+class ApiGuardarRostrosTests(ConRecorte, TestCase):
+
+    def pedir(self, cliente, **cabeceras):
+        cuerpo = {'rostros': [{'analisis': self.analisis, 'archivo': self.recorte, 'familiar': self.familiar.id,
+                               'drive_file_id': self.foto, 'caja': [1, 2, 30, 40]}]}
+        return cliente.post(reverse('api_guardar_rostros'), cuerpo, content_type='application/json', headers=cabeceras)
+
+    def test_sin_autenticar_no_guarda_nada(self):
+        respuesta = self.pedir(Client())
+        self.assertEqual(respuesta.status_code, 401)
+        respuesta = self.pedir(Client(), Authorization='Bearer otro-token')
+        self.assertEqual(respuesta.status_code, 401)
+        self.assertFalse(RostroDetectado.objects.exists())
+
+    def test_con_el_token_no_pide_csrf(self):
+        respuesta = self.pedir(Client(enforce_csrf_checks=True), Authorization='Bearer token-de-prueba')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json()['guardados'], 1)
+
+    def test_con_la_sesion_pide_csrf(self):
+        cliente = Client(enforce_csrf_checks=True)
+        cliente.cookies = self.cliente.cookies
+        self.assertEqual(self.pedir(cliente).status_code, 403)
+        self.assertFalse(RostroDetectado.objects.exists())
+
+
+#-----------------------------------------------------------------------------
+class ConfigurarEntornoDriveTests(ConDriveFalso, TransactionTestCase):
+    """TransactionTestCase: la organización corre en otro hilo, que tiene que ver lo que escribe la vista."""
+
+    ESPERA_SEGUNDOS = 30
+
+    def esperar(self, trabajo_id):
+        limite = time.monotonic() + self.ESPERA_SEGUNDOS
+        while time.monotonic() < limite:
+            trabajo = TrabajoLote.objects.get(id=trabajo_id)
+            if trabajo.estado in ('TERMINADO', 'FALLIDO'):
+                return trabajo
+            time.sleep(0.05)
+        self.fail(f"El trabajo {trabajo_id} no terminó en {self.ESPERA_SEGUNDOS} s")
+
+    def test_mueve_las_fotos_sueltas_a_genealogia(self):
+        sueltas = [foto for foto in self.falso.fotos() if self.falso.archivos[foto]['parents'] == [RAIZ]]
+        self.assertEqual(len(sueltas), 4)
+
+        respuesta = self.cliente.get(reverse('organizar_drive'))
+        self.assertEqual(respuesta.status_code, 302)
+        trabajo_id = int(re.search(r'/trabajos/(\d+)/', respuesta['Location']).group(1))
+        trabajo = self.esperar(trabajo_id)
+
+        self.assertEqual(trabajo.estado, 'TERMINADO', trabajo.mensaje)
+        self.assertEqual(trabajo.fallidas, 0)
+        for foto in sueltas:
+            self.assertEqual(self.falso.archivos[foto]['parents'], [trabajo.carpeta_id])
+
+    def test_sin_sesion_manda_a_iniciar_sesion(self):
+        respuesta = Client().get(reverse('organizar_drive'))
+        self.assertRedirects(respuesta, reverse('login_google'), fetch_redirect_response=False)
+        self.assertFalse(TrabajoLote.objects.exists())
+
+
+class VerTrabajoTests(TestCase):
+
+    def test_los_nombres_de_drive_y_los_errores_se_escapan(self):
+        trabajo = TrabajoLote.objects.create(tipo='ORGANIZAR', estado='TERMINADO', mensaje='<b>listo</b>')
+        FotoTrabajo.objects.create(trabajo=trabajo, drive_file_id='F1', nombre='<img src=x onerror=alert(1)>.jpg',
+                                   estado='ERROR', error='<script>')
+        respuesta = self.client.get(reverse('ver_trabajo', args=[trabajo.id]))
+        self.assertContains(respuesta, "&lt;img src=x onerror=alert(1)&gt;.jpg: &lt;script&gt;")
+        self.assertContains(respuesta, "&lt;b&gt;listo&lt;/b&gt;")
+        self.assertNotContains(respuesta, "<img src=x")
+
+    def test_un_trabajo_que_no_existe_da_404(self):
+        self.assertEqual(self.client.get(reverse('ver_trabajo', args=[999999])).status_code, 404)
+
+    def test_el_progreso_de_un_trabajo_que_no_existe_da_404(self):
+        self.assertEqual(self.client.get(reverse('progreso_trabajo', args=[999999])).status_code, 404)
+
+
+@override_settings(METRICAS_TOKEN='token-de-metricas', METRICAS_IPS=[])
+class DiagnosticoTests(TestCase):
+
+    def test_las_estadisticas_de_la_cache_piden_el_mismo_acceso_que_las_metricas(self):
+        url = reverse('estadisticas_cache')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer otro'}).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer token-de-metricas'}).status_code, 200)
+
+
+class HuellasTests(SimpleTestCase):
+
+    def test_las_huellas_repetidas_se_encadenan_sin_compararlas_todas(self):
+        repetidas = [123456789] * 5000
+        pares = huellas.pares_parecidos(repetidas + [123456789 ^ 0b11, -1], radio=4)
+        self.assertEqual(len(pares), 5000)   # 4999 en cadena + la que está a 2 bits
+        grupos = huellas.agrupar_parecidas([(i, h, i) for i, h in enumerate(repetidas + [-1])], radio=4)
+        self.assertEqual(list(grupos), [4999])
+        self.assertEqual(sorted(grupos[4999]), list(range(4999)))
+
+    def test_encuentra_los_pares_a_radio_bits_o_menos(self):
+        fotos = [('a', 0, 10), ('b', 0b111, 20), ('c', 0b1111111, 30), ('d', -1, 40)]
+        self.assertEqual(huellas.agrupar_parecidas(fotos, radio=3), {'b': ['a']})
+        self.assertEqual(huellas.agrupar_parecidas(fotos, radio=4), {'c': ['a', 'b']})
+
+
+class ParentescoTests(TestCase):
+
+    def test_parentesco_con_uno_mismo(self):
+        familiar = Familiar.objects.create(nombre='Ana', apellido='Prueba')
+        respuesta = self.client.get(reverse('ver_arbol', args=[familiar.id]), {'con': familiar.id})
+        self.assertContains(respuesta, "Es la misma persona.")
+        self.assertNotContains(respuesta, "grado -1")
+
+    def test_nombres(self):
+        self.assertEqual(nombre_parentesco(0, 0), "la misma persona")
+        self.assertEqual(nombre_parentesco(1, 1), "hermano/a")
+        self.assertEqual(nombre_parentesco(3, 3), "primo/a en grado 2")
+        self.assertEqual(nombre_parentesco(4, 0), "ancestro (4 generaciones)")
+
+
+GEDCOM_DE_PRUEBA = """0 HEAD
+1 GEDC
+2 VERS 5.5.1
+0 @I1@ INDI
+1 NAME Juan /Pérez/
+1 BIRT
+2 DATE 12 MAR 1920
+0 @I2@ INDI
+1 NAME María /Gómez/
+1 BIRT
+2 DATE ABT 1925
+1 NOTE Nació en Rosario.
+2 CONT Se mudó a Córdoba.
+0 @I3@ INDI
+1 NAME Ana /Pérez/
+1 NOTE @N1@
+0 @F1@ FAM
+1 HUSB @I1@
+1 WIFE @I2@
+1 CHIL @I3@
+0 TRLR
+"""
+
+
+class GedcomTests(TestCase):
+
+    def setUp(self):
+        gedcom.prefijo_local.cache_clear()
+        self.addCleanup(gedcom.prefijo_local.cache_clear)
+
+    def importar(self, texto):
+        return gedcom.importar_gedcom(io.StringIO(texto))
+
+    def contar(self):
+        return Familiar.objects.count(), Relacion.objects.count()
+
+    def test_fechas(self):
+        self.assertEqual(gedcom.leer_fecha('12 MAR 1920'), date(1920, 3, 12))
+        self.assertEqual(gedcom.leer_fecha(' 1 jan 850 '), date(850, 1, 1))
+        for aproximada in ('ABT 1925', 'MAR 1950', '1950', '31 FEB 1950', '12 XYZ 1950', ''):
+            self.assertIsNone(gedcom.leer_fecha(aproximada), aproximada)
+        self.assertEqual(gedcom.escribir_fecha(date(1920, 3, 12)), '12 MAR 1920')
+
+    def test_importa_personas_fechas_notas_y_relaciones(self):
+        resumen = self.importar(GEDCOM_DE_PRUEBA)
+        self.assertEqual((resumen['personas'], resumen['familias'], resumen['relaciones_nuevas']), (3, 1, 3))
+        juan, maria, ana = (Familiar.objects.get(gedcom_xref=x) for x in ('I1', 'I2', 'I3'))
+        self.assertEqual((juan.nombre, juan.apellido, juan.fecha_nacimiento), ('Juan', 'Pérez', date(1920, 3, 12)))
+        self.assertIsNone(maria.fecha_nacimiento)
+        self.assertEqual(maria.biografia, "Nació en Rosario.\nSe mudó a Córdoba.")
+        self.assertEqual(ana.biografia, '')   # la nota compartida (@N1@) no se sigue
+        self.assertEqual(
+            set(Relacion.objects.values_list('origen_id', 'destino_id', 'tipo')),
+            {(juan.id, ana.id, 'PROGENITOR'), (maria.id, ana.id, 'PROGENITOR'),
+             (min(juan.id, maria.id), max(juan.id, maria.id), 'PAREJA')},
+        )
+
+    def test_reimportar_actualiza_en_vez_de_duplicar(self):
+        self.importar(GEDCOM_DE_PRUEBA)
+        antes = self.contar()
+        self.importar(GEDCOM_DE_PRUEBA.replace('1 NAME Ana /Pérez/', '1 NAME Ana María /Pérez/'))
+        self.assertEqual(self.contar(), antes)
+        self.assertEqual(Familiar.objects.get(gedcom_xref='I3').nombre, 'Ana María')
+
+    def test_ida_y_vuelta(self):
+        self.importar(GEDCOM_DE_PRUEBA)
+        a_mano = Familiar.objects.create(nombre='Luis', apellido='Pérez', fecha_nacimiento=date(1950, 7, 1))
+        Relacion.objects.create(origen=Familiar.objects.get(gedcom_xref='I3'), destino=a_mano, tipo='PROGENITOR')
+        antes = self.contar()
+
+        for version in ('7', '5.5.1'):
+            exportado = ''.join(gedcom.exportar_gedcom(version, tamano_bloque=64))
+            self.assertTrue(exportado.startswith('0 HEAD'))
+            self.assertTrue(exportado.endswith('0 TRLR\n'))
+            self.assertIn(f"0 @{gedcom.prefijo_local()}{a_mano.id}@ INDI", exportado)
+            resumen = self.importar(exportado)
+            self.assertEqual(resumen['personas'], antes[0])
+            self.assertEqual(resumen['relaciones_nuevas'], 0)
+            self.assertEqual(self.contar(), antes)
+        self.assertEqual(Familiar.objects.get(id=a_mano.id).fecha_nacimiento, date(1950, 7, 1))
+        self.assertEqual(Familiar.objects.get(gedcom_xref='I2').biografia, "Nació en Rosario.\nSe mudó a Córdoba.")
+
+    def test_un_xref_ajeno_no_pisa_a_un_familiar_cargado_a_mano(self):
+        a_mano = Familiar.objects.create(nombre='Luis')
+        self.importar(f"0 HEAD\n0 @GR{a_mano.id}@ INDI\n1 NAME Otro /Programa/\n0 TRLR\n")
+        self.assertEqual(Familiar.objects.get(id=a_mano.id).nombre, 'Luis')
+        self.assertEqual(Familiar.objects.count(), 2)
+
+    def test_el_prefijo_local_no_cambia_al_rotar_la_secret_key(self):
+        prefijo = gedcom.prefijo_local()
+        self.assertRegex(prefijo, r'^GR[0-9A-F]{6}_$')
+        gedcom.prefijo_local.cache_clear()
+        with self.settings(SECRET_KEY='otra-clave'):
+            self.assertEqual(gedcom.prefijo_local(), prefijo)
+            familiar = Familiar.objects.create(nombre='Ana')
+        self.assertEqual(Familiar.objects.get(id=familiar.id).gedcom_xref, f"{prefijo}{familiar.id}")
+        self.assertEqual(Configuracion.objects.get(clave=gedcom.CLAVE_PREFIJO).valor, prefijo)
+
+
+def _jpeg_con_exif():
+    """Un JPEG chico con fecha, cámara, orientación y GPS (Buenos Aires) en el EXIF."""
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[0x010F], exif[0x0110], exif[0x0112] = 'Canon', 'Canon EOS 40D', 6
+    exif.get_ifd(0x8769)[0x9003] = '2019:07:14 18:03:22'
+    gps = exif.get_ifd(0x8825)
+    gps[1], gps[2], gps[3], gps[4] = 'S', (34.0, 36.0, 0.0), 'W', (58.0, 22.0, 48.0)
+    gps[5], gps[6] = b'\x00', 25.0
+    salida = io.BytesIO()
+    Image.new('RGB', (32, 24)).save(salida, 'JPEG', exif=exif)
+    return salida.getvalue()
+
+
+class MetadatosTests(SimpleTestCase):
+
+    def test_encuentra_el_bloque_exif_y_lo_lee(self):
+        bloque, faltan = metadatos.segmento_exif(_jpeg_con_exif())
+        self.assertEqual((bloque[:6], faltan), (b'Exif\x00\x00', 0))
+        leido = metadatos.leer_exif(bloque)
+        self.assertEqual(leido['fecha_captura'].replace(tzinfo=None), datetime(2019, 7, 14, 18, 3, 22))
+        self.assertEqual((leido['camara'], leido['orientacion']), ('Canon EOS 40D', 6))
+        self.assertAlmostEqual(leido['latitud'], -34.6)
+        self.assertAlmostEqual(leido['longitud'], -58.38)
+        self.assertEqual(leido['altitud'], 25.0)
+
+    def test_con_la_cabecera_corta_dice_cuanto_mas_bajar(self):
+        datos = _jpeg_con_exif()
+        bloque, faltan = metadatos.segmento_exif(datos[:30])
+        self.assertIsNone(bloque)
+        self.assertGreater(faltan, 30)
+        self.assertEqual(metadatos.segmento_exif(datos[:faltan])[0], metadatos.segmento_exif(datos)[0])
+
+    def test_sin_exif(self):
+        from PIL import Image
+
+        salida = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(salida, 'JPEG')
+        self.assertEqual(metadatos.segmento_exif(salida.getvalue()), (None, 0))
+        self.assertEqual(metadatos.segmento_exif(b'\x89PNG\r\n\x1a\n'), (None, 0))
+        self.assertIsNone(metadatos.leer_exif(b'basura'))
+
+
+class ClaveFoneticaTests(SimpleTestCase):
+
+    def test_variantes_de_un_mismo_apellido_dan_la_misma_clave(self):
+        grupos = [
+            ('Gonzalez', 'González', 'Gonsales', 'GONZÁLES'),
+            ('Vázquez', 'Basques', 'Vasquez'),
+            ('Hernández', 'Ernandez'),
+            ('Chávez', 'Chaves'),
+            ('Quiroga', 'Kiroga'),
+            ('Rey', 'Rei'),
+        ]
+        for variantes in grupos:
+            self.assertEqual({clave_fonetica(v) for v in variantes}, {clave_fonetica(variantes[0])}, variantes)
+
+    def test_apellidos_distintos_dan_claves_distintas(self):
+        self.assertNotEqual(clave_fonetica('Pérez'), clave_fonetica('Peralta'))
+        self.assertNotEqual(clave_fonetica('Chávez'), clave_fonetica('Cabezas'))
+        self.assertNotEqual(clave_fonetica('Núñez'), clave_fonetica('Nunez'))   # la ñ cuenta
+
+    def test_largo_y_textos_vacios(self):
+        self.assertEqual(clave_fonetica('Gonzalez'), 'GNSLS')
+        self.assertEqual(clave_fonetica('Gonzalez', largo=3), 'GNS')
+        self.assertEqual(clave_fonetica(''), '')
+        self.assertEqual(clave_fonetica('123'), '')
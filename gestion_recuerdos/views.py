@@ -1,22 +1,46 @@
 import os
-import io
 import json
-import numpy as np
-import cv2
-import shutil
-from django.shortcuts import redirect, render
-from django.http import HttpResponse
+from urllib.parse import urlencode
+from django.shortcuts import get_object_or_404, redirect, render
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.urls import reverse
-from django.views.decorators.csrf import csrf_exempt
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+from django.middleware.csrf import get_token
  # RostroFamiliar es la tabla que guarda la unión
-from .models import Familiar, RostroDetectado
+from .models import Familiar, RostroDetectado, TrabajoLote, DriveArchivo, EstadoSincronizacion, PosibleDuplicado, GrupoRostros, MetadatosFoto
+from .temporales import borrar_analisis, crear_analisis, nombre_recorte, ruta_recorte, url_recorte
+from .arbol import nombre_parentesco, obtener_arbol
+from .gedcom import exportar_gedcom
+from .busqueda import buscar_familiares, fragmento_html, sugerir_nombres
+from .almacenamiento import liberar_archivos
+from . import credenciales
+from .metricas import etapa, metricas, puede_ver_metricas
+from .acceso import sesion_iniciada, token_api_valido
+from .carga_perezosa import modulo_perezoso
+
+# Lo pesado (OpenCV, numpy, los clientes de Google y httpx) se importa en la primera vista que lo usa,
+# no al cargar core/urls.py: así manage.py, las migraciones y la galería no lo pagan (ver carga_perezosa.py).
+detecciones = modulo_perezoso('gestion_recuerdos.detecciones')
+cache_descargas = modulo_perezoso('gestion_recuerdos.cache_descargas')
+indice_rostros = modulo_perezoso('gestion_recuerdos.indice_rostros')
+reconocimiento = modulo_perezoso('gestion_recuerdos.reconocimiento')
+sincronizacion = modulo_perezoso('gestion_recuerdos.sincronizacion')
+drive = modulo_perezoso('gestion_recuerdos.drive')
+drive_async = modulo_perezoso('gestion_recuerdos.drive_async')
+reorganizar = modulo_perezoso('gestion_recuerdos.reorganizar')
+ingesta = modulo_perezoso('gestion_recuerdos.ingesta')
+huellas = modulo_perezoso('gestion_recuerdos.huellas')
+duplicados_familiares = modulo_perezoso('gestion_recuerdos.duplicados_familiares')
+agrupamiento = modulo_perezoso('gestion_recuerdos.agrupamiento')
+metadatos = modulo_perezoso('gestion_recuerdos.metadatos')
+drive_falso = modulo_perezoso('gestion_recuerdos.drive_falso')
 
 # Librerías de Google
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from google.oauth2.credentials import Credentials
+oauth = modulo_perezoso('google_auth_oauthlib.flow')
 
 
 # --- CONFIGURACIÓN ---
@@ -24,15 +48,19 @@ os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
 def login_google(request):
+    if settings.DRIVE_FALSO:
+        # Drive de mentira (drive_falso.py): no hay Google al que pedirle permiso.
+        request.session['credentials'] = dict(drive_falso.CREDENCIALES)
+        return redirect('home')
     ruta_json = os.path.join(settings.BASE_DIR, 'client_secrets.json')
-    flow = Flow.from_client_secrets_file(ruta_json, scopes=SCOPES, redirect_uri='http://127.0.0.1:8000/google/callback/')
+    flow = oauth.Flow.from_client_secrets_file(ruta_json, scopes=SCOPES, redirect_uri='http://127.0.0.1:8000/google/callback/')
     auth_url, state = flow.authorization_url(prompt='consent')
     request.session['oauth_state'] = state
     return redirect(auth_url)
 
 def google_callback(request):
     ruta_json = os.path.join(settings.BASE_DIR, 'client_secrets.json')
-    flow = Flow.from_client_secrets_file(ruta_json, scopes=SCOPES, redirect_uri='http://127.0.0.1:8000/google/callback/')
+    flow = oauth.Flow.from_client_secrets_file(ruta_json, scopes=SCOPES, redirect_uri='http://127.0.0.1:8000/google/callback/')
     flow.fetch_token(authorization_response=request.build_absolute_uri())
     credentials = flow.credentials
     request.session['credentials'] = {
@@ -41,232 +69,957 @@ def google_callback(request):
         'token_uri': credentials.token_uri,
         'client_id': credentials.client_id,
         'client_secret': credentials.client_secret,
-        'scopes': credentials.scopes
+        'scopes': credentials.scopes,
+        'expiry': credenciales.a_texto(credentials.expiry),
     }
     return redirect('home')
 
 def configurar_entorno_drive(request):
+    """
+    Mueve las fotos sueltas de la raíz de Drive a 'Genealogia'.
+    El trabajo corre en segundo plano (en lotes de 100 movimientos por petición a Drive);
+    la página de progreso se actualiza sola hasta que termina.
+    """
     try:
         creds_data = request.session.get('credentials')
         if not creds_data: return redirect('login_google')
-        creds = Credentials(**creds_data)
-        service = build('drive', 'v3', credentials=creds)
-
-        query_folder = "name = 'Genealogia' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-        folders = service.files().list(q=query_folder, fields="files(id)").execute().get('files', [])
-
-        if not folders:
-            folder_metadata = {'name': 'Genealogia', 'mimeType': 'application/vnd.google-apps.folder'}
-            folder = service.files().create(body=folder_metadata, fields='id').execute()
-            folder_id = folder.get('id')
-        else:
-            folder_id = folders[0].get('id')
-
-        query_fotos = "mimeType contains 'image/' and 'root' in parents and trashed = false"
-        fotos = service.files().list(q=query_fotos, fields="files(id, parents)").execute().get('files', [])
-
-        for foto in fotos:
-            service.files().update(
-                fileId=foto['id'],
-                addParents=folder_id,
-                removeParents=",".join(foto.get('parents')),
-                fields='id, parents'
-            ).execute()
-        return redirect('ver_fotos')
+        trabajo = reorganizar.organizar_en_segundo_plano(creds_data)
+        return redirect('ver_trabajo', trabajo_id=trabajo.id)
     except Exception as e:
-        return HttpResponse(f"Error al organizar: {str(e)}")
+        return HttpResponse(f"Error al organizar: {escape(str(e))}")
 #-------------------------------------------------------------------------------------------------
-def obtener_fotos_recursivo(service, folder_id):
+def listar_fotos(request):
     """
-    Función de apoyo: Busca fotos y entra en subcarpetas.
+    Lee las fotos desde la tabla local DriveArchivo (una sola consulta a la BD).
+    Sólo la primera vez, cuando todavía no hay nada sincronizado, recorre Drive completo.
+    Las copias casi iguales aparecen agrupadas bajo la principal (los grupos los guarda calcular_huellas).
     """
-    fotos_encontradas = []
-    
-    # Buscamos tanto carpetas como imágenes dentro del ID actual
-    query = f"'{folder_id}' in parents and trashed = false"
-    results = service.files().list(
-        q=query, 
-        fields="files(id, name, mimeType)"
-    ).execute().get('files', [])
-
-    for item in results:
-        if item['mimeType'] == 'application/vnd.google-apps.folder':
-            # Si es carpeta, entramos en ella (Recursividad)
-            fotos_encontradas.extend(obtener_fotos_recursivo(service, item['id']))
-        elif 'image/' in item['mimeType']:
-            # Si es foto, la agregamos a la lista
-            fotos_encontradas.append(item)
-            
-    return fotos_encontradas
-
-def listar_fotos(request):
     creds_data = request.session.get('credentials')
     if not creds_data: return redirect('login_google')
-    creds = Credentials(**creds_data)
-    service = build('drive', 'v3', credentials=creds)
 
-    # Buscamos la carpeta raíz 'Genealogia'
-    query_f = "name = 'Genealogia' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-    folders = service.files().list(q=query_f, fields="files(id)").execute().get('files', [])
+    estado = EstadoSincronizacion.objects.filter(clave='drive').first()
+    if estado is None:
+        service = drive.crear_servicio(creds_data)
+        estado = sincronizacion.rastreo_completo(service)
 
     html = "<h1>Panel de Genealogía</h1>"
-    if folders:
-        folder_id = folders[0].get('id')
-        
-        # LLAMADA RECURSIVA: Aquí es donde sucede la magia
-        items = obtener_fotos_recursivo(service, folder_id)
-        
-        html += f"<p>Escaneo completo. {len(items)} fotos encontradas en todas las subcarpetas.</p><ul>"
-        for f in items:
-            url = reverse('analizar_rostros', args=[f['id']])
-            html += f'<li><a href="{url}">{f["name"]}</a></li>'
+    if estado:
+        items = list(
+            DriveArchivo.objects.filter(mime_type__startswith='image/')
+            .order_by('nombre').values_list('drive_id', 'nombre', 'copia_de')
+        )
+        nombres = {drive_id: nombre for drive_id, nombre, _ in items}
+
+        # Las copias de una misma foto (huella perceptual casi igual) se muestran juntas.
+        # Los grupos los guarda calcular_huellas; si la principal ya no está, la copia va suelta.
+        grupos = {}
+        for drive_id, _, principal in items:
+            if principal and principal in nombres:
+                grupos.setdefault(principal, []).append(drive_id)
+        copias = {copia for duplicadas in grupos.values() for copia in duplicadas}
+
+        html += f"<p>{len(items)} fotos en todas las subcarpetas"
+        if copias:
+            html += f" ({len(copias)} son copias de otras)"
+        html += f". <a href='{reverse('sincronizar_drive')}'>🔄 Sincronizar cambios</a></p><ul>"
+        for drive_id, nombre, _ in items:
+            if drive_id in copias:
+                continue
+            url = reverse('analizar_en_vivo', args=[drive_id])
+            html += f'<li><a href="{url}">{nombre}</a>'
+            if drive_id in grupos:
+                enlaces = ", ".join(
+                    f"<a href='{reverse('analizar_en_vivo', args=[copia])}'>{nombres.get(copia, copia)}</a>"
+                    for copia in grupos[drive_id]
+                )
+                html += f" <small style='color:#666;'>— {len(grupos[drive_id])} copia(s): {enlaces}</small>"
+            html += "</li>"
         html += "</ul>"
     else:
         html += f'<a href="{reverse("organizar_drive")}" style="background:green; color:white; padding:10px;">Organizar Drive Ahora</a>'
     html += f"<br><a href='{reverse('home')}' style='margin:20px; display:inline-block;'>⬅️ Volver al Menú</a>"
     return HttpResponse(html)
 
+async def sincronizar_drive(request):
+    """
+    Vista async: pide a Drive sólo los cambios desde la última sincronización y vuelve al panel.
+    Si hay que recorrer carpetas nuevas, las consultas de cada nivel salen en paralelo.
+    """
+    creds_data = await request.session.aget('credentials')
+    if not creds_data: return redirect('login_google')
+    cliente = drive_async.ClienteDriveAsync(creds_data)
+    await sincronizacion.sincronizar_async(cliente)
+    # Si el token se refrescó durante la sincronización, CredencialesMiddleware lo guarda en la sesión
+    return redirect('ver_fotos')
+
 
 #---------------------------------------------------------------------------------------------------
 # -----------------------------Importa tu modelo al principio del archivo views.py
 
 from .models import Familiar 
+
+# Autocompletado de los campos "¿Quién es?": pide a la API sólo los nombres que coinciden con lo
+# escrito y guarda el id elegido (lo que va después del '#') en el campo oculto familiar_<i>.
+SCRIPT_BUSCAR_FAMILIAR = """
+<script>
+// Delegado en document: también sirve para los campos que se agregan después (análisis en vivo).
+document.addEventListener('input', function (evento) {
+    var campo = evento.target;
+    if (!campo.classList || !campo.classList.contains('buscar-familiar')) return;
+    var elegido = campo.value.match(/#(\\d+)$/);
+    campo.form.elements[campo.dataset.destino].value = elegido ? elegido[1] : '';
+    clearTimeout(campo.espera);
+    if (elegido || campo.value.trim().length < 2) return;
+    campo.espera = setTimeout(function () {
+        fetch('__URL__?q=' + encodeURIComponent(campo.value))
+            .then(function (respuesta) { return respuesta.json(); })
+            .then(function (datos) {
+                var lista = document.getElementById(campo.getAttribute('list'));
+                lista.innerHTML = '';
+                datos.resultados.forEach(function (familiar) {
+                    var opcion = document.createElement('option');
+                    opcion.value = familiar.nombre + ' #' + familiar.id;
+                    lista.appendChild(opcion);
+                });
+            });
+    }, 150);
+});
+</script>
+"""
+
 def analizar_rostros_drive(request, file_id):
     """
     Línea por línea:
-    1. Limpia y prepara la carpeta temporal para los nuevos recortes.
-    2. Descarga la imagen original desde Google Drive.
-    3. La IA detecta las coordenadas de los rostros.
-    4. CONSULTA: Trae la lista de todos los familiares de tu base de datos (Luis, Paola, Valery).
-    5. HTML: Genera un formulario para cada rostro detectado que permite elegir quién es.
+    1. Crea una carpeta temporal propia de este análisis (no se mezcla con otras pestañas/usuarios).
+    2. Descarga la imagen original desde Google Drive (o la lee de la caché en disco).
+    3. La IA detecta las coordenadas de los rostros (o reutiliza la detección guardada).
+    4. CONSULTA: Trae sólo los nombres de los familiares sugeridos para estas caras.
+    5. HTML: Genera un formulario para cada rostro detectado; quién es se elige escribiendo (autocompletado).
     """
-    import os, cv2, numpy as np, io, shutil
-    carpeta_temp = os.path.join(settings.MEDIA_ROOT, 'temp_caras')
-    if os.path.exists(carpeta_temp): shutil.rmtree(carpeta_temp)
-    os.makedirs(carpeta_temp, exist_ok=True)
+    import cv2, shutil
+    analisis_id = crear_analisis()
 
     try:
         # --- Lógica de Google Drive ---
         creds_data = request.session.get('credentials')
-        creds = Credentials(**creds_data)
-        service = build('drive', 'v3', credentials=creds)
-        request_download = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request_download)
-        done = False
-        while not done: _, done = downloader.next_chunk()
-
+        service = drive.crear_servicio(creds_data)
         # --- Lógica de IA ---
-        img_array = np.frombuffer(fh.getvalue(), np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        gris = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        caras = face_cascade.detectMultiScale(gris, 1.1, 4)
+        # Si esta foto ya se analizó (mismo md5 y mismo detector) no se baja ni se detecta de nuevo
+        deteccion = detecciones.analizar_con_cache(service, file_id)
 
         # --- Lógica de Base de Datos ---
-        # Obtenemos los familiares que registraste antes para el menú desplegable
-        familiares = Familiar.objects.all() 
-
-        html = "<h2>Resultados del Análisis</h2>"
-        html += "<form method='POST' action='/guardar-rostro/'>"
-        html += "{% csrf_token %}" # Seguridad de Django
-        html += "<div style='display:flex; flex-wrap:wrap; gap:20px;'>"
-
-        for i, (x, y, w, h) in enumerate(caras):
-            nombre_cara = f"cara_{i}.jpg"
-            cv2.imwrite(os.path.join(carpeta_temp, nombre_cara), img[y:y+h, x:x+w])
-            url_web = f"{settings.MEDIA_URL}temp_caras/{nombre_cara}"
-            
-            html += f"""
-                <div style='text-align:center; border:1px solid #ddd; padding:10px; border-radius:10px;'>
-                    <img src='{url_web}' style='width:150px; border-radius:5px;'>
-                    <br><br>
-                    <label>¿Quién es?</label><br>
-                    <select name='familiar_{i}' style='margin-bottom:10px;'>
-                        <option value=''>--- Seleccionar ---</option>
-                        {"".join([f"<option value='{f.id}'>{f.nombre}</option>" for f in familiares])}
-                      
-                    </select>
-                </div>
-            """
-
-        html += "</div><br><button type='submit' style='padding:10px 20px; background:green; color:white; border:none; border-radius:5px;'>Guardar todos en la BD</button></form>"
-        html += "<br><a href='/ver-fotos/'>Volver sin guardar</a>"
-
-        # Nota: Como estamos usando HttpResponse directo, el {% csrf_token %} no funcionará 
-        # sin un template. Por ahora, para probar, usaremos una versión simplificada.
-        return HttpResponse(html.replace("{% csrf_token %}", ""))
+        # Ya no se traen TODOS los familiares: cada cara ofrece sólo los sugeridos por el índice
+        # de embeddings y el resto se busca escribiendo (autocompletado contra /api/familiares/buscar/).
+        indice = indice_rostros.obtener_indice()
+        caras = []
+        with etapa('embeddings'):
+            for i, (caja, ruta_guardada) in enumerate(zip(deteccion.cajas, deteccion.rutas_recortes())):
+                nombre_cara = nombre_recorte(i)
+                ruta_temp = ruta_recorte(analisis_id, nombre_cara)
+                shutil.copyfile(os.path.join(settings.MEDIA_ROOT, ruta_guardada), ruta_temp)
+                recorte = cv2.imread(ruta_temp)
+                caras.append((i, caja, nombre_cara, indice.sugerir(reconocimiento.calcular_embedding(recorte))))
+            sugeridos = {familiar_id for *_, sugerencias in caras for familiar_id, _ in sugerencias}
+            nombres = {f.id: str(f).strip() for f in Familiar.objects.filter(id__in=sugeridos).only('nombre', 'apellido')}
+
+        with etapa('html'):
+            html = "<h2>Resultados del Análisis</h2>"
+            html += "<form method='POST' action='/guardar-rostro/'>"
+            html += f"<input type='hidden' name='csrfmiddlewaretoken' value='{get_token(request)}'>"
+            html += f"<input type='hidden' name='analisis' value='{analisis_id}'>"
+            html += f"<input type='hidden' name='foto' value='{escape(file_id)}'>"
+            html += "<div style='display:flex; flex-wrap:wrap; gap:20px;'>"
+
+            for i, caja, nombre_cara, sugerencias in caras:
+                url_web = url_recorte(analisis_id, nombre_cara)
+                sugerido = sugerencias[0][0] if sugerencias else None
+                opciones = "".join(
+                    f"<option value='{escape(nombres[familiar_id])} #{familiar_id}'>"
+                    for familiar_id, _ in sugerencias if familiar_id in nombres
+                )
+
+                html += f"""
+                    <div style='text-align:center; border:1px solid #ddd; padding:10px; border-radius:10px;'>
+                        <img src='{url_web}' style='width:150px; border-radius:5px;'>
+                        <br><br>
+                        <input type='hidden' name='archivo_{i}' value='{nombre_cara}'>
+                        <input type='hidden' name='caja_{i}' value='{",".join(str(v) for v in caja)}'>
+                        <label>¿Quién es?</label><br>
+                        <input type='hidden' name='familiar_{i}' value='{sugerido or ""}'>
+                        <input type='text' class='buscar-familiar' list='familiares_{i}' data-destino='familiar_{i}'
+                               value='{f"{escape(nombres[sugerido])} #{sugerido}" if sugerido in nombres else ""}'
+                               placeholder='Escribí un nombre...' autocomplete='off' style='margin-bottom:10px;'>
+                        <datalist id='familiares_{i}'>{opciones}</datalist>
+                    </div>
+                """
+
+            html += "</div><br><button type='submit' style='padding:10px 20px; background:green; color:white; border:none; border-radius:5px;'>Guardar todos en la BD</button></form>"
+            html += "<br><a href='/ver-fotos/'>Volver sin guardar</a>"
+            html += SCRIPT_BUSCAR_FAMILIAR.replace('__URL__', reverse('api_buscar_familiares'))
+
+        return HttpResponse(html)
 
     except Exception as e:
-        return HttpResponse(f"Error: {str(e)}")
+        return HttpResponse(f"Error: {escape(str(e))}")
     
+#-----------------------------------------------------------------------------------------------------
+SCRIPT_ANALISIS_EN_VIVO = """
+<script>
+(function () {
+    var caras = document.getElementById('caras'), estado = document.getElementById('estado');
+    var boton = document.getElementById('guardar');
+    var fuente = new EventSource('__EVENTOS__');
+    function elemento(etiqueta, atributos) {
+        var nodo = document.createElement(etiqueta);
+        Object.keys(atributos).forEach(function (clave) { nodo.setAttribute(clave, atributos[clave]); });
+        return nodo;
+    }
+    fuente.addEventListener('estado', function (evento) {
+        estado.textContent = JSON.parse(evento.data).mensaje;
+    });
+    fuente.addEventListener('cara', function (evento) {
+        var cara = JSON.parse(evento.data), i = cara.i, sugerido = cara.sugerencias[0];
+        var tarjeta = elemento('div', {style: 'text-align:center; border:1px solid #ddd; padding:10px; border-radius:10px;'});
+        tarjeta.appendChild(elemento('img', {src: cara.url, style: 'width:150px; border-radius:5px;'}));
+        tarjeta.appendChild(document.createElement('br'));
+        tarjeta.appendChild(elemento('input', {type: 'hidden', name: 'archivo_' + i, value: cara.archivo}));
+        tarjeta.appendChild(elemento('input', {type: 'hidden', name: 'caja_' + i, value: cara.caja.join(',')}));
+        tarjeta.appendChild(elemento('input', {type: 'hidden', name: 'familiar_' + i, value: sugerido ? sugerido.id : ''}));
+        var campo = elemento('input', {
+            type: 'text', 'class': 'buscar-familiar', list: 'familiares_' + i, 'data-destino': 'familiar_' + i,
+            placeholder: 'Escribí un nombre...', autocomplete: 'off'
+        });
+        campo.value = sugerido ? sugerido.nombre + ' #' + sugerido.id : '';
+        var lista = elemento('datalist', {id: 'familiares_' + i});
+        cara.sugerencias.forEach(function (familiar) {
+            lista.appendChild(elemento('option', {value: familiar.nombre + ' #' + familiar.id}));
+        });
+        tarjeta.appendChild(campo);
+        tarjeta.appendChild(lista);
+        caras.appendChild(tarjeta);
+    });
+    function terminar(mensaje) {
+        fuente.close();   // si no, EventSource se reconecta y el análisis empezaría de nuevo
+        estado.textContent = mensaje;
+        boton.disabled = false;
+    }
+    fuente.addEventListener('fin', function (evento) {
+        var total = JSON.parse(evento.data).total;
+        terminar(total ? total + ' caras. Elegí quién es cada una y guardá.' : 'No se encontraron caras en esta foto.');
+    });
+    fuente.addEventListener('fallo', function (evento) { terminar('Error: ' + JSON.parse(evento.data).mensaje); });
+    fuente.onerror = function () { if (fuente.readyState !== EventSource.CLOSED) terminar('Se cortó la conexión.'); };
+})();
+</script>
+"""
+
+def analizar_en_vivo(request, file_id):
+    """
+    Igual que analizar_rostros_drive, pero la página sale al instante y las caras llegan por
+    Server-Sent Events (eventos_analisis) en vez de esperar a que termine todo.
+    Lo progresivo es el reconocimiento: la detección devuelve todas las cajas juntas (ver eventos_analisis).
+    Línea por línea:
+    1. Crea la carpeta temporal del análisis y devuelve el formulario vacío con el script.
+    2. El script abre /analizar/<foto>/eventos/<análisis>/ y agrega una tarjeta por cada evento 'cara'.
+    3. El botón de guardar se habilita al terminar; guarda igual que antes (guardar_rostro).
+    """
+    analisis_id = crear_analisis()
+    eventos = reverse('eventos_analisis', args=[file_id, analisis_id])
+    html = "<h2>Resultados del Análisis</h2><p id='estado'>Preparando...</p>"
+    html += f"<noscript><a href='{reverse('analizar_rostros', args=[file_id])}'>Ver el análisis sin JavaScript</a></noscript>"
+    html += f"<form method='POST' action='{reverse('guardar_rostro')}'>"
+    html += f"<input type='hidden' name='csrfmiddlewaretoken' value='{get_token(request)}'>"
+    html += f"<input type='hidden' name='analisis' value='{analisis_id}'>"
+    html += f"<input type='hidden' name='foto' value='{escape(file_id)}'>"
+    html += "<div id='caras' style='display:flex; flex-wrap:wrap; gap:20px;'></div>"
+    html += "<br><button id='guardar' type='submit' disabled style='padding:10px 20px; background:green; color:white; border:none; border-radius:5px;'>Guardar todos en la BD</button></form>"
+    html += f"<br><a href='{reverse('ver_fotos')}'>Volver sin guardar</a>"
+    html += SCRIPT_BUSCAR_FAMILIAR.replace('__URL__', reverse('api_buscar_familiares'))
+    html += SCRIPT_ANALISIS_EN_VIVO.replace('__EVENTOS__', eventos)
+    return HttpResponse(html)
+
+def _evento(tipo, datos):
+    return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+def eventos_analisis(request, file_id, analisis_id):
+    """
+    Flujo text/event-stream del análisis en vivo: 'estado' mientras baja y detecta, una 'cara' por
+    rostro (recorte, caja y familiares sugeridos con su nombre) apenas se calcula su embedding,
+    y 'fin' (o 'fallo') al terminar. Los nombres se consultan sólo para los sugeridos que aún no se mandaron.
+    Qué es progresivo y qué no:
+    - La descarga y la detección (analizar_con_cache) no: devuelven todas las cajas de una vez, porque
+      las candidatas se refinan y se depuran de repetidas al final. Mientras tanto sólo sale 'estado'.
+    - El reconocimiento sí: cada cara sale apenas tiene su embedding y sus sugerencias.
+    El generador es sincrónico a propósito: con WSGI, Django juntaría en memoria un generador async
+    antes de mandarlo. A cambio, cada análisis en vivo ocupa un hilo del worker mientras dura.
+    """
+    try:
+        ruta_recorte(analisis_id, nombre_recorte(0))
+    except ValueError:
+        return HttpResponse("Análisis inválido", status=400)
+    creds_data = request.session.get('credentials')
+
+    def eventos():
+        import cv2, shutil
+        yield ":" + " " * 2048 + "\n\n"   # relleno: algunos proxies retienen los primeros KB
+        try:
+            yield _evento('estado', {'mensaje': "Descargando la foto y buscando caras (aparecen todas juntas al terminar)..."})
+            service = drive.crear_servicio(creds_data)
+            deteccion = detecciones.analizar_con_cache(service, file_id)
+            total = len(deteccion.cajas)
+            yield _evento('estado', {'mensaje': f"{total} caras encontradas, reconociendo..."})
+
+            indice = indice_rostros.obtener_indice()
+            nombres = {}
+            for i, (caja, ruta_guardada) in enumerate(zip(deteccion.cajas, deteccion.rutas_recortes())):
+                nombre_cara = nombre_recorte(i)
+                ruta_temp = ruta_recorte(analisis_id, nombre_cara)
+                with etapa('embeddings'):
+                    shutil.copyfile(os.path.join(settings.MEDIA_ROOT, ruta_guardada), ruta_temp)
+                    sugerencias = indice.sugerir(reconocimiento.calcular_embedding(cv2.imread(ruta_temp)))
+                faltan = {familiar_id for familiar_id, _ in sugerencias} - set(nombres)
+                if faltan:
+                    nombres.update((f.id, str(f).strip()) for f in Familiar.objects.filter(id__in=faltan).only('nombre', 'apellido'))
+                yield _evento('cara', {
+                    'i': i, 'archivo': nombre_cara, 'url': url_recorte(analisis_id, nombre_cara),
+                    'caja': [int(v) for v in caja],
+                    'sugerencias': [
+                        {'id': familiar_id, 'nombre': nombres[familiar_id], 'puntaje': round(float(puntaje), 3)}
+                        for familiar_id, puntaje in sugerencias if familiar_id in nombres
+                    ],
+                })
+            yield _evento('fin', {'total': total})
+        except Exception as e:
+            yield _evento('fallo', {'mensaje': str(e)})
+
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'   # nginx: mandar cada evento apenas se escribe
+    return response
+
  #-----------------------------------------------------------------------------------------------------   
 def detectar_rostro_prueba(request):
     return HttpResponse("IA operativa")
 
-@csrf_exempt # <--- Esto le dice a Django: "No pidas sello de seguridad aquí"
 #---------------------------------------------------------------------------------------------------------
 def guardar_rostro(request):
+    """
+    Sólo con la sesión iniciada y el token CSRF del formulario (cambia a quién pertenece cada cara).
+    Línea por línea:
+    1. Junta en una lista todas las caras a las que se les eligió un familiar.
+    2. Las guarda de una vez (una consulta para los familiares, un bulk_create para los rostros),
+       con el id real de la foto de Drive y la caja de cada cara.
+    3. Si todo se guardó, borra la carpeta temporal de ESTE análisis (lo que no se eligió ya no sirve).
+       Si alguna cara falló, lo dice y conserva la carpeta para poder volver y reintentar.
+    """
+    if not sesion_iniciada(request): return redirect('login_google')
     if request.method == 'POST':
-        # Ruta permanente según tu modelo: media/rostros_permanentes/
-        ruta_permanente = os.path.join(settings.MEDIA_ROOT, 'rostros_permanentes')
-        os.makedirs(ruta_permanente, exist_ok=True)
+        # Cada análisis tiene su propia carpeta temporal; los nombres vienen del formulario
+        analisis_id = request.POST.get('analisis', '')
 
+        items, caras = [], []
         for key, value in request.POST.items():
             if key.startswith('familiar_') and value:
                 indice = key.split('_')[1]
-                nombre_archivo_temp = f"cara_{indice}.jpg"
-                ruta_temp = os.path.join(settings.MEDIA_ROOT, 'temp_caras', nombre_archivo_temp)
-                
-                if os.path.exists(ruta_temp):
-                    familiar = Familiar.objects.get(id=value)
-                    nombre_final = f"{familiar.nombre}_{nombre_archivo_temp}"
-                    
-                    # Guardamos el registro en la base de datos usando RostroDetectado
-                    nuevo_rostro = RostroDetectado.objects.create(
-                        familiar=familiar,
-                        foto_recorte=f"rostros_permanentes/{nombre_final}",
-                        drive_file_id="ID_DESCONOCIDO" # Aquí podrías pasar el file_id real
-                    )
-                    
-                    # Movemos el archivo físico
-                    ruta_final = os.path.join(ruta_permanente, nombre_final)
-                    shutil.move(ruta_temp, ruta_final)
-
-        return HttpResponse("<h2>¡Guardado con éxito!</h2><a href='/ver-fotos/'>Volver</a>")
+                caras.append(int(indice) + 1 if indice.isdigit() else indice)   # como se ve en la página
+                items.append({
+                    'analisis': analisis_id,
+                    'archivo': request.POST.get(f'archivo_{indice}', ''),
+                    'familiar': value,
+                    'drive_file_id': request.POST.get('foto', ''),
+                    'caja': request.POST.get(f'caja_{indice}', ''),
+                })
+        try:
+            creados, errores = ingesta.guardar_rostros_etiquetados(items)
+        except ValueError as e:
+            return HttpResponse(f"<h2>No se guardó nada</h2><p>{escape(e)}</p>", status=400)
+
+        if errores:
+            html = f"<h2>Se guardaron {len(creados)} de {len(items)} caras</h2><ul>"
+            html += "".join(f"<li>Cara {escape(caras[posicion])}: {escape(mensaje)}</li>" for posicion, mensaje in errores)
+            html += "</ul><a href='javascript:history.back()'>⬅️ Volver y corregir</a> · <a href='/ver-fotos/'>Ir a las fotos</a>"
+            return HttpResponse(html)
+
+        # Lo que no se guardó ya no sirve: se borra sólo la carpeta de ESTE análisis
+        borrar_analisis(analisis_id)
+        return HttpResponse(f"<h2>¡Guardado con éxito! ({len(creados)} caras)</h2><a href='/ver-fotos/'>Volver</a>")
+
+def api_guardar_rostros(request):
+    """
+    Versión JSON de guardar_rostro para herramientas que etiquetan muchas caras por llamada.
+    Recibe {"rostros": [{"analisis", "archivo", "familiar", "drive_file_id", "caja": [x, y, ancho, alto]}, ...]}
+    y devuelve los ids creados y los items que no se pudieron guardar.
+    Pide "Authorization: Bearer <ROSTROS_API_TOKEN>" o la sesión iniciada con el token CSRF (ver acceso.py).
+    """
+    if not (token_api_valido(request) or sesion_iniciada(request)):
+        return JsonResponse({'error': 'No autorizado'}, status=401)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Usa POST'}, status=405)
+    try:
+        items = json.loads(request.body)['rostros']
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise TypeError
+        creados, errores = ingesta.guardar_rostros_etiquetados(items)
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'error': str(e) or 'JSON inválido'}, status=400)
+    return JsonResponse({
+        'guardados': len(creados),
+        'ids': [rostro.id for rostro in creados],
+        'errores': [{'posicion': posicion, 'error': mensaje} for posicion, mensaje in errores],
+    }, status=201 if creados else 200)
 #-------------------------------------------------------------------------------------------------   
 def galeria_familiar(request):
-    rostros = RostroDetectado.objects.all().order_by('familiar')
-    # Añadimos 'MEDIA_URL' al diccionario para que el HTML lo reconozca
+    """
+    Línea por línea:
+    1. Filtra por familiar (?familiar=<id> o ?familiar=ninguno) y por foto de Drive (?foto=<id>).
+       El familiar se elige con el autocompletado: la página no lista a todos los familiares.
+    2. Trae el familiar en la misma consulta (select_related): nada de una consulta por rostro.
+    3. Pagina por "cursor" (?despues=<fecha>_<id>) en vez de OFFSET: la página 800 cuesta
+       lo mismo que la primera porque usa el índice (-fecha_creacion, -id).
+    4. Pide un rostro de más para saber si hay página siguiente sin hacer un COUNT.
+    """
+    por_pagina = settings.GALERIA_POR_PAGINA
+    rostros = RostroDetectado.objects.select_related('familiar').only(
+        'id', 'foto_recorte', 'miniatura', 'drive_file_id', 'fecha_creacion', 'familiar', 'familiar__nombre',
+    )
+
+    familiar = request.GET.get('familiar', '')
+    familiar_texto = ''
+    if familiar == 'ninguno':
+        rostros = rostros.filter(familiar__isnull=True)
+        familiar_texto = 'Sin identificar'
+    elif familiar.isdigit():
+        rostros = rostros.filter(familiar_id=int(familiar))
+        elegido = _nombres([int(familiar)]).get(int(familiar))
+        familiar_texto = f"{elegido} #{familiar}" if elegido else ''
+    foto = request.GET.get('foto', '')
+    if foto:
+        rostros = rostros.filter(drive_file_id=foto)
+
+    cursor = leer_cursor(request.GET.get('despues', ''))
+    if cursor:
+        fecha, ultimo_id = cursor
+        rostros = rostros.filter(Q(fecha_creacion__lt=fecha) | Q(fecha_creacion=fecha, id__lt=ultimo_id))
+
+    pagina = list(rostros.order_by('-fecha_creacion', '-id')[:por_pagina + 1])
+    siguiente = None
+    if len(pagina) > por_pagina:
+        pagina = pagina[:por_pagina]
+        parametros = request.GET.copy()
+        parametros['despues'] = escribir_cursor(pagina[-1])
+        siguiente = f"?{parametros.urlencode()}"
+
     return render(request, 'gestion_recuerdos/galeria.html', {
-        'rostros': rostros,
+        'rostros': pagina,
+        'familiar_elegido': familiar,
+        'familiar_texto': familiar_texto,
+        'script_buscar_familiar': SCRIPT_BUSCAR_FAMILIAR.replace('__URL__', reverse('api_buscar_familiares')),
+        'foto_elegida': foto,
+        'siguiente': siguiente,
         'MEDIA_URL': settings.MEDIA_URL  # <--- Esto es la clave
     })
+
+def escribir_cursor(rostro):
+    return f"{rostro.fecha_creacion.isoformat()}_{rostro.id}"
+
+def leer_cursor(texto):
+    """'<fecha iso>_<id>' -> (datetime, id), o None si viene vacío o mal formado."""
+    fecha, _, ultimo_id = texto.rpartition('_')
+    fecha = parse_datetime(fecha) if fecha else None
+    if fecha is None or not ultimo_id.isdigit():
+        return None
+    return fecha, int(ultimo_id)
 #------------------------------------------------------------------------------------------
 
 def eliminar_rostro(request, rostro_id):
     """
     Línea por línea:
     1. Busca el registro del rostro en la BD usando su ID.
-    2. Obtiene la ruta física de la imagen en tu carpeta media.
-    3. Si el archivo existe en la carpeta, lo borra del disco duro.
-    4. Borra el registro de la base de datos.
-    5. Te redirige de vuelta a la galería.
+    2. Borra el registro de la base de datos.
+    3. Borra del almacenamiento el recorte y la miniatura, sólo si ningún otro rostro los usa
+       (los archivos se nombran por contenido y pueden estar compartidos).
+    4. Te redirige de vuelta a la galería.
     """
-    import os
     rostro = RostroDetectado.objects.get(id=rostro_id)
-    ruta_imagen = os.path.join(settings.MEDIA_ROOT, rostro.foto_recorte.name)
-
-    # Borrar archivo físico
-    if os.path.exists(ruta_imagen):
-        os.remove(ruta_imagen)
-
-    # Borrar registro en BD
+    archivos = [rostro.foto_recorte.name, rostro.miniatura.name]
     rostro.delete()
+    liberar_archivos(archivos)
     
     return redirect('galeria')
 #------------------------------------------------------------------------------------
 
+def progreso_trabajo(request, trabajo_id):
+    """
+    Devuelve en JSON el avance de un análisis por lotes (comando analizar_lote).
+    Sirve para consultar el progreso desde el navegador mientras el trabajo corre.
+    """
+    trabajo = get_object_or_404(TrabajoLote, id=trabajo_id)
+    return JsonResponse({
+        'id': trabajo.id,
+        'estado': trabajo.estado,
+        'total': trabajo.total,
+        'procesadas': trabajo.procesadas,
+        'fallidas': trabajo.fallidas,
+        'rostros': trabajo.rostros,
+        'porcentaje': round(100 * trabajo.procesadas / trabajo.total, 1) if trabajo.total else 0,
+        'mensaje': trabajo.mensaje,
+    })
+
+def ver_trabajo(request, trabajo_id):
+    """Página de progreso de un trabajo en segundo plano; se recarga cada 2 segundos mientras corre."""
+    trabajo = get_object_or_404(TrabajoLote, id=trabajo_id)
+    en_curso = trabajo.estado in ('PENDIENTE', 'EN_CURSO')
+
+    html = "<meta http-equiv='refresh' content='2'>" if en_curso else ""
+    html += f"<h2>{trabajo.get_tipo_display()} (trabajo {trabajo.id})</h2>"
+    html += f"<p>Estado: <b>{trabajo.get_estado_display()}</b> — {trabajo.procesadas}/{trabajo.total} fotos"
+    html += f", {trabajo.fallidas} con error</p>"
+    if trabajo.mensaje:
+        html += f"<p>{escape(trabajo.mensaje)}</p>"
+    if trabajo.tipo == 'ORGANIZAR' and reorganizar.esta_colgado(trabajo):
+        html += (f"<p>Hace rato que no avanza (¿se reinició el servidor?). "
+                 f"<a href='{reverse('organizar_drive')}'>Retomarlo</a></p>")
+    if not en_curso:
+        errores = trabajo.fotos.filter(estado='ERROR').values_list('nombre', 'error')[:50]
+        if errores:
+            html += "<ul>" + "".join(f"<li>{escape(nombre)}: {escape(error)}</li>" for nombre, error in errores) + "</ul>"
+        html += f"<a href='{reverse('ver_fotos')}'>Ver fotos</a>"
+    return HttpResponse(html)
+
+def estadisticas_cache(request):
+    """
+    Aciertos/fallos y ocupación de la caché de descargas de este proceso.
+    Mismo acceso que /metricas/ (ver metricas.puede_ver_metricas).
+    """
+    if not puede_ver_metricas(request):
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    return JsonResponse(cache_descargas.obtener_cache().estadisticas())
+
+def metricas_prometheus(request):
+    """
+    Tiempos por vista y por etapa, consultas, bytes bajados y rostros detectados (formato de Prometheus).
+    Sólo para staff, METRICAS_TOKEN o METRICAS_IPS (ver metricas.puede_ver_metricas).
+    """
+    if not puede_ver_metricas(request):
+        return HttpResponse("No autorizado", status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(metricas.texto(), content_type='text/plain; version=0.0.4; charset=utf-8')
+#------------------------------------------------------------------------------------
+
+FAMILIARES_POR_PAGINA = 100
+MAX_GENERACIONES = 20
+
+def _entero(request, nombre, defecto, minimo, maximo):
+    """Parámetro entero de la URL acotado a [minimo, maximo]; si falta o no es un número, el valor por defecto."""
+    try:
+        return min(max(int(request.GET.get(nombre, defecto)), minimo), maximo)
+    except ValueError:
+        return defecto
+
+def _nombres(ids):
+    """{id: 'Nombre Apellido'} de muchos familiares con una sola consulta."""
+    return {f.id: str(f).strip() for f in Familiar.objects.filter(id__in=ids).only('nombre', 'apellido')}
+
+def _lista_por_generacion(personas, nombres, etiqueta):
+    """HTML con una línea por generación: 'Generación 1: Ana, Luis'."""
+    por_generacion = {}
+    for persona, generacion in personas.items():
+        por_generacion.setdefault(generacion, []).append(persona)
+    html = "<ul>"
+    for generacion in sorted(por_generacion):
+        enlaces = ", ".join(
+            f"<a href='{reverse('ver_arbol', args=[p])}'>{escape(nombres.get(p, p))}</a>"
+            for p in sorted(por_generacion[generacion], key=lambda p: nombres.get(p, ''))
+        )
+        html += f"<li><b>{etiqueta} {generacion}:</b> {enlaces}</li>"
+    return html + "</ul>"
+
+def lista_arbol(request):
+    """
+    Índice del árbol: los familiares por orden alfabético, de a FAMILIARES_POR_PAGINA (?pagina=),
+    y un buscador para ir directo al árbol de alguien (?ir=<id>).
+    """
+    ir = request.GET.get('ir', '')
+    if ir.isdigit():
+        return redirect('ver_arbol', familiar_id=int(ir))
+    pagina = _entero(request, 'pagina', 1, 1, 10**6)
+    familiares = list(
+        Familiar.objects.order_by('nombre', 'apellido', 'id').only('nombre', 'apellido')
+        [(pagina - 1) * FAMILIARES_POR_PAGINA:pagina * FAMILIARES_POR_PAGINA + 1]
+    )
+    hay_mas = len(familiares) > FAMILIARES_POR_PAGINA
+
+    html = "<h1>🌳 Árbol Familiar</h1>"
+    html += (
+        "<form method='get'><input type='hidden' name='ir'>"
+        "<input type='text' class='buscar-familiar' list='familiares_ir' data-destino='ir' "
+        "placeholder='Buscar a alguien...' autocomplete='off'><datalist id='familiares_ir'></datalist> "
+        "<button type='submit'>Ver su árbol</button></form><ul>"
+    )
+    for familiar in familiares[:FAMILIARES_POR_PAGINA]:
+        html += f"<li><a href='{reverse('ver_arbol', args=[familiar.id])}'>{escape(str(familiar))}</a></li>"
+    html += "</ul><p>"
+    if pagina > 1:
+        html += f"<a href='?pagina={pagina - 1}'>⬅️ Anteriores</a> "
+    if hay_mas:
+        html += f"<a href='?pagina={pagina + 1}'>Siguientes ➡️</a>"
+    html += "</p>"
+    html += f"<p><a href='{reverse('lista_duplicados')}'>👥 Revisar posibles familiares repetidos</a></p>"
+    html += f"<p>⬇️ Descargar GEDCOM: <a href='{reverse('descargar_gedcom')}?version=7'>versión 7</a> · <a href='{reverse('descargar_gedcom')}?version=5.5.1'>versión 5.5.1</a></p>"
+    html += f"<a href='{reverse('home')}' style='margin:20px; display:inline-block;'>⬅️ Volver al Menú</a>"
+    html += SCRIPT_BUSCAR_FAMILIAR.replace('__URL__', reverse('api_buscar_familiares'))
+    return HttpResponse(html)
+
+def ver_arbol(request, familiar_id):
+    """
+    Línea por línea:
+    1. Toma el árbol en memoria (se arma una vez por proceso con una sola consulta).
+    2. Busca ancestros y descendientes hasta ?generaciones=N (4 por defecto, hasta MAX_GENERACIONES) y las parejas.
+    3. Trae los nombres de todos ellos con UNA consulta.
+    4. Con ?con=<id> muestra además el parentesco con esa persona y el camino que los une
+       (se elige con el autocompletado, no con una lista de todos los familiares).
+    """
+    familiar = get_object_or_404(Familiar, id=familiar_id)
+    arbol = obtener_arbol()
+    generaciones = _entero(request, 'generaciones', 4, 1, MAX_GENERACIONES)
+    ancestros = arbol.ancestros(familiar.id, generaciones)
+    descendientes = arbol.descendientes(familiar.id, generaciones)
+    parejas = arbol.parejas.get(familiar.id, set())
+
+    con = request.GET.get('con', '')
+    camino, comunes = None, []
+    if con.isdigit():
+        camino = arbol.camino(familiar.id, int(con))
+        comunes = arbol.ancestros_comunes(familiar.id, int(con))
+
+    ids = set(ancestros) | set(descendientes) | set(parejas) | {p for p, _ in camino or []} | {c for c, _, _ in comunes}
+    if con.isdigit():
+        ids.add(int(con))
+    nombres = _nombres(ids)
+
+    html = f"<h1>🌳 {escape(str(familiar))}</h1>"
+    if parejas:
+        html += "<p><b>Pareja:</b> " + ", ".join(
+            f"<a href='{reverse('ver_arbol', args=[p])}'>{escape(nombres.get(p, p))}</a>" for p in parejas
+        ) + "</p>"
+    html += "<h2>Ancestros</h2>" + (_lista_por_generacion(ancestros, nombres, "Generación") if ancestros else "<p>Sin datos.</p>")
+    html += "<h2>Descendientes</h2>" + (_lista_por_generacion(descendientes, nombres, "Generación") if descendientes else "<p>Sin datos.</p>")
+
+    elegido = f"{nombres[int(con)]} #{con}" if con.isdigit() and int(con) in nombres else ''
+    html += (
+        f"<h2>Parentesco con...</h2><form method='get'><input type='hidden' name='con' value='{escape(con)}'>"
+        f"<input type='text' class='buscar-familiar' list='familiares_con' data-destino='con' value='{escape(elegido)}' "
+        f"placeholder='Escribí un nombre...' autocomplete='off'><datalist id='familiares_con'></datalist>"
+        f"<input type='hidden' name='generaciones' value='{generaciones}'> <button type='submit'>Calcular</button></form>"
+    )
+    if con.isdigit() and int(con) == familiar.id:
+        html += "<p>Es la misma persona.</p>"
+    elif con.isdigit():
+        if comunes:
+            ancestro, sube, baja = comunes[0]
+            html += f"<p>Es su <b>{nombre_parentesco(sube, baja)}</b> (ancestro común: {escape(nombres.get(ancestro, ancestro))}).</p>"
+        if camino:
+            pasos = {'padre': 'su padre/madre', 'hijo': 'su hijo/a', 'pareja': 'su pareja'}
+            html += "<p>" + " → ".join(
+                f"{pasos[paso] + ' ' if paso else ''}{escape(nombres.get(persona, str(familiar) if persona == familiar.id else persona))}"
+                for persona, paso in camino
+            ) + "</p>"
+        else:
+            html += "<p>No hay ninguna relación registrada que los una.</p>"
+
+    html += f"<a href='{reverse('rostros_por_decada', args=[familiar.id])}' style='margin:20px; display:inline-block;'>🕰️ Sus caras por década</a>"
+    html += f"<a href='{reverse('lista_arbol')}' style='margin:20px; display:inline-block;'>⬅️ Volver al árbol</a>"
+    html += SCRIPT_BUSCAR_FAMILIAR.replace('__URL__', reverse('api_buscar_familiares'))
+    return HttpResponse(html)
+
+def datos_arbol(request, familiar_id):
+    """El mismo árbol en JSON (nodos y aristas) para dibujarlo desde el navegador."""
+    familiar = get_object_or_404(Familiar, id=familiar_id)
+    arbol = obtener_arbol()
+    generaciones = _entero(request, 'generaciones', 4, 1, MAX_GENERACIONES)
+    ancestros = arbol.ancestros(familiar.id, generaciones)
+    descendientes = arbol.descendientes(familiar.id, generaciones)
+    ids = {familiar.id} | set(ancestros) | set(descendientes) | arbol.parejas.get(familiar.id, set())
+    nombres = _nombres(ids)
+
+    nodos = [
+        {'id': p, 'nombre': nombres.get(p, ''), 'generacion': ancestros.get(p) or -descendientes.get(p, 0)}
+        for p in sorted(ids)
+    ]
+    aristas = [
+        {'origen': padre, 'destino': hijo, 'tipo': 'PROGENITOR'}
+        for hijo in ids for padre in arbol.padres.get(hijo, ()) if padre in ids
+    ] + [
+        {'origen': p, 'destino': q, 'tipo': 'PAREJA'}
+        for p in ids for q in arbol.parejas.get(p, ()) if q in ids and p < q
+    ]
+    return JsonResponse({'familiar': familiar.id, 'nodos': nodos, 'aristas': aristas})
+
+def descargar_gedcom(request):
+    """
+    Descarga todo el árbol como GEDCOM (?version=7 o 5.5.1).
+    StreamingHttpResponse: el archivo se va mandando por bloques mientras se lee la BD,
+    así un árbol enorme no se arma entero en memoria.
+    """
+    version = request.GET.get('version', '7')
+    if version not in ('7', '5.5.1'):
+        return HttpResponse("Versión GEDCOM no soportada (opciones: 7, 5.5.1)", status=400)
+    respuesta = StreamingHttpResponse(exportar_gedcom(version), content_type='text/vnd.familysearch.gedcom; charset=utf-8')
+    respuesta['Content-Disposition'] = 'attachment; filename="arbol_familiar.ged"'
+    return respuesta
+
+def lista_duplicados(request):
+    """
+    Línea por línea:
+    1. Trae los pares pendientes de más a menos parecidos (los arma el comando buscar_familiares_duplicados).
+    2. Cuenta los rostros de cada familiar con UNA consulta, para decidir a quién conservar.
+    3. Cada par tiene tres botones: conservar uno, conservar el otro, o "no son la misma persona".
+    """
+    pares = list(
+        PosibleDuplicado.objects.filter(estado='PENDIENTE').select_related('familiar_a', 'familiar_b').order_by('-puntaje')[:100]
+    )
+    ids = {p.familiar_a_id for p in pares} | {p.familiar_b_id for p in pares}
+    rostros = dict(
+        RostroDetectado.objects.filter(familiar_id__in=ids).values('familiar_id')
+        .annotate(total=Count('id')).values_list('familiar_id', 'total')
+    )
+    token = get_token(request)
+
+    def ficha(familiar):
+        fecha = familiar.fecha_nacimiento.isoformat() if familiar.fecha_nacimiento else "sin fecha"
+        return f"<a href='{reverse('ver_arbol', args=[familiar.id])}'>{escape(str(familiar))}</a> ({fecha}, {rostros.get(familiar.id, 0)} rostros)"
+
+    html = "<h1>👥 Posibles familiares repetidos</h1>"
+    if not pares:
+        html += "<p>No hay pares pendientes. Corré <code>python manage.py buscar_familiares_duplicados</code> para buscar.</p>"
+    for par in pares:
+        detalle = ", ".join(f"{parte} {valor:.0%}" for parte, valor in par.detalle.items())
+        accion = reverse('resolver_duplicado', args=[par.id])
+        html += "<div style='border:1px solid #ccc; margin:10px; padding:10px;'>"
+        html += f"<p><b>{par.puntaje:.0%}</b> ({detalle})<br>{ficha(par.familiar_a)}<br>{ficha(par.familiar_b)}</p>"
+        html += f"<form method='POST' action='{accion}'><input type='hidden' name='csrfmiddlewaretoken' value='{token}'>"
+        html += f"<button name='conservar' value='{par.familiar_a_id}'>Fusionar (conservar el 1°)</button> "
+        html += f"<button name='conservar' value='{par.familiar_b_id}'>Fusionar (conservar el 2°)</button> "
+        html += "<button name='descartar' value='1'>No son la misma persona</button></form></div>"
+    html += f"<a href='{reverse('lista_arbol')}' style='margin:20px; display:inline-block;'>⬅️ Volver al árbol</a>"
+    html += SCRIPT_BUSCAR_FAMILIAR.replace('__URL__', reverse('api_buscar_familiares'))
+    return HttpResponse(html)
+
+def resolver_duplicado(request, duplicado_id):
+    """POST desde lista_duplicados: fusiona los dos familiares (conservar=<id>) o descarta el par."""
+    if request.method != 'POST':
+        return redirect('lista_duplicados')
+    par = get_object_or_404(PosibleDuplicado, id=duplicado_id, estado='PENDIENTE')
+    if request.POST.get('descartar'):
+        par.estado = 'DESCARTADO'
+        par.save(update_fields=['estado'])
+        return redirect('lista_duplicados')
+
+    conservar = request.POST.get('conservar', '')
+    if conservar not in (str(par.familiar_a_id), str(par.familiar_b_id)):
+        return HttpResponse("Falta elegir a quién conservar", status=400)
+    eliminar = par.familiar_b_id if conservar == str(par.familiar_a_id) else par.familiar_a_id
+    try:
+        duplicados_familiares.fusionar_familiares(int(conservar), eliminar)
+    except ValueError as e:
+        return HttpResponse(f"<h1>No se pudo fusionar</h1><p>{escape(str(e))}</p><a href='{reverse('lista_duplicados')}'>Volver</a>", status=409)
+    return redirect('lista_duplicados')
+#------------------------------------------------------------------------------------
+
+def buscar(request):
+    """
+    Búsqueda de familiares por nombre, apellido o cualquier palabra de la biografía (?q=).
+    Ignora tildes y mayúsculas, y cada palabra vale como comienzo ("gonz" encuentra "González").
+    """
+    texto = request.GET.get('q', '')
+    html = "<h1>🔎 Buscar familiares</h1>"
+    html += f"<form method='get'><input type='search' name='q' value='{escape(texto)}' autofocus> <button type='submit'>Buscar</button></form>"
+    if texto.strip():
+        resultados = buscar_familiares(texto)
+        html += f"<p>{len(resultados)} resultados.</p><ul>"
+        for familiar_id, nombre, fragmento in resultados:
+            html += f"<li><a href='{reverse('ver_arbol', args=[familiar_id])}'>{escape(nombre)}</a>"
+            html += f" · <a href='{reverse('galeria')}?familiar={familiar_id}'>fotos</a>"
+            if fragmento:
+                html += f"<br><small>{fragmento_html(fragmento)}</small>"
+            html += "</li>"
+        html += "</ul>"
+    html += f"<a href='{reverse('home')}' style='margin:20px; display:inline-block;'>⬅️ Volver al Menú</a>"
+    return HttpResponse(html)
+
+def api_buscar_familiares(request):
+    """Autocompletado: ?q=texto&limite=10 -> {"resultados": [{"id": 3, "nombre": "José González"}, ...]}."""
+    try:
+        limite = min(max(int(request.GET.get('limite', 10)), 1), 50)
+    except ValueError:
+        limite = 10
+    resultados = sugerir_nombres(request.GET.get('q', ''), limite)
+    return JsonResponse({'resultados': [{'id': familiar_id, 'nombre': nombre} for familiar_id, nombre in resultados]})
+#------------------------------------------------------------------------------------
+
+GRUPOS_POR_PAGINA = 20
+CARAS_POR_GRUPO = 12
+
+def grupos_rostros(request):
+    """
+    Línea por línea:
+    1. Trae los grupos de caras sin identificar de 2 o más caras, de más grande a más chico (?pagina=).
+    2. Trae las primeras CARAS_POR_GRUPO caras de TODOS esos grupos con UNA consulta (ROW_NUMBER por grupo).
+    3. Cada grupo tiene su formulario: quién es (autocompletado, con la sugerencia del índice ya puesta),
+       casillas para sacar las caras que no son, y un botón que asigna el grupo entero.
+    """
+    pagina = _entero(request, 'pagina', 1, 1, 10**6)
+    grupos = list(
+        GrupoRostros.objects.filter(tamano__gte=2).select_related('sugerido')
+        .order_by('-tamano', 'id')[(pagina - 1) * GRUPOS_POR_PAGINA:pagina * GRUPOS_POR_PAGINA + 1]
+    )
+    hay_mas = len(grupos) > GRUPOS_POR_PAGINA
+    grupos = grupos[:GRUPOS_POR_PAGINA]
+    caras = {}
+    primeras = (
+        RostroDetectado.objects.filter(grupo__in=grupos, familiar__isnull=True)
+        .annotate(orden=Window(RowNumber(), partition_by=F('grupo_id'), order_by=F('id').asc()))
+        .filter(orden__lte=CARAS_POR_GRUPO).only('id', 'grupo_id', 'foto_recorte', 'miniatura')
+    )
+    for rostro in primeras:
+        caras.setdefault(rostro.grupo_id, []).append(rostro)
+    token = get_token(request)
+
+    html = "<h1>🧩 Caras parecidas sin identificar</h1>"
+    html += "<p>Cada grupo son caras que probablemente son de la misma persona. Destildá las que no son y elegí quién es.</p>"
+    if not grupos:
+        html += "<p>No hay grupos. Corré <code>python manage.py agrupar_rostros</code> después de analizar fotos.</p>"
+    for grupo in grupos:
+        sugerido = grupo.sugerido
+        html += "<div style='border:1px solid #ccc; margin:10px; padding:10px;'>"
+        html += f"<form method='POST' action='{reverse('asignar_grupo_rostros', args=[grupo.id])}'>"
+        html += f"<input type='hidden' name='csrfmiddlewaretoken' value='{token}'>"
+        html += f"<p><b>{grupo.tamano} caras</b></p><div style='display:flex; flex-wrap:wrap; gap:8px;'>"
+        for rostro in caras.get(grupo.id, []):
+            imagen = rostro.miniatura.url if rostro.miniatura else rostro.foto_recorte.url
+            html += (
+                f"<label style='text-align:center;'><img src='{imagen}' width='80' height='80' loading='lazy' "
+                f"style='object-fit:cover; border-radius:5px;'><br>"
+                f"<input type='checkbox' name='incluir' value='{rostro.id}' checked></label>"
+            )
+        html += f"<input type='hidden' name='mostradas' value='{','.join(str(r.id) for r in caras.get(grupo.id, []))}'>"
+        html += "</div><p>¿Quién es? "
+        html += f"<input type='hidden' name='familiar' value='{sugerido.id if sugerido else ''}'>"
+        html += (
+            f"<input type='text' class='buscar-familiar' list='familiares_grupo_{grupo.id}' data-destino='familiar' "
+            f"value='{f'{escape(str(sugerido).strip())} #{sugerido.id}' if sugerido else ''}' "
+            f"placeholder='Escribí un nombre...' autocomplete='off'>"
+            f"<datalist id='familiares_grupo_{grupo.id}'></datalist> "
+        )
+        html += f"<button type='submit'>Asignar las {grupo.tamano} caras</button></p></form></div>"
+    if hay_mas:
+        html += f"<a href='?pagina={pagina + 1}' style='margin:20px; display:inline-block;'>Más grupos ➡️</a>"
+    html += f"<a href='{reverse('home')}' style='margin:20px; display:inline-block;'>⬅️ Volver al Menú</a>"
+    html += SCRIPT_BUSCAR_FAMILIAR.replace('__URL__', reverse('api_buscar_familiares'))
+    return HttpResponse(html)
+
+def asignar_grupo_rostros(request, grupo_id):
+    """POST desde grupos_rostros: todas las caras del grupo (menos las destildadas) pasan al familiar elegido."""
+    if request.method != 'POST':
+        return redirect('grupos_rostros')
+    grupo = get_object_or_404(GrupoRostros, id=grupo_id)
+    familiar_id = request.POST.get('familiar', '')
+    familiar = Familiar.objects.filter(id=familiar_id).first() if familiar_id.isdigit() else None
+    if familiar is None:
+        return HttpResponse(f"<h1>Falta elegir quién es</h1><a href='{reverse('grupos_rostros')}'>Volver</a>", status=400)
+    mostradas = {int(i) for i in request.POST.get('mostradas', '').split(',') if i.isdigit()}
+    incluidas = {int(i) for i in request.POST.getlist('incluir') if i.isdigit()}
+    agrupamiento.asignar_grupo(grupo, familiar, excluir=mostradas - incluidas)
+    return redirect('grupos_rostros')
+#------------------------------------------------------------------------------------
+FOTOS_POR_LISTA = 500
+
+def linea_de_tiempo(request):
+    """
+    Línea por línea:
+    1. Sin filtros: cuántas fotos hay de cada año (agrupadas por década) y los eventos con más fotos.
+       Son consultas agrupadas sobre los índices de MetadatosFoto: no se baja ninguna foto.
+    2. Con ?anio=, ?evento= o ?zona=: esas fotos en orden cronológico, con su nombre
+       (UNA consulta más a DriveArchivo) y enlaces para analizarlas o ver sus caras.
+    Los metadatos llegan al sincronizar Drive y con el comando extraer_metadatos.
+    """
+    anio = request.GET.get('anio', '')
+    evento = request.GET.get('evento')
+    zona = request.GET.get('zona')
+    html = "<h1>🕰️ Línea de tiempo</h1>"
+
+    if anio.isdigit() or evento is not None or zona is not None:
+        fotos = metadatos.fotos_de(
+            anio=int(anio) if anio.isdigit() else None, evento=evento, zona=zona, limite=FOTOS_POR_LISTA,
+        )
+        nombres = dict(
+            DriveArchivo.objects.filter(drive_id__in=[f.drive_file_id for f in fotos]).values_list('drive_id', 'nombre')
+        )
+        titulo = anio if anio.isdigit() else f"Evento: {evento}" if evento is not None else f"Lugar: {zona}"
+        html += f"<h2>{escape(titulo)} ({len(fotos)}{'+' if len(fotos) == FOTOS_POR_LISTA else ''} fotos)</h2><ul>"
+        for foto in fotos:
+            cuando = foto.fecha_captura.strftime('%d/%m/%Y %H:%M') if foto.fecha_captura else 'sin fecha'
+            html += f"<li>{cuando} — <a href='{reverse('analizar_en_vivo', args=[foto.drive_file_id])}'>"
+            html += f"{escape(nombres.get(foto.drive_file_id, foto.drive_file_id))}</a>"
+            if foto.evento:
+                html += f" · 📁 <a href='?{urlencode({'evento': foto.evento})}'>{escape(foto.evento)}</a>"
+            if foto.zona:
+                mapa = f"https://www.openstreetmap.org/?mlat={foto.latitud:.5f}&mlon={foto.longitud:.5f}#map=15/{foto.latitud:.5f}/{foto.longitud:.5f}"
+                html += f" · 📍 <a href='?{urlencode({'zona': foto.zona})}'>{foto.zona}</a> (<a href='{mapa}' target='_blank'>mapa</a>)"
+            if foto.camara:
+                html += f" <small style='color:#666;'>{escape(foto.camara)}</small>"
+            html += f" <a href='{reverse('galeria')}?foto={foto.drive_file_id}'>🖼️ caras</a></li>"
+        html += f"</ul><a href='{reverse('linea_de_tiempo')}' style='margin:20px; display:inline-block;'>⬅️ Todos los años</a>"
+    else:
+        anios = metadatos.anios_con_fotos()
+        sin_fecha = MetadatosFoto.objects.filter(anio__isnull=True).count()
+        if not anios:
+            html += "<p>Todavía no hay fotos fechadas. Sincronizá Drive o corré <code>python manage.py extraer_metadatos</code>.</p>"
+        por_decada = {}
+        for fila in anios:
+            por_decada.setdefault(fila['anio'] // 10 * 10, []).append(fila)
+        for decada, filas in por_decada.items():
+            html += f"<h3>Década de {decada}</h3><p>" + " ".join(
+                f"<a href='?anio={fila['anio']}'>{fila['anio']}</a> ({fila['fotos']})" for fila in filas
+            ) + "</p>"
+        if sin_fecha:
+            html += f"<p style='color:#666;'>{sin_fecha} fotos sin fecha de captura.</p>"
+        eventos = (
+            MetadatosFoto.objects.exclude(evento='').values('evento')
+            .annotate(fotos=Count('id')).order_by('-fotos', 'evento')[:50]
+        )
+        if eventos:
+            html += "<h2>Eventos</h2><ul>" + "".join(
+                f"<li><a href='?{urlencode({'evento': e['evento']})}'>{escape(e['evento'])}</a> ({e['fotos']})</li>"
+                for e in eventos
+            ) + "</ul>"
+    html += f"<a href='{reverse('home')}' style='margin:20px; display:inline-block;'>⬅️ Volver al Menú</a>"
+    return HttpResponse(html)
+
+def rostros_por_decada(request, familiar_id):
+    """
+    Las caras de un familiar ordenadas por la década en que se sacó cada foto.
+    Una sola consulta: cada cara toma el año de su foto de MetadatosFoto por el índice de drive_file_id.
+    """
+    familiar = get_object_or_404(Familiar, id=familiar_id)
+    decadas = metadatos.rostros_por_decada(familiar.id)
+    html = f"<h1>🕰️ {escape(str(familiar))} a lo largo de los años</h1>"
+    if not decadas:
+        html += "<p>Todavía no tiene caras asignadas.</p>"
+    for decada in sorted(decadas, key=lambda d: (d is None, d or 0)):
+        rostros = decadas[decada]
+        html += f"<h2>{f'Década de {decada}' if decada is not None else 'Sin fecha'} ({len(rostros)})</h2>"
+        html += "<div style='display:flex; flex-wrap:wrap; gap:8px;'>"
+        for rostro in rostros:
+            imagen = rostro.miniatura.url if rostro.miniatura else rostro.foto_recorte.url
+            html += (
+                f"<a href='{reverse('galeria')}?foto={rostro.drive_file_id}' title='{rostro.anio or ''}'>"
+                f"<img src='{imagen}' width='80' height='80' loading='lazy' style='object-fit:cover; border-radius:5px;'></a>"
+            )
+        html += "</div>"
+    html += f"<a href='{reverse('ver_arbol', args=[familiar.id])}' style='margin:20px; display:inline-block;'>⬅️ Volver a su árbol</a>"
+    return HttpResponse(html)
+#------------------------------------------------------------------------------------
+
 def home(request):
     """
     Renderiza el menú principal usando el template home.html.